@@ -0,0 +1,68 @@
+"""Compare two benchmark result files and flag regressions.
+
+Usage:
+    python benchmarks/compare_results.py baseline.json current.json --threshold 1.2
+
+Exits with status 1 when any benchmark's median got slower than the
+threshold ratio, so it can gate a deploy.
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Return one row per benchmark with the median ratio and its verdict"""
+    rows = []
+    comparable = baseline['config']['params'] == current['config']['params']
+    for name in sorted(set(baseline['results']) | set(current['results'])):
+        before = baseline['results'].get(name, {})
+        after = current['results'].get(name, {})
+        row = {'name': name, 'baseline_ms': before.get('median_ms'), 'current_ms': after.get('median_ms')}
+        if before.get('status') != 'ok' or after.get('status') != 'ok':
+            row['verdict'] = 'missing'
+        elif not comparable:
+            row['verdict'] = 'incomparable'
+        else:
+            row['ratio'] = after['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+            if row['ratio'] > threshold:
+                row['verdict'] = 'regression'
+            elif row['ratio'] < 1 / threshold:
+                row['verdict'] = 'improvement'
+            else:
+                row['verdict'] = 'unchanged'
+        rows.append(row)
+    return rows
+
+
+def format_ms(value) -> str:
+    return f"{value:.2f}" if value is not None else '-'
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('baseline', help='Results of the reference run')
+    parser.add_argument('current', help='Results of the run to check')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='Median slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline)
+    current = load_results(args.current)
+    if baseline['config']['params'] != current['config']['params']:
+        print("Warning: the runs used different fixture parameters; timings are not compared")
+
+    rows = compare(baseline, current, args.threshold)
+    print(f"{'benchmark':<45} {'baseline ms':>12} {'current ms':>12} {'ratio':>8}  verdict")
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}" if 'ratio' in row else '-'
+        print(f"{row['name']:<45} {format_ms(row['baseline_ms']):>12} {format_ms(row['current_ms']):>12} "
+              f"{ratio:>8}  {row['verdict']}")
+
+    sys.exit(1 if any(row['verdict'] == 'regression' for row in rows) else 0)
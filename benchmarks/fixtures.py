@@ -0,0 +1,140 @@
+"""Synthetic fixtures for the benchmark suite.
+
+Every generator is seeded, so the same size settings always produce the same
+inputs and results stay comparable across runs.
+"""
+import json
+import random
+import shutil
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import h3
+import numpy as np
+import rasterio
+from affine import Affine
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Fixtures are centred on the Sahel, inside the app's default Sahara view
+CENTER_LAT = 14.5
+CENTER_LNG = 2.0
+RASTER_BOUNDS = (-5.0, 10.0, 10.0, 20.0)  # (west, south, east, north)
+NODATA = -9999.0
+
+WORDS = [
+    'land', 'degradation', 'soil', 'carbon', 'forest', 'loss', 'conflict', 'events',
+    'drought', 'rainfall', 'vegetation', 'cover', 'population', 'density', 'water',
+    'management', 'restoration', 'desert', 'sahel', 'productivity', 'index', 'annual',
+    'trend', 'satellite', 'resolution', 'biodiversity', 'policy', 'impact', 'region'
+]
+
+
+def h3_cells(count: int, resolution: int = 7, lat: float = CENTER_LAT, lng: float = CENTER_LNG) -> List[str]:
+    """Return count H3 cells in rings around a centre cell"""
+    center = h3.latlng_to_cell(lat, lng, resolution)
+    cells = [center]
+    k = 0
+    while len(cells) < count:
+        k += 1
+        cells.extend(h3.grid_ring(center, k))
+    return cells[:count]
+
+
+def cell_feature(h3_index: str, properties: Dict[str, Any], geometry: str = 'Polygon') -> Dict[str, Any]:
+    if geometry == 'Point':
+        lat, lng = h3.cell_to_latlng(h3_index)
+        return {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [lng, lat]},
+            'properties': properties
+        }
+    boundary = h3.cell_to_boundary(h3_index)
+    coordinates = [[[vertex[1], vertex[0]] for vertex in boundary]]
+    coordinates[0].append(coordinates[0][0])
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Polygon', 'coordinates': coordinates},
+        'properties': properties
+    }
+
+
+def write_raster(path: Path, width: int, height: int, seed: int = 0, nodata_fraction: float = 0.1) -> Path:
+    """Write a single band float32 GeoTIFF in EPSG:4326 with some nodata pixels"""
+    rng = np.random.default_rng(seed)
+    data = rng.random((height, width), dtype=np.float32)
+    data[rng.random((height, width)) < nodata_fraction] = NODATA
+    west, south, east, north = RASTER_BOUNDS
+    transform = Affine((east - west) / width, 0.0, west, 0.0, -(north - south) / height, north)
+    with rasterio.open(
+        path, 'w', driver='GTiff', width=width, height=height, count=1, dtype='float32',
+        crs='EPSG:4326', transform=transform, nodata=NODATA
+    ) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def write_sdg_sample(path: Path, cell_count: int, year_count: int, seed: int = 0) -> Path:
+    """Write a GeoJSON shaped like data/sdg_panama_sample.geojson"""
+    rng = random.Random(seed)
+    features = []
+    for h3_index in h3_cells(cell_count, resolution=6):
+        for year in range(2015 - year_count + 1, 2016):
+            features.append(cell_feature(h3_index, {
+                'h3_index': h3_index,
+                'year': year,
+                'timestamp': datetime(year, 1, 1).isoformat(),
+                'metrics': {
+                    'land_degradation': rng.random(),
+                    'soil_organic_carbon': rng.uniform(20, 120),
+                    'vegetation_cover': rng.uniform(0, 100),
+                    'biodiversity_index': rng.uniform(0, 10),
+                    'trend': rng.choice(['Improving', 'Stable', 'Degrading'])
+                }
+            }))
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'features': features}, f)
+    return path
+
+
+def write_point_dataset(path: Path, cell_count: int, metric: str, seed: int = 0) -> Path:
+    """Write a GeoJSON shaped like the data/out*.geojson raster outputs"""
+    rng = random.Random(seed)
+    features = [
+        cell_feature(h3_index, {
+            'h3_index': h3_index,
+            'year': 2015,
+            'timestamp': '2015-01-01T00:00:00',
+            metric: rng.randint(0, 5)
+        }, geometry='Point')
+        for h3_index in h3_cells(cell_count, resolution=5)
+    ]
+    with open(path, 'w') as f:
+        json.dump({'type': 'FeatureCollection', 'name': path.stem, 'features': features}, f)
+    return path
+
+
+def make_documents(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Return knowledge-base style text chunks for the vector store"""
+    rng = random.Random(seed)
+    return [
+        {
+            'content': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 60))),
+            'metadata': {'source': f"doc-{i}", 'dataset_id': f"dataset-{i % 10}"}
+        }
+        for i in range(count)
+    ]
+
+
+def build_workdir(root: Path, params: Dict[str, Any], seed: int = 0) -> Path:
+    """Create a working directory with a synthetic data/ folder the app can serve"""
+    data_dir = root / 'data'
+    data_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copy(REPO_ROOT / 'data' / 'knowledge_base.json', data_dir / 'knowledge_base.json')
+    write_sdg_sample(data_dir / 'sdg_panama_sample.geojson', params['sdg_cells'], params['sdg_years'], seed)
+    metrics = ['productivity', 'soil organic carbon', 'land cover', 'population']
+    for i in range(params['datasets']):
+        write_point_dataset(data_dir / f"out{i}.geojson", params['dataset_cells'], metrics[i % len(metrics)], seed + i)
+    write_raster(root / 'raster.tif', params['raster_size'], params['raster_size'], seed)
+    return root
@@ -0,0 +1,311 @@
+"""Benchmark the map serving hot paths on synthetic fixtures.
+
+Usage:
+    python benchmarks/run_benchmarks.py --size small
+    python benchmarks/run_benchmarks.py --size medium --only map_service --output results.json
+    python benchmarks/compare_results.py baseline.json results.json
+
+Results are written as JSON with timings in milliseconds per benchmark,
+together with the parameters and environment they were measured with.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+import h3
+import numpy as np
+
+import fixtures
+
+logger = logging.getLogger(__name__)
+
+SIZES = {
+    'small': {
+        'pattern_cells': 500,
+        'raster_size': 100,
+        'raster_resolution': 5,
+        'sdg_cells': 200,
+        'sdg_years': 5,
+        'documents': 200,
+        'queries': 5,
+        'datasets': 4,
+        'dataset_cells': 500
+    },
+    'medium': {
+        'pattern_cells': 2000,
+        'raster_size': 300,
+        'raster_resolution': 5,
+        'sdg_cells': 1000,
+        'sdg_years': 15,
+        'documents': 1000,
+        'queries': 10,
+        'datasets': 4,
+        'dataset_cells': 2000
+    },
+    'large': {
+        'pattern_cells': 10000,
+        'raster_size': 1000,
+        'raster_resolution': 6,
+        'sdg_cells': 4000,
+        'sdg_years': 15,
+        'documents': 5000,
+        'queries': 20,
+        'datasets': 8,
+        'dataset_cells': 10000
+    }
+}
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+
+def benchmark(name: str):
+    """Register a setup function returning the zero-argument callable to time"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark('map_service.generate_cell_pattern')
+def bench_cell_pattern(params, workdir):
+    from src.services.map_service import MapService
+
+    service = MapService()
+    cells = fixtures.h3_cells(params['pattern_cells'])
+    timestamp = datetime(2024, 6, 1)
+
+    def run():
+        for h3_index in cells:
+            service._generate_cell_pattern(h3_index, timestamp)
+    return run
+
+
+@benchmark('map_service.generate_cell_patterns')
+def bench_cell_patterns(params, workdir):
+    from src.services.map_service import MapService
+
+    service = MapService()
+    cells = fixtures.h3_cells(params['pattern_cells'])
+    timestamp = datetime(2024, 6, 1)
+    return lambda: service.generate_cell_patterns(cells, timestamp)
+
+
+@benchmark('map_service.generate_hexagon_data')
+def bench_hexagon_data(params, workdir):
+    from src.services.map_service import MapService
+
+    service = MapService()
+    timestamp = datetime(2024, 6, 1)
+    return lambda: service.generate_hexagon_data(fixtures.CENTER_LAT, fixtures.CENTER_LNG, timestamp)
+
+
+@benchmark('map_service.tiff_to_h3_cells')
+def bench_tiff_to_h3(params, workdir):
+    from src.services.map_service import MapService
+
+    service = MapService()
+    raster_path = str(workdir / 'raster.tif')
+    return lambda: service.tiff_to_h3_cells(raster_path, resolution=params['raster_resolution'])
+
+
+@benchmark('raster_h3.raster_to_cells_coarse')
+def bench_raster_to_cells_coarse(params, workdir):
+    from src.services.raster_h3 import raster_to_cells
+
+    # Resolution 3 cells span many pixels, so opting into decimation reads the band decimated
+    raster_path = str(workdir / 'raster.tif')
+    return lambda: raster_to_cells(raster_path, 3, min_pixels_per_cell=1024)
+
+
+@benchmark('map_service.load_sdg_sample')
+def bench_load_sdg_sample(params, workdir):
+    from src.services.map_service import MapService
+
+    service = MapService()
+    return service.load_sdg_sample
+
+
+@benchmark('vector_store.similarity_search')
+def bench_similarity_search(params, workdir):
+    from src.services.vector_store import VectorStore
+
+    store = VectorStore()
+    store.add_documents(fixtures.make_documents(params['documents']))
+    queries = [' '.join(fixtures.WORDS[i::7][:5]) for i in range(params['queries'])]
+
+    def run():
+        for query in queries:
+            store.similarity_search(query, k=3)
+    return run
+
+
+def flask_client():
+    """Import the app from the fixture working directory and return a test client"""
+    # The app refuses to start without these; the benchmarked routes never use them
+    os.environ.setdefault('MAPBOX_API_KEY', 'pk.eyJ1benchmark')
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'benchmark')
+    from src.app import app
+    return app.test_client()
+
+
+def endpoint_benchmark(url: str) -> Callable:
+    def setup(params, workdir):
+        client = flask_client()
+
+        def run():
+            response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+            if response.status_code != 200:
+                raise RuntimeError(f"{url} returned {response.status_code}")
+            # Consume streamed bodies so the whole response is measured
+            response.get_data()
+        return run
+    return setup
+
+
+benchmark('flask./api/datasets/map')(endpoint_benchmark('/api/datasets/map'))
+benchmark('flask./api/map/policy/water_management')(
+    endpoint_benchmark('/api/map/policy/water_management?timestamp=2024-06-01T00:00:00')
+)
+
+
+def measure(run: Callable, repeat: int, warmup: int) -> Dict[str, Any]:
+    """Time run() repeat times after warmup calls and summarize in milliseconds"""
+    gc.collect()
+    start = time.perf_counter()
+    run()
+    first_ms = (time.perf_counter() - start) * 1000
+    for _ in range(warmup - 1):
+        run()
+
+    samples = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        'status': 'ok',
+        'first_ms': round(first_ms, 3),
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))], 3),
+        'max_ms': round(samples[-1], 3),
+        'stdev_ms': round(statistics.stdev(samples), 3) if len(samples) > 1 else 0.0,
+        'samples': len(samples)
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=fixtures.REPO_ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'h3': h3.__version__
+    }
+
+
+def run_benchmarks(size: str, only: list = None, repeat: int = 5, warmup: int = 1,
+                   seed: int = 0, overrides: Dict[str, int] = None) -> Dict[str, Any]:
+    """Build the fixtures, run every selected benchmark and return the results document"""
+    params = dict(SIZES[size], **(overrides or {}))
+    selected = [name for name in BENCHMARKS if not only or any(name.startswith(prefix) for prefix in only)]
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='the_green_bench_') as tmp:
+        workdir = fixtures.build_workdir(Path(tmp), params, seed)
+        # Services resolve data/ relative to the working directory
+        os.chdir(workdir)
+        try:
+            for name in selected:
+                logger.info(f"Running {name}")
+                try:
+                    results[name] = measure(BENCHMARKS[name](params, workdir), repeat, warmup)
+                except Exception as e:
+                    logger.error(f"Benchmark {name} failed: {e}")
+                    results[name] = {'status': 'error', 'error': str(e)}
+        finally:
+            os.chdir(cwd)
+
+    return {
+        'suite': 'the_green',
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'environment': environment(),
+        'config': {
+            'size': size,
+            'params': params,
+            'repeat': repeat,
+            'warmup': warmup,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+def print_summary(document: Dict[str, Any]) -> None:
+    print(f"{'benchmark':<45} {'median ms':>12} {'min ms':>12} {'first ms':>12}")
+    for name, result in document['results'].items():
+        if result['status'] != 'ok':
+            print(f"{name:<45} {'error: ' + result['error'][:60]}")
+            continue
+        print(f"{name:<45} {result['median_ms']:>12.2f} {result['min_ms']:>12.2f} {result['first_ms']:>12.2f}")
+
+
+def parse_override(value: str):
+    key, _, number = value.partition('=')
+    if not number:
+        raise argparse.ArgumentTypeError("overrides look like name=value")
+    return key, int(number)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the map serving hot paths')
+    parser.add_argument('--size', choices=sorted(SIZES), default='small', help='Fixture size preset')
+    parser.add_argument('--set', dest='overrides', type=parse_override, action='append', default=[],
+                        metavar='NAME=VALUE', help='Override one fixture parameter of the preset')
+    parser.add_argument('--only', action='append', help='Only run benchmarks whose name starts with this prefix')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='Untimed runs before timing')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the synthetic fixtures')
+    parser.add_argument('--output', help='Where to write the JSON results (default benchmarks/results/<size>.json)')
+    args = parser.parse_args()
+
+    # Per-cell debug logging would dominate the timings, so only the suite logs progress
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    sys.path.insert(0, str(fixtures.REPO_ROOT))
+    document = run_benchmarks(args.size, args.only, args.repeat, max(args.warmup, 1),
+                              args.seed, dict(args.overrides))
+
+    output = Path(args.output) if args.output else fixtures.REPO_ROOT / 'benchmarks' / 'results' / f"{args.size}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print_summary(document)
+    print(f"Results written to {output}")
@@ -0,0 +1,16 @@
+"""Make the repository root and the scripts directory importable.
+
+Scripts import the shared code in src/ and the helpers in scripts/utils, and
+are run as plain files from the repository root, from scripts/ or from one
+of its subdirectories, so neither is reliably on sys.path. Import this
+module before any src or utils import.
+"""
+import sys
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+REPO_ROOT = SCRIPTS_DIR.parent
+
+for path in (SCRIPTS_DIR, REPO_ROOT):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
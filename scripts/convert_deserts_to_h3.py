@@ -2,13 +2,40 @@ import geopandas as gpd
 import h3
 import json
 import logging
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from shapely.geometry import shape, mapping
+from shapely.geometry import Polygon, box
 from typing import Dict, Any
+import bootstrap  # noqa: F401  (puts src and utils on sys.path)
+from src.services.h3_geometry import cell_bounds, cell_polygons, to_cell_ints
+from src.services.conversion_manifest import ConversionManifest, default_manifest_path
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Projection used to measure areas; areas in EPSG:4326 would be square degrees
+EQUAL_AREA_CRS = 'EPSG:6933'
+
+# Numeric columns averaged by area and categorical columns reduced to their mode
+MEAN_METRICS = {'desertification_index': 'DI', 'desertification_index2': 'DI2'}
+MODE_METRICS = {
+    'land_suitability': 'LU_Suitabi',
+    'degradation_type': 'Deg_Type_1',
+    'degradation_condition': 'Deg_Condit'
+}
+ATTRIBUTE_COLUMNS = list(MEAN_METRICS.values()) + list(MODE_METRICS.values())
+METRIC_ORDER = list(MEAN_METRICS) + list(MODE_METRICS) + ['area_km2']
+
+# Cells below which worker processes are not worth starting, and partitions per worker
+PARTITION_MIN_CELLS = 5000
+PARTITIONS_PER_WORKER = 4
+
+# Recorded in the manifest and bumped on output changes (2: cells carry area_km2)
+CONVERTER_VERSION = 2
+
+
 def load_desert_data(geojson_path: str) -> gpd.GeoDataFrame:
     """Load and preprocess desert GeoJSON data"""
     logger.info(f"Loading desertification data from {geojson_path}")
@@ -21,8 +48,81 @@ def load_desert_data(geojson_path: str) -> gpd.GeoDataFrame:
         logger.error(f"Error loading desert data: {e}")
         raise
 
-def aggregate_by_h3(gdf: gpd.GeoDataFrame, resolution: int = 3) -> Dict[str, Any]:
-    """Aggregate desert data by H3 cells"""
+def polyfill_cells(gdf: gpd.GeoDataFrame, resolution: int) -> np.ndarray:
+    """Return the sorted H3 cells whose centres fall inside any polygon, as uint64"""
+    cells = set()
+    for idx, geometry in zip(gdf.index, gdf.geometry):
+        if geometry is None or geometry.geom_type not in ('Polygon', 'MultiPolygon'):
+            continue
+        try:
+            cells.update(h3.geo_to_cells(geometry.__geo_interface__, resolution))
+        except Exception as e:
+            logger.warning(f"Error processing feature {idx}: {e}")
+            continue
+    return np.sort(to_cell_ints(list(cells))) if cells else np.empty(0, dtype=np.uint64)
+
+def hex_grid(cells: np.ndarray) -> gpd.GeoDataFrame:
+    """Return a GeoDataFrame with one hexagon polygon per H3 cell"""
+    polygons = cell_polygons(cells)
+    return gpd.GeoDataFrame(
+        {'h3_index': [h3.int_to_str(cell) for cell in cells.tolist()]},
+        geometry=[Polygon(polygon[0]) for polygon in polygons],
+        crs='EPSG:4326'
+    )
+
+def intersect_cells(gdf: gpd.GeoDataFrame, cells: np.ndarray) -> pd.DataFrame:
+    """Intersect the desert polygons with the hexagons of cells in one indexed overlay.
+
+    Returns one row per polygon/hexagon piece with the polygon's attribute
+    columns and the piece's area in square metres.
+    """
+    hexes = hex_grid(cells)
+    # Only polygons touching the hexagons' extent take part in the overlay
+    gdf = gdf.iloc[gdf.sindex.query(box(*hexes.total_bounds))]
+    columns = [column for column in ATTRIBUTE_COLUMNS if column in gdf.columns]
+    pieces = gpd.overlay(gdf[columns + ['geometry']], hexes, how='intersection', keep_geom_type=True)
+    pieces['area_m2'] = pieces.geometry.to_crs(EQUAL_AREA_CRS).area
+    return pd.DataFrame(pieces.drop(columns='geometry'))
+
+def partitioned_pieces(gdf: gpd.GeoDataFrame, cells: np.ndarray, workers: int = 1) -> pd.DataFrame:
+    """Intersect polygons and hexagons, splitting the cells across worker processes when asked"""
+    if workers <= 1 or len(cells) < PARTITION_MIN_CELLS:
+        return intersect_cells(gdf, cells)
+    # Cells sorted by index are spatially clustered, so each partition touches few polygons
+    partitions = np.array_split(cells, workers * PARTITIONS_PER_WORKER)
+    # Send each worker only the polygons near its cells
+    subsets = []
+    for partition in partitions:
+        bounds = cell_bounds(partition)
+        extent = box(bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max())
+        subsets.append(gdf.iloc[gdf.sindex.query(extent)])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = list(executor.map(intersect_cells, subsets, partitions))
+    return pd.concat(parts, ignore_index=True)
+
+def weighted_means(pieces: pd.DataFrame, column: str) -> pd.Series:
+    """Return the area-weighted mean of a column per cell, ignoring missing values"""
+    values = pd.to_numeric(pieces[column], errors='coerce')
+    weights = pieces['area_m2'].where(values.notna(), 0.0)
+    grouped = pd.DataFrame({
+        'h3_index': pieces['h3_index'], 'weighted': values.fillna(0.0) * weights, 'weight': weights
+    }).groupby('h3_index')
+    totals = grouped[['weighted', 'weight']].sum()
+    return totals['weighted'] / totals['weight'].where(totals['weight'] > 0)
+
+def modes(pieces: pd.DataFrame, column: str) -> pd.Series:
+    """Return the most frequent value of a column per cell, the smallest one on ties"""
+    counts = pieces.dropna(subset=[column]).groupby(['h3_index', column]).size().reset_index(name='count')
+    counts = counts.sort_values(['h3_index', 'count', column], ascending=[True, False, True])
+    return counts.drop_duplicates('h3_index').set_index('h3_index')[column]
+
+def aggregate_by_h3(gdf: gpd.GeoDataFrame, resolution: int = 3, workers: int = 1) -> Dict[str, Any]:
+    """Aggregate desert data by H3 cells.
+
+    The polygons are intersected once with a grid of all candidate hexagons;
+    DI and DI2 become area-weighted means and the categorical columns their
+    most frequent value per cell.
+    """
     logger.info(f"Aggregating data using H3 resolution {resolution}")
     
     # Convert to EPSG:4326 if needed
@@ -37,69 +137,33 @@ def aggregate_by_h3(gdf: gpd.GeoDataFrame, resolution: int = 3) -> Dict[str, Any
     logger.info(f"Filtered to {len(gdf)} features intersecting Somalia")
     
     # Collect all H3 cells
-    h3_cells = set()  # Use set to avoid duplicates
-    for idx, row in gdf.iterrows():
-        try:
-            # Convert polygon to GeoJSON format and extract coordinates
-            geojson = mapping(row.geometry)
-            coords = geojson['coordinates'][0]  # Get exterior ring coordinates
-            
-            # Get H3 cells for this polygon
-            cells = h3.polyfill_polygon(coords, resolution)
-            h3_cells.update(cells)
-            
-        except Exception as e:
-            logger.warning(f"Error processing feature {idx}: {e}")
-            logger.debug(f"Geometry type: {row.geometry.geom_type}")
-            continue
-    
-    logger.info(f"Generated {len(h3_cells)} unique H3 cells")
+    cells = polyfill_cells(gdf, resolution)
+    logger.info(f"Generated {len(cells)} unique H3 cells")
     
-    # Create features for each H3 cell
     features = []
-    for h3_index in h3_cells:
-        try:
-            # Get hexagon boundary
-            boundary = h3.cell_to_boundary(h3_index)
-            hex_polygon = gpd.GeoDataFrame(
-                geometry=[gpd.GeoSeries([shape({
+    if len(cells):
+        pieces = partitioned_pieces(gdf, cells, workers)
+        metrics = pd.DataFrame({'area_km2': pieces.groupby('h3_index')['area_m2'].sum() / 1_000_000})
+        for metric, column in MEAN_METRICS.items():
+            metrics[metric] = weighted_means(pieces, column) if column in pieces.columns else None
+        for metric, column in MODE_METRICS.items():
+            metrics[metric] = modes(pieces, column) if column in pieces.columns else None
+        metrics = metrics.astype(object).where(metrics.notna(), None)
+        
+        polygons = dict(zip(metrics.index, cell_polygons(list(metrics.index))))
+        for h3_index, row in zip(metrics.index, metrics.to_dict('records')):
+            # Create feature
+            features.append({
+                'type': 'Feature',
+                'geometry': {
                     'type': 'Polygon',
-                    'coordinates': [[[vertex[1], vertex[0]] for vertex in boundary]]
-                })])[0]], 
-                crs='EPSG:4326'
-            )
-            
-            # Intersect with original data
-            intersection = gpd.overlay(gdf, hex_polygon, how='intersection')
-            
-            if not intersection.empty:
-                # Calculate metrics for the hexagon
-                metrics = {
-                    'desertification_index': float(intersection['DI'].mean()) if 'DI' in intersection.columns else None,
-                    'desertification_index2': float(intersection['DI2'].mean()) if 'DI2' in intersection.columns else None,
-                    'land_suitability': intersection['LU_Suitabi'].mode().iloc[0] if 'LU_Suitabi' in intersection.columns else None,
-                    'degradation_type': intersection['Deg_Type_1'].mode().iloc[0] if 'Deg_Type_1' in intersection.columns else None,
-                    'degradation_condition': intersection['Deg_Condit'].mode().iloc[0] if 'Deg_Condit' in intersection.columns else None,
-                    'area_km2': float(intersection.geometry.area.sum() / 1_000_000)  # Convert to km²
-                }
-                
-                # Create feature
-                feature = {
-                    'type': 'Feature',
-                    'geometry': {
-                        'type': 'Polygon',
-                        'coordinates': [[[vertex[1], vertex[0]] for vertex in boundary]]
-                    },
-                    'properties': {
-                        'h3_index': h3_index,
-                        'metrics': metrics
-                    }
+                    'coordinates': polygons[h3_index]
+                },
+                'properties': {
+                    'h3_index': h3_index,
+                    'metrics': {metric: row[metric] for metric in METRIC_ORDER}
                 }
-                features.append(feature)
-                
-        except Exception as e:
-            logger.warning(f"Error processing H3 cell {h3_index}: {e}")
-            continue
+            })
     
     logger.info(f"Created {len(features)} features with metrics")
     
@@ -131,14 +195,20 @@ def aggregate_by_h3(gdf: gpd.GeoDataFrame, resolution: int = 3) -> Dict[str, Any
     
     return geojson
 
-def convert_deserts_to_h3(input_path: str, output_path: str, resolution: int = 3):
-    """Convert desert GeoJSON to H3-aggregated GeoJSON"""
+def convert_deserts_to_h3(input_path: str, output_path: str, resolution: int = 3,
+                          manifest: ConversionManifest = None, force: bool = False, workers: int = 1):
+    """Convert desert GeoJSON to H3-aggregated GeoJSON, skipping unchanged inputs recorded in the manifest"""
     try:
+        params = {'resolution': resolution, 'country': 'Somalia', 'converter_version': CONVERTER_VERSION}
+        if manifest and not force and manifest.is_current('convert_deserts_to_h3', [input_path], [output_path], params):
+            logger.info(f"{output_path} is up to date, skipping")
+            return output_path
+        
         # Load and process data
         gdf = load_desert_data(input_path)
         
         # Aggregate by H3
-        geojson = aggregate_by_h3(gdf, resolution)
+        geojson = aggregate_by_h3(gdf, resolution, workers)
         
         # Save output
         output_dir = Path(output_path).parent
@@ -148,6 +218,11 @@ def convert_deserts_to_h3(input_path: str, output_path: str, resolution: int = 3
             json.dump(geojson, f)
         
         logger.info(f"Successfully saved H3 aggregated data to {output_path}")
+        if manifest:
+            manifest.record('convert_deserts_to_h3', [input_path], [output_path], params,
+                            cells=len(geojson['features']))
+            manifest.save()
+        return output_path
         
     except Exception as e:
         logger.error(f"Error converting desert data to H3: {e}")
@@ -163,6 +238,15 @@ if __name__ == "__main__":
                       help='Output GeoJSON file path')
     parser.add_argument('--resolution', type=int, default=3,
                       help='H3 resolution (0-15)')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='Worker processes intersecting partitions of large inputs')
+    parser.add_argument('--manifest', default=None,
+                      help='Path of the conversion manifest (default: next to the output)')
+    parser.add_argument('--force', action='store_true',
+                      help='Convert even if the input and parameters are unchanged')
+    parser.add_argument('--hash', action='store_true',
+                      help='Compare input content hashes, not only size and modification time')
     
     args = parser.parse_args()
-    convert_deserts_to_h3(args.input, args.output, args.resolution) 
\ No newline at end of file
+    manifest = ConversionManifest(args.manifest or default_manifest_path(args.output), args.hash)
+    convert_deserts_to_h3(args.input, args.output, args.resolution, manifest, args.force, args.workers) 
\ No newline at end of file
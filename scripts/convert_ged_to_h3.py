@@ -1,138 +1,274 @@
+import numpy as np
 import pandas as pd
 import h3
+import os
 import json
 import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, List
+import bootstrap  # noqa: F401  (puts src and utils on sys.path)
+from src.services.conversion_manifest import ConversionManifest, default_manifest_path
+from src.services.h3_geometry import cell_polygons
+from src.services.h3_store import H3TimeSeries, timeseries_path
+from src.services.raster_h3 import points_to_cells
+from utils.geo_filter import country_bounds, filter_geojson_by_country, filter_h3_cells_by_country, points_in_country
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_country_bounds():
-    """Return geographical bounds for countries of interest"""
-    return {
-        'Malawi': {
-            'lat_min': -17.0,
-            'lat_max': -9.5,
-            'lon_min': 32.0,
-            'lon_max': 36.0
-        },
-        # These are approximate bounds - you may want to adjust them
-        'Panama': {
-            'lat_min': 7.0,
-            'lat_max': 10.0,
-            'lon_min': -83.0,
-            'lon_max': -77.0
-        },
-        'Ethiopia': {
-            'lat_min': 3.0,
-            'lat_max': 15.0,
-            'lon_min': 33.0,
-            'lon_max': 48.0
-        },
-        'Libya': {
-            'lat_min': 19.5,
-            'lat_max': 33.0,
-            'lon_min': 10.0,
-            'lon_max': 25.0
-        },
-        'Somalia': {
-            'lat_min': -1.5,
-            'lat_max': 12.0,
-            'lon_min': 41.0,
-            'lon_max': 51.5
-        }
-    }
+# Fixed year range covered by the converted datasets
+YEARS = range(2001, 2016)  # 2001 to 2015 inclusive
 
-def load_ged_data(csv_path: str, country: str = None) -> pd.DataFrame:
-    """Load and preprocess GED CSV data with optional country filtering"""
-    logger.info(f"Loading GED data from {csv_path}")
-    
-    df = pd.read_csv(csv_path)
-    
+# Columns of the GED CSV used by the aggregation; the rest are never parsed
+GED_COLUMNS = ['date_start', 'latitude', 'longitude', 'country', 'best', 'deaths_civilians',
+               'deaths_a', 'deaths_b', 'type_of_violence']
+
+# Rows parsed per CSV chunk
+CHUNK_ROWS = 100_000
+
+# Part of the manifest parameters; bump it whenever the converted output changes
+CONVERTER_VERSION = 1
+
+# Countries converted when no single country is requested
+COUNTRIES = ['Panama', 'Malawi', 'Ethiopia', 'Libya', 'Somalia']
+
+# Countries whose events are selected by location inside their boundary
+# rather than by the GED country column
+LOCATED_COUNTRIES = {'Malawi'}
+
+def prepare_ged_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse one CSV chunk and keep the events in the year range with valid coordinates"""
     # Convert date columns to datetime
     df['date_start'] = pd.to_datetime(df['date_start'])
     df['year'] = df['date_start'].dt.year
     
     # Filter for years 2001-2015
-    df = df[(df['year'] >= 2001) & (df['year'] <= 2015)]
-    
-    # Country-specific filtering
-    if country:
-        if country == 'Malawi':
-            bounds = get_country_bounds()['Malawi']
-            df = df[
-                (df['latitude'] >= bounds['lat_min']) & 
-                (df['latitude'] <= bounds['lat_max']) &
-                (df['longitude'] >= bounds['lon_min']) & 
-                (df['longitude'] <= bounds['lon_max'])
-            ]
-            # Set country field since we used bounds filtering
-            df['country'] = 'Malawi'
-        else:
-            df = df[df['country'] == country]
-            
-        logger.info(f"Filtered data for {country}, {len(df)} events remaining")
+    df = df[(df['year'] >= min(YEARS)) & (df['year'] <= max(YEARS))]
     
     # Ensure latitude and longitude are numeric
-    df['latitude'] = pd.to_numeric(df['latitude'], errors='coerce')
-    df['longitude'] = pd.to_numeric(df['longitude'], errors='coerce')
+    df = df.assign(
+        latitude=pd.to_numeric(df['latitude'], errors='coerce'),
+        longitude=pd.to_numeric(df['longitude'], errors='coerce')
+    )
     
     # Drop rows with invalid coordinates
-    df = df.dropna(subset=['latitude', 'longitude'])
+    return df.dropna(subset=['latitude', 'longitude'])
+
+def select_country(df: pd.DataFrame, country: str, by_name: Dict[str, pd.DataFrame] = None) -> pd.DataFrame:
+    """Return the events of one country from a prepared chunk.
+
+    by_name optionally holds the chunk already split by its country column,
+    so selecting many countries takes a single pass over the chunk.
+    """
+    if country in LOCATED_COUNTRIES:
+        df = df[points_in_country(df['longitude'].to_numpy(), df['latitude'].to_numpy(), country)]
+        # Set country field since we used boundary filtering
+        return df.assign(country=country)
+    if by_name is not None:
+        return by_name.get(country, df.iloc[:0])
+    return df[df['country'] == country]
+
+def read_ged_chunks(csv_path: str, chunksize: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield prepared chunks of the GED CSV, parsing only the columns used by the aggregation"""
+    logger.info(f"Loading GED data from {csv_path}")
+    for chunk in pd.read_csv(csv_path, usecols=GED_COLUMNS, chunksize=chunksize):
+        yield prepare_ged_chunk(chunk)
+
+def concat_events(chunks: List[pd.DataFrame]) -> pd.DataFrame:
+    if not chunks:
+        return pd.DataFrame(columns=GED_COLUMNS + ['year'])
+    return pd.concat(chunks, ignore_index=True)
+
+def load_ged_data(csv_path: str, country: str = None, chunksize: int = CHUNK_ROWS) -> pd.DataFrame:
+    """Load and preprocess GED CSV data with optional country filtering.
+
+    Only the columns used by the aggregation are parsed, chunk by chunk, and
+    each chunk is filtered before the next is read.
+    """
+    chunks = [
+        select_country(chunk, country) if country else chunk
+        for chunk in read_ged_chunks(csv_path, chunksize)
+    ]
+    df = concat_events(chunks)
+    
+    if country:
+        logger.info(f"Filtered data for {country}, {len(df)} events remaining")
     
     return df
 
+def load_ged_partitions(csv_path: str, countries: List[str], chunksize: int = CHUNK_ROWS) -> Dict[str, pd.DataFrame]:
+    """Read the GED CSV once and return the events of every country"""
+    parts = {country: [] for country in countries}
+    for chunk in read_ged_chunks(csv_path, chunksize):
+        by_name = dict(tuple(chunk.groupby('country', sort=False)))
+        for country in countries:
+            part = select_country(chunk, country, by_name)
+            if len(part):
+                parts[country].append(part)
+    
+    partitions = {country: concat_events(chunks) for country, chunks in parts.items()}
+    for country, df in partitions.items():
+        logger.info(f"Filtered data for {country}, {len(df)} events remaining")
+    return partitions
+
+def group_sets(group_ids: np.ndarray, values: pd.Series, group_count: int) -> List[set]:
+    """Return the set of distinct values of every group"""
+    sets = [set() for _ in range(group_count)]
+    pairs = pd.DataFrame({'group': group_ids, 'value': values.to_numpy()}).drop_duplicates()
+    for group, value in zip(pairs['group'].tolist(), pairs['value'].tolist()):
+        sets[group].add(value)
+    return sets
+
+def aggregate_records(df: pd.DataFrame, resolution: int = 3) -> Dict[tuple, Dict[str, Any]]:
+    """Aggregate GED events into per-(h3_index, year) metric records.
+
+    Cells are computed for all events at once and the metrics are reduced
+    with grouped operations; records are ordered by the first event of each
+    cell-year, as a row-by-row scan would produce them.
+    """
+    in_range = df['latitude'].between(-90, 90) & df['longitude'].between(-180, 180)
+    if not in_range.all():
+        logger.warning(f"Skipping {int((~in_range).sum())} events with invalid coordinates")
+        df = df[in_range]
+    if df.empty:
+        return {}
+    
+    cells = points_to_cells(df['latitude'].to_numpy(np.float64), df['longitude'].to_numpy(np.float64),
+                            resolution)
+    events = pd.DataFrame({
+        'cell': cells,
+        'year': df['year'].to_numpy().astype(np.int64),
+        'deaths_total': df['best'].fillna(0).to_numpy(),
+        'deaths_civilians': df['deaths_civilians'].fillna(0).to_numpy(),
+        'deaths_military': (df['deaths_a'].fillna(0) + df['deaths_b'].fillna(0)).to_numpy(),
+        'country': df['country'].to_numpy(),
+        'type_of_violence': df['type_of_violence'].astype(str).to_numpy()
+    })
+    
+    groups = events.groupby(['cell', 'year'], sort=False)
+    totals = groups[['deaths_total', 'deaths_civilians', 'deaths_military']].sum()
+    totals['incident_count'] = groups.size()
+    group_ids = groups.ngroup().to_numpy()
+    countries = group_sets(group_ids, events['country'], len(totals))
+    violence = group_sets(group_ids, events['type_of_violence'], len(totals))
+    
+    cell_ids = {cell: h3.int_to_str(cell) for cell in pd.unique(cells).tolist()}
+    hexagon_data = {}
+    for (cell, year), incidents, total, civilians, military, cell_countries, cell_violence in zip(
+        totals.index.tolist(),
+        totals['incident_count'].tolist(),
+        totals['deaths_total'].tolist(),
+        totals['deaths_civilians'].tolist(),
+        totals['deaths_military'].tolist(),
+        countries,
+        violence
+    ):
+        hexagon_data[(cell_ids[cell], year)] = {
+            'incident_count': incidents,
+            'deaths_total': total,
+            'deaths_civilians': civilians,
+            'deaths_military': military,
+            'countries': cell_countries,
+            'types_of_violence': cell_violence
+        }
+    
+    return hexagon_data
+
+def empty_metrics() -> Dict[str, Any]:
+    """Return the metrics of a cell-year with no recorded events"""
+    return {
+        'incident_count': 0,
+        'deaths_total': 0,
+        'deaths_civilians': 0,
+        'deaths_military': 0,
+        'countries': set(),
+        'types_of_violence': set()
+    }
+
+def build_metadata(cell_count: int, years: list, resolution: int, country: str = None) -> Dict[str, Any]:
+    """Return the dataset metadata shared by the GeoJSON and columnar outputs"""
+    metadata = {
+        'dataset': 'UCDP Georeferenced Event Dataset',
+        'cell_count': cell_count,
+        'year_count': len(years),
+        'h3_resolution': resolution,
+        'temporal_range': {
+            'start': min(years),
+            'end': max(years),
+            'interval': 'yearly'
+        },
+        'metrics': {
+            'incident_count': {
+                'name': 'Incident Count',
+                'description': 'Number of conflict events',
+                'unit': 'count'
+            },
+            'deaths_total': {
+                'name': 'Total Deaths',
+                'description': 'Total number of deaths',
+                'unit': 'count'
+            },
+            'deaths_civilians': {
+                'name': 'Civilian Deaths',
+                'description': 'Number of civilian deaths',
+                'unit': 'count'
+            },
+            'deaths_military': {
+                'name': 'Military Deaths',
+                'description': 'Number of military deaths (side A + side B)',
+                'unit': 'count'
+            }
+        }
+    }
+    
+    if country:
+        metadata['country'] = country
+        metadata['bounds'] = country_bounds(country)
+    
+    return metadata
+
+def aggregate_to_timeseries(df: pd.DataFrame, resolution: int = 3, country: str = None) -> H3TimeSeries:
+    """Aggregate GED data into a columnar H3 time series"""
+    logger.info(f"Aggregating data using H3 resolution {resolution}")
+    
+    years = list(YEARS)
+    hexagon_data = aggregate_records(df, resolution)
+    unique_h3_cells = set(h3_index for h3_index, _ in hexagon_data.keys())
+    
+    # Fill years with no events so every cell has a dense row per year
+    records = {}
+    for h3_index in unique_h3_cells:
+        for year in years:
+            data = hexagon_data.get((h3_index, year), empty_metrics())
+            records[(h3_index, year)] = {
+                metric: (sorted(value) if isinstance(value, set) else value)
+                for metric, value in data.items()
+            }
+    cell_count = len(unique_h3_cells)
+    
+    return H3TimeSeries.from_records(
+        records,
+        years,
+        metadata=build_metadata(cell_count, years, resolution, country),
+        static_properties={'country': country} if country else None
+    )
+
 def aggregate_by_h3(df: pd.DataFrame, resolution: int = 3, country: str = None) -> Dict[str, Any]:
     """Aggregate GED data by H3 cells and year"""
     logger.info(f"Aggregating data using H3 resolution {resolution}")
     
     # Initialize storage for features
     features = []
-    hexagon_data = {}
+    hexagon_data = aggregate_records(df, resolution)
     
     # Fixed year range
-    years = list(range(2001, 2016))  # 2001 to 2015 inclusive
-    
-    # Process each row
-    for _, row in df.iterrows():
-        try:
-            # Get H3 index for the location
-            h3_index = h3.latlng_to_cell(row['latitude'], row['longitude'], resolution)
-            year = int(row['year'])
-            
-            # Create key for year and h3 combination
-            key = (h3_index, year)
-            
-            if key not in hexagon_data:
-                hexagon_data[key] = {
-                    'incident_count': 0,
-                    'deaths_total': 0,
-                    'deaths_civilians': 0,
-                    'deaths_military': 0,
-                    'countries': set(),
-                    'types_of_violence': set()
-                }
-            
-            # Aggregate data
-            data = hexagon_data[key]
-            data['incident_count'] += 1
-            data['deaths_total'] += row['best'] if pd.notna(row['best']) else 0
-            data['deaths_civilians'] += row['deaths_civilians'] if pd.notna(row['deaths_civilians']) else 0
-            data['deaths_military'] += (
-                (row['deaths_a'] if pd.notna(row['deaths_a']) else 0) + 
-                (row['deaths_b'] if pd.notna(row['deaths_b']) else 0)
-            )
-            data['countries'].add(row['country'])
-            data['types_of_violence'].add(str(row['type_of_violence']))
-            
-        except Exception as e:
-            logger.warning(f"Error processing row: {e}")
-            continue
+    years = list(YEARS)
     
     # Get all unique H3 cells
-    unique_h3_cells = set(h3_index for h3_index, _ in hexagon_data.keys())
+    unique_h3_cells = list(dict.fromkeys(h3_index for h3_index, _ in hexagon_data.keys()))
+    polygons = dict(zip(unique_h3_cells, cell_polygons(unique_h3_cells)))
     
     # Create features for each hexagon for all years (including years with no events)
     for h3_index in unique_h3_cells:
@@ -140,26 +276,14 @@ def aggregate_by_h3(df: pd.DataFrame, resolution: int = 3, country: str = None)
             key = (h3_index, year)
             
             # Get data if exists, otherwise use empty data
-            data = hexagon_data.get(key, {
-                'incident_count': 0,
-                'deaths_total': 0,
-                'deaths_civilians': 0,
-                'deaths_military': 0,
-                'countries': set(),
-                'types_of_violence': set()
-            })
+            data = hexagon_data.get(key, empty_metrics())
             
             try:
-                # Get cell boundary
-                boundary = h3.cell_to_boundary(h3_index)
-                coordinates = [[[vertex[1], vertex[0]] for vertex in boundary]]
-                coordinates[0].append(coordinates[0][0])  # Close the polygon
-                
                 feature = {
                     'type': 'Feature',
                     'geometry': {
                         'type': 'Polygon',
-                        'coordinates': coordinates
+                        'coordinates': polygons[h3_index]
                     },
                     'properties': {
                         'h3_index': h3_index,
@@ -187,61 +311,47 @@ def aggregate_by_h3(df: pd.DataFrame, resolution: int = 3, country: str = None)
     geojson = {
         'type': 'FeatureCollection',
         'features': features,
-        'metadata': {
-            'dataset': 'UCDP Georeferenced Event Dataset',
-            'cell_count': len(unique_h3_cells),
-            'year_count': len(years),
-            'h3_resolution': resolution,
-            'temporal_range': {
-                'start': min(years),
-                'end': max(years),
-                'interval': 'yearly'
-            },
-            'metrics': {
-                'incident_count': {
-                    'name': 'Incident Count',
-                    'description': 'Number of conflict events',
-                    'unit': 'count'
-                },
-                'deaths_total': {
-                    'name': 'Total Deaths',
-                    'description': 'Total number of deaths',
-                    'unit': 'count'
-                },
-                'deaths_civilians': {
-                    'name': 'Civilian Deaths',
-                    'description': 'Number of civilian deaths',
-                    'unit': 'count'
-                },
-                'deaths_military': {
-                    'name': 'Military Deaths',
-                    'description': 'Number of military deaths (side A + side B)',
-                    'unit': 'count'
-                }
-            }
-        }
+        'metadata': build_metadata(len(unique_h3_cells), years, resolution, country)
     }
     
-    if country:
-        geojson['metadata']['country'] = country
-        geojson['metadata']['bounds'] = get_country_bounds()[country]
-    
     return geojson
 
-def convert_ged_to_h3(input_path: str, output_path: str, resolution: int = 3, country: str = None):
-    """Convert GED CSV to H3-aggregated GeoJSON for specific country"""
-    try:
-        # Load and process data
-        df = load_ged_data(input_path, country)
-        
+def ged_output_path(output_path: str, country: str = None, output_format: str = 'h3ts') -> str:
+    """Return the file a conversion writes, one per country next to output_path"""
+    if country:
+        output_path = str(Path(output_path).parent / f"ged_h3_{country.lower()}.geojson")
+    if output_format == 'h3ts':
+        output_path = timeseries_path(output_path)
+    return output_path
+
+def ged_params(resolution: int, country: str = None, output_format: str = 'h3ts') -> Dict[str, Any]:
+    """Return the conversion parameters recorded in the manifest"""
+    return {
+        'resolution': resolution,
+        'country': country,
+        'years': [min(YEARS), max(YEARS)],
+        'format': output_format,
+        'converter_version': CONVERTER_VERSION
+    }
+
+def write_ged_output(df: pd.DataFrame, output_path: str, resolution: int = 3, country: str = None,
+                     output_format: str = 'h3ts') -> str:
+    """Aggregate loaded GED events, clip them to the country and save the dataset"""
+    if output_format == 'h3ts':
+        # Columnar output: one cell column, no stored geometry
+        timeseries = aggregate_to_timeseries(df, resolution, country)
+        if country:
+            timeseries = timeseries.select_cells(
+                filter_h3_cells_by_country(timeseries.cell_ids, country)
+            )
+        output_path = timeseries.save(output_path)
+    else:
         # Aggregate by H3
         geojson = aggregate_by_h3(df, resolution, country)
         
         # Filter by country boundary if specified
         if country:
-            from utils.geo_filter import filter_geojson_by_country
             geojson = filter_geojson_by_country(geojson, country)
-            output_path = str(Path(output_path).parent / f"ged_h3_{country.lower()}.geojson")
         
         # Save output
         output_dir = Path(output_path).parent
@@ -249,13 +359,100 @@ def convert_ged_to_h3(input_path: str, output_path: str, resolution: int = 3, co
         
         with open(output_path, 'w') as f:
             json.dump(geojson, f)
+    
+    logger.info(f"Successfully saved H3 aggregated data to {output_path}")
+    return output_path
+
+def convert_ged_to_h3(input_path: str, output_path: str, resolution: int = 3, country: str = None,
+                      output_format: str = 'h3ts', manifest: ConversionManifest = None, force: bool = False):
+    """Convert GED CSV to an H3-aggregated dataset for specific country.
+
+    With a manifest the conversion is skipped when the same input was already
+    converted to the same output with the same parameters, unless force is set.
+    """
+    try:
+        output_path = ged_output_path(output_path, country, output_format)
+        params = ged_params(resolution, country, output_format)
+        if manifest and not force and manifest.is_current('convert_ged_to_h3', [input_path], [output_path], params):
+            logger.info(f"{output_path} is up to date, skipping")
+            return output_path
+        
+        # Load and process data
+        df = load_ged_data(input_path, country)
+        output_path = write_ged_output(df, output_path, resolution, country, output_format)
         
-        logger.info(f"Successfully saved H3 aggregated data to {output_path}")
+        if manifest:
+            manifest.record('convert_ged_to_h3', [input_path], [output_path], params)
+            manifest.save()
+        return output_path
         
     except Exception as e:
         logger.error(f"Error converting GED to H3: {e}")
         raise
 
+def convert_ged_countries(input_path: str, output_path: str, resolution: int = 3, countries: List[str] = COUNTRIES,
+                          output_format: str = 'h3ts', manifest: ConversionManifest = None, force: bool = False,
+                          workers: int = 1) -> Dict[str, str]:
+    """Convert GED CSV to one H3-aggregated dataset per country from a single read of the CSV.
+
+    Every event is assigned to its country partitions while the CSV is read
+    once; the partitions are then aggregated and saved, in worker processes
+    when workers is above one. Returns the output path of every country.
+    """
+    outputs = {country: ged_output_path(output_path, country, output_format) for country in countries}
+    pending = [
+        country for country in countries
+        if force or not manifest or not manifest.is_current(
+            'convert_ged_to_h3', [input_path], [outputs[country]], ged_params(resolution, country, output_format)
+        )
+    ]
+    for country in countries:
+        if country not in pending:
+            logger.info(f"{outputs[country]} is up to date, skipping")
+    if not pending:
+        return outputs
+    
+    try:
+        partitions = load_ged_partitions(input_path, pending)
+    except Exception as e:
+        logger.error(f"Error converting GED to H3: {e}")
+        raise
+    
+    def saved(country: str, path: str) -> None:
+        outputs[country] = path
+        if manifest:
+            manifest.record('convert_ged_to_h3', [input_path], [path], ged_params(resolution, country, output_format))
+            manifest.save()
+    
+    workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+    failed = []
+    if workers == 1:
+        for country in pending:
+            try:
+                saved(country, write_ged_output(partitions.pop(country), outputs[country], resolution, country,
+                                                output_format))
+            except Exception as e:
+                logger.error(f"Error converting GED to H3 for {country}: {e}")
+                failed.append(country)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(write_ged_output, partitions.pop(country), outputs[country], resolution, country,
+                                output_format): country
+                for country in pending
+            }
+            for future in as_completed(futures):
+                country = futures[future]
+                try:
+                    saved(country, future.result())
+                except Exception as e:
+                    logger.error(f"Error converting GED to H3 for {country}: {e}")
+                    failed.append(country)
+    
+    if failed:
+        raise RuntimeError(f"GED conversion failed for {', '.join(failed)}")
+    return outputs
+
 if __name__ == "__main__":
     import argparse
     
@@ -266,14 +463,26 @@ if __name__ == "__main__":
                       help='Output GeoJSON file path')
     parser.add_argument('--resolution', type=int, default=3,
                       help='H3 resolution (0-15)')
-    parser.add_argument('--country', choices=['Panama', 'Malawi', 'Ethiopia', 'Libya', 'Somalia'],
+    parser.add_argument('--country', choices=COUNTRIES,
                       help='Country to filter data for')
+    parser.add_argument('--format', choices=['h3ts', 'geojson'], default='h3ts',
+                      help='Output format: columnar H3 time series or per-year GeoJSON features')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='Worker processes aggregating countries when converting all of them (0 for one per CPU)')
+    parser.add_argument('--manifest', default=None,
+                      help='Path of the conversion manifest (default: next to the output)')
+    parser.add_argument('--force', action='store_true',
+                      help='Convert even if the input and parameters are unchanged')
+    parser.add_argument('--hash', action='store_true',
+                      help='Compare input content hashes, not only size and modification time')
     
     args = parser.parse_args()
+    manifest = ConversionManifest(args.manifest or default_manifest_path(args.output), args.hash)
     
     # Process each country if none specified, otherwise process only the specified country
     if args.country:
-        convert_ged_to_h3(args.input, args.output, args.resolution, args.country)
+        convert_ged_to_h3(args.input, args.output, args.resolution, args.country, args.format,
+                          manifest, args.force)
     else:
-        for country in ['Panama', 'Malawi', 'Ethiopia', 'Libya', 'Somalia']:
-            convert_ged_to_h3(args.input, args.output, args.resolution, country)
+        convert_ged_countries(args.input, args.output, args.resolution, COUNTRIES, args.format,
+                              manifest, args.force, args.workers)
@@ -3,7 +3,10 @@ import h3
 from datetime import datetime
 from pathlib import Path
 import logging
+import bootstrap  # noqa: F401  (puts src and utils on sys.path)
 from utils.geo_filter import filter_geojson_by_country
+from src.services.h3_geometry import cell_polygons
+from src.services.h3_store import H3TimeSeries, timeseries_path
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -13,6 +16,40 @@ def load_point_geojson(input_path: str) -> dict:
     with open(input_path, 'r') as f:
         return json.load(f)
 
+def build_metadata(cell_count: int, years: range) -> dict:
+    """Return the dataset metadata shared by the GeoJSON and columnar outputs"""
+    return {
+        'dataset': 'Desertification Data',
+        'cell_count': cell_count,
+        'year_count': len(years),
+        'h3_resolution': 3,
+        'temporal_range': {
+            'start': min(years),
+            'end': max(years),
+            'interval': 'yearly'
+        },
+        'metrics': {
+            'desertification': {
+                'name': 'Desertification',
+                'description': 'Desertification indicator value',
+                'unit': 'binary'
+            }
+        }
+    }
+
+def convert_to_columnar_timeseries(point_geojson: dict, start_year: int = 2001, end_year: int = 2015) -> H3TimeSeries:
+    """Convert point-based GeoJSON to a columnar H3 time series"""
+    years = range(start_year, end_year + 1)
+    records = {}
+    for feature in point_geojson['features']:
+        h3_index = feature['properties']['h3_cell']
+        value = feature['properties']['value']
+        for year in years:
+            records[(h3_index, year)] = {'desertification': value}
+    
+    cell_count = len(set(h3_index for h3_index, _ in records.keys()))
+    return H3TimeSeries.from_records(records, years, metadata=build_metadata(cell_count, years))
+
 def convert_to_h3_timeseries(point_geojson: dict, start_year: int = 2001, end_year: int = 2015) -> dict:
     """Convert point-based GeoJSON to H3-based timeseries GeoJSON"""
     
@@ -27,65 +64,48 @@ def convert_to_h3_timeseries(point_geojson: dict, start_year: int = 2001, end_ye
     features = []
     years = range(start_year, end_year + 1)
     
-    for h3_index, value in h3_values.items():
-        # Get cell boundary
-        try:
-            boundary = h3.cell_to_boundary(h3_index)
-            # Convert to GeoJSON coordinate format (lon, lat) and close the polygon
-            coordinates = [[[vertex[1], vertex[0]] for vertex in boundary]]
-            coordinates[0].append(coordinates[0][0])
-            
-            # Create a feature for each year
-            for year in years:
-                feature = {
-                    'type': 'Feature',
-                    'geometry': {
-                        'type': 'Polygon',
-                        'coordinates': coordinates
-                    },
-                    'properties': {
-                        'h3_index': h3_index,
-                        'year': year,
-                        'timestamp': datetime(year, 1, 1).isoformat(),
-                        'metrics': {
-                            'desertification': value
-                        }
+    # Get every cell boundary at once, skipping indexes that are not valid cells
+    valid_cells = []
+    for h3_index in h3_values:
+        if h3.is_valid_cell(h3_index):
+            valid_cells.append(h3_index)
+        else:
+            logger.warning(f"Error processing H3 cell {h3_index}: not a valid cell")
+    polygons = cell_polygons(valid_cells)
+
+    for h3_index, coordinates in zip(valid_cells, polygons):
+        value = h3_values[h3_index]
+        # Create a feature for each year
+        for year in years:
+            feature = {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Polygon',
+                    'coordinates': coordinates
+                },
+                'properties': {
+                    'h3_index': h3_index,
+                    'year': year,
+                    'timestamp': datetime(year, 1, 1).isoformat(),
+                    'metrics': {
+                        'desertification': value
                     }
                 }
-                features.append(feature)
-                
-        except Exception as e:
-            logger.warning(f"Error processing H3 cell {h3_index}: {e}")
-            continue
+            }
+            features.append(feature)
 
     # Create output GeoJSON structure
     output_geojson = {
         'type': 'FeatureCollection',
         'features': features,
-        'metadata': {
-            'dataset': 'Desertification Data',
-            'cell_count': len(h3_values),
-            'year_count': len(years),
-            'h3_resolution': 3,
-            'temporal_range': {
-                'start': min(years),
-                'end': max(years),
-                'interval': 'yearly'
-            },
-            'metrics': {
-                'desertification': {
-                    'name': 'Desertification',
-                    'description': 'Desertification indicator value',
-                    'unit': 'binary'
-                }
-            }
-        }
+        'metadata': build_metadata(len(h3_values), years)
     }
     
     return output_geojson
 
-def convert_points_to_h3_timeseries(input_path: str, output_path: str, country: str = None):
-    """Main function to convert point GeoJSON to H3 timeseries GeoJSON"""
+def convert_points_to_h3_timeseries(input_path: str, output_path: str, country: str = None,
+                                    output_format: str = 'h3ts'):
+    """Main function to convert point GeoJSON to an H3 timeseries dataset"""
     try:
         # Load input data
         point_geojson = load_point_geojson(input_path)
@@ -94,20 +114,24 @@ def convert_points_to_h3_timeseries(input_path: str, output_path: str, country:
         if country:
             point_geojson = filter_geojson_by_country(point_geojson, country)
         
-        # Convert to H3 timeseries format
-        h3_geojson = convert_to_h3_timeseries(point_geojson)
-        
         # Modify output path to include country name if specified
         if country:
             output_path = str(Path(output_path).parent / f"{Path(output_path).stem}_{country.lower()}{Path(output_path).suffix}")
         
-        # Ensure output directory exists
-        output_dir = Path(output_path).parent
-        output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Save output
-        with open(output_path, 'w') as f:
-            json.dump(h3_geojson, f)
+        if output_format == 'h3ts':
+            # Columnar output: one cell column, no stored geometry
+            output_path = convert_to_columnar_timeseries(point_geojson).save(timeseries_path(output_path))
+        else:
+            # Convert to H3 timeseries format
+            h3_geojson = convert_to_h3_timeseries(point_geojson)
+            
+            # Ensure output directory exists
+            output_dir = Path(output_path).parent
+            output_dir.mkdir(parents=True, exist_ok=True)
+            
+            # Save output
+            with open(output_path, 'w') as f:
+                json.dump(h3_geojson, f)
             
         logger.info(f"Successfully converted and saved H3 timeseries data to {output_path}")
         
@@ -125,7 +149,9 @@ if __name__ == "__main__":
                       help='Output H3 timeseries GeoJSON file path')
     parser.add_argument('--country', choices=['Somalia'],  # Add more countries as boundary data becomes available
                       help='Country to filter data for')
+    parser.add_argument('--format', choices=['h3ts', 'geojson'], default='h3ts',
+                      help='Output format: columnar H3 time series or per-year GeoJSON features')
     
     args = parser.parse_args()
     
-    convert_points_to_h3_timeseries(args.input, args.output, args.country)
\ No newline at end of file
+    convert_points_to_h3_timeseries(args.input, args.output, args.country, args.format)
\ No newline at end of file
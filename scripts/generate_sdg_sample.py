@@ -5,6 +5,9 @@ from datetime import datetime
 import logging
 import random
 from scipy import stats
+import bootstrap  # noqa: F401  (puts src and utils on sys.path)
+from src.services.h3_geometry import cell_polygons
+from src.services.h3_store import H3TimeSeries, timeseries_path
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,7 +37,7 @@ def calculate_change_rate(values):
     years = len(values) - 1
     return (total_change / years) * 100
 
-def generate_panama_sdg_data():
+def generate_panama_sdg_data(output_format: str = 'h3ts'):
     """Generate multidimensional SDG 15.3.1 data for Panama using H3 grid for years 2001-2015"""
     
     # Panama's approximate bounding box
@@ -85,6 +88,7 @@ def generate_panama_sdg_data():
     }
     
     features = []
+    records = {}
     center_lat = (bounds['min_lat'] + bounds['max_lat']) / 2
     center_lng = (bounds['min_lng'] + bounds['max_lng']) / 2
 
@@ -101,9 +105,6 @@ def generate_panama_sdg_data():
     # Generate data for each hexagon at each year
     for hex_id in hexagons:
         cell_center = h3.cell_to_latlng(hex_id)
-        boundary = h3.cell_to_boundary(hex_id)
-        coordinates = [[[vertex[1], vertex[0]] for vertex in boundary]]
-        coordinates[0].append(coordinates[0][0])
         
         # Base values for this hexagon
         dist_from_center = np.sqrt(
@@ -159,46 +160,62 @@ def generate_panama_sdg_data():
                     metric_values["trend"] = "Insufficient Data"
                     metric_values["confidence_score"] = 0.0
             
+            records[(hex_id, timestamp.year)] = metric_values
+    
+    metadata = {
+        'dataset': 'SDG 15.3.1 Land Degradation',
+        'region': 'Panama',
+        'cell_count': len(hexagons),
+        'year_count': len(years),
+        'h3_resolution': resolution,
+        'temporal_range': {
+            'start': timestamps[0].isoformat(),
+            'end': timestamps[-1].isoformat(),
+            'interval': 'yearly'
+        },
+        'bounds': bounds,
+        'metrics': metrics
+    }
+    
+    output_path = 'data/sdg_panama_sample.geojson'
+    if output_format == 'h3ts':
+        # Columnar output: one cell column, no stored geometry
+        output_path = H3TimeSeries.from_records(records, years, metadata=metadata).save(timeseries_path(output_path))
+    else:
+        polygons = dict(zip(hexagons, cell_polygons(hexagons)))
+        for (hex_id, year), metric_values in records.items():
             feature = {
                 'type': 'Feature',
                 'geometry': {
                     'type': 'Polygon',
-                    'coordinates': coordinates
+                    'coordinates': polygons[hex_id]
                 },
                 'properties': {
                     'h3_index': hex_id,
                     'metrics': metric_values,
-                    'timestamp': timestamp.isoformat(),
-                    'year': timestamp.year
+                    'timestamp': datetime(year, 1, 1).isoformat(),
+                    'year': year
                 }
             }
             features.append(feature)
-    
-    geojson = {
-        'type': 'FeatureCollection',
-        'features': features,
-        'metadata': {
-            'dataset': 'SDG 15.3.1 Land Degradation',
-            'region': 'Panama',
-            'cell_count': len(hexagons),
-            'year_count': len(years),
-            'h3_resolution': resolution,
-            'temporal_range': {
-                'start': timestamps[0].isoformat(),
-                'end': timestamps[-1].isoformat(),
-                'interval': 'yearly'
-            },
-            'bounds': bounds,
-            'metrics': metrics
+        
+        geojson = {
+            'type': 'FeatureCollection',
+            'features': features,
+            'metadata': metadata
         }
-    }
-    
-    output_path = 'data/sdg_panama_sample.geojson'
-    with open(output_path, 'w') as f:
-        json.dump(geojson, f)
+        with open(output_path, 'w') as f:
+            json.dump(geojson, f)
     
-    logger.info(f"Saved dataset to {output_path} with {len(features)} total features across {len(years)} years")
+    logger.info(f"Saved dataset to {output_path} with {len(records)} cell-years across {len(years)} years")
     return output_path
 
 if __name__ == "__main__":
-    generate_panama_sdg_data()
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Generate the SDG 15.3.1 Panama sample dataset')
+    parser.add_argument('--format', choices=['h3ts', 'geojson'], default='h3ts',
+                      help='Output format: columnar H3 time series or per-year GeoJSON features')
+    
+    args = parser.parse_args()
+    generate_panama_sdg_data(args.format)
\ No newline at end of file
@@ -1,47 +1,24 @@
-import rasterio
 import h3
-import numpy as np
-from shapely.geometry import Point
 import geopandas as gpd
+import bootstrap  # noqa: F401  (puts src and utils on sys.path)
+from src.services.raster_h3 import DEFAULT_MIN_PIXELS_PER_CELL, raster_to_cells
 
-def raster_to_h3(raster_path, h3_resolution):
-    # Load the raster
-    with rasterio.open(raster_path) as src:
-        raster_data = src.read(1)  # Read the first band
-        transform = src.transform
+# Stored in the manifest; bump it when the output changes so old conversions are redone
+CONVERTER_VERSION = 1
 
-        # breakpoint()
-        # Loop through each pixel in the raster
-        last_seen = {}
-        for row in range(src.height):
-            for col in range(src.width):
-                # Get the pixel value
-                value = raster_data[row, col]
-
-                # Only consider valid values (not nodata)
-                if value != src.nodata:
-                    # Convert pixel coordinates to geographic coordinates
-                    lon, lat = transform * (col, row)
-
-                    # Get H3 cell for the lat/lon at specified resolution
-                    h3_cell = h3.latlng_to_cell(lat, lon, h3_resolution)
-                    if h3_cell in last_seen.keys():
-                        last_seen[h3_cell].append(value)
-                        continue
-                    else:
-                        last_seen[h3_cell] = [value]
-
-
-        # Store the result as dictionary with cell and value
-        h3_cells = [
-            {
-                'h3_index': h3_cell,
-                "year": 2015,
-                "timestamp": "2015-01-01T00:00:00",
-                'productivity': max(values)
-            } for h3_cell, values in last_seen.items()
-        ]
+def raster_to_h3(raster_path, h3_resolution, min_pixels_per_cell=DEFAULT_MIN_PIXELS_PER_CELL):
+    # Aggregate the valid pixels into their H3 cells; reads are only decimated with --min-pixels-per-cell
+    aggregates, _ = raster_to_cells(raster_path, h3_resolution, min_pixels_per_cell=min_pixels_per_cell)
 
+    # Store the result as dictionary with cell and value
+    h3_cells = [
+        {
+            'h3_index': h3_cell,
+            "year": 2015,
+            "timestamp": "2015-01-01T00:00:00",
+            'productivity': value
+        } for h3_cell, value in zip(aggregates.cell_ids, aggregates.maximums.tolist())
+    ]
 
     return h3_cells
 
@@ -49,10 +26,34 @@ def raster_to_h3(raster_path, h3_resolution):
 
 if __name__ == "__main__":
     import sys
-    raster_path = sys.argv[1]
-    h3_path = sys.argv[2]
-    h3_resolution = 3 if len(sys.argv) < 4 else int(sys.argv[3])
-    h3_data = raster_to_h3(raster_path, h3_resolution)
+    import argparse
+    from src.services.conversion_manifest import ConversionManifest, default_manifest_path
+
+    parser = argparse.ArgumentParser(description='Aggregate a raster into H3 cell points')
+    parser.add_argument('raster_path', help='Input raster file')
+    parser.add_argument('h3_path', help='Output GeoJSON file')
+    parser.add_argument('h3_resolution', type=int, nargs='?', default=3, help='H3 resolution (0-15)')
+    parser.add_argument('--min-pixels-per-cell', type=int, default=DEFAULT_MIN_PIXELS_PER_CELL,
+                        help='Read decimated, keeping about this many block-averaged samples per '
+                             'H3 cell (e.g. 1024). Much faster for coarse resolutions, but cell '
+                             'values become approximate (mean error ~0.0007, max ~0.017 on a 0-1 '
+                             'raster at factor 12). Default 0 reads every pixel')
+    parser.add_argument('--manifest', default=None,
+                        help='Path of the conversion manifest (default: next to the output)')
+    parser.add_argument('--force', action='store_true', help='Convert even if the input is unchanged')
+    parser.add_argument('--hash', action='store_true',
+                        help='Compare input content hashes, not only size and modification time')
+    args = parser.parse_args()
+    raster_path, h3_path, h3_resolution = args.raster_path, args.h3_path, args.h3_resolution
+
+    manifest = ConversionManifest(args.manifest or default_manifest_path(h3_path), args.hash)
+    params = {'resolution': h3_resolution, 'min_pixels_per_cell': args.min_pixels_per_cell,
+              'converter_version': CONVERTER_VERSION}
+    if not args.force and manifest.is_current('raster2h3', [raster_path], [h3_path], params):
+        print(f"{h3_path} is up to date with {raster_path}")
+        sys.exit(0)
+
+    h3_data = raster_to_h3(raster_path, h3_resolution, args.min_pixels_per_cell)
     # Convert to a GeoDataFrame for easy export and visualization
     gdf = gpd.GeoDataFrame(
         h3_data,
@@ -63,3 +64,5 @@ if __name__ == "__main__":
 
     # Optional: Save to a file
     gdf.to_file(h3_path, driver="GeoJSON")
+    manifest.record('raster2h3', [raster_path], [h3_path], params, cells=len(h3_data))
+    manifest.save()
@@ -0,0 +1,286 @@
+import geopandas as gpd
+import h3
+import json
+import logging
+import os
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Also run as a plain file; bootstrap makes src importable
+import sys
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import bootstrap  # noqa: E402,F401
+from src.services.h3_geometry import cell_polygons, to_cell_ints
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Dissolved boundaries are simplified to ~10 m, far below the H3 cell sizes they are used with
+SIMPLIFY_TOLERANCE = 0.0001
+
+BOUNDARY_CACHE_DIR = os.getenv('BOUNDARY_CACHE_DIR', 'scripts/data/boundary_cache')
+INDEX_FILENAME = 'index.json'
+REGISTRY_VERSION = 1
+
+# Boundary files ingested on first use of a country they cover, when present
+DEFAULT_SOURCES = [
+    {'path': 'scripts/data/geoBoundaries-SOM-ADM2-all/geoBoundaries-SOM-ADM2.geojson', 'country': 'Somalia'},
+    {'path': 'scripts/data/ne_10m_admin_0_countries/ne_10m_admin_0_countries.shp'}
+]
+
+# Natural Earth admin-0 columns holding the country name and ISO 3166 alpha-3 code, in order of preference
+NATURAL_EARTH_NAME_FIELDS = ['ADMIN', 'NAME_LONG', 'NAME']
+NATURAL_EARTH_ISO_FIELDS = ['ISO_A3', 'ADM0_A3']
+
+def _file_stamp(path: Path) -> Optional[Dict[str, int]]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def country_columns(gdf: gpd.GeoDataFrame, country: str = None) -> Tuple[List[str], List[str]]:
+    """Return the country name and ISO code of every row of a geoBoundaries or Natural Earth file.
+
+    geoBoundaries files cover one country (shapeGroup is its ISO code) and
+    only ADM0 files name it, so country overrides the name of such a file.
+    """
+    if 'shapeGroup' in gdf.columns:
+        isos = gdf['shapeGroup'].astype(str).tolist()
+        if country:
+            names = [country] * len(gdf)
+        elif 'shapeType' in gdf.columns and (gdf['shapeType'] == 'ADM0').all():
+            names = gdf['shapeName'].astype(str).tolist()
+        else:
+            names = isos
+        return names, isos
+
+    name_field = next((field for field in NATURAL_EARTH_NAME_FIELDS if field in gdf.columns), None)
+    if name_field is None:
+        if not country:
+            raise ValueError("Boundary file has no known country name column; pass the country")
+        return [country] * len(gdf), [''] * len(gdf)
+    names = gdf[name_field].astype(str).tolist()
+    isos = [''] * len(gdf)
+    # Natural Earth marks missing codes as -99
+    for field in reversed([field for field in NATURAL_EARTH_ISO_FIELDS if field in gdf.columns]):
+        isos = [code if code and code != '-99' else iso for code, iso in zip(gdf[field].astype(str).tolist(), isos)]
+    return names, isos
+
+def intersecting_cells(boundary, resolution: int) -> np.ndarray:
+    """Return the sorted cells at a resolution whose hexagon intersects the boundary"""
+    h3shape = h3.geo_to_h3shape(boundary.__geo_interface__)
+    inside = to_cell_ints(h3.h3shape_to_cells_experimental(h3shape, resolution, 'full'))
+    overlap = to_cell_ints(h3.h3shape_to_cells_experimental(h3shape, resolution, 'overlap'))
+    # Cells straddling the border, plus their neighbours in case H3's spherical
+    # edges and the planar boundary disagree, get the exact geometric test
+    border = np.setdiff1d(overlap, inside)
+    candidates = set(border.tolist())
+    for cell in border.tolist():
+        candidates.update(h3.api.basic_int.grid_ring(cell, 1))
+    candidates = np.setdiff1d(to_cell_ints(list(candidates)), inside)
+    if not len(candidates):
+        return inside
+    hexagons = np.array([Polygon(polygon[0]) for polygon in cell_polygons(candidates)], dtype=object)
+    touching = candidates[shapely.intersects(boundary, hexagons)]
+    return np.union1d(inside, touching)
+
+class BoundaryRegistry:
+    """Country boundaries ingested once from geoBoundaries or Natural Earth files.
+
+    Every country is dissolved, simplified and stored as WKB in an .npz file
+    in the registry directory, together with the sorted uint64 ids of the H3
+    cells intersecting it at each resolution asked for so far. An index maps
+    country names and ISO codes to those files and records the source file,
+    which is re-ingested when it changes. Loading a country reads only its
+    .npz file.
+    """
+
+    def __init__(self, directory: str = BOUNDARY_CACHE_DIR, sources: List[Dict[str, str]] = None):
+        self.directory = Path(directory)
+        self.sources = DEFAULT_SOURCES if sources is None else sources
+        self._index = None
+        self._boundaries: Dict[str, Any] = {}
+        self._cell_sets: Dict[Tuple[str, int], FrozenSet[int]] = {}
+
+    @property
+    def index(self) -> Dict[str, Any]:
+        if self._index is None:
+            self._index = {'version': REGISTRY_VERSION, 'countries': {}, 'aliases': {}}
+            try:
+                with open(self.directory / INDEX_FILENAME) as f:
+                    index = json.load(f)
+                if index.get('version') == REGISTRY_VERSION:
+                    self._index = index
+            except (OSError, ValueError):
+                pass
+        return self._index
+
+    def _save_index(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.directory / (INDEX_FILENAME + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.directory / INDEX_FILENAME)
+
+    def _write_arrays(self, key: str, arrays: Dict[str, np.ndarray]) -> None:
+        path = self.directory / f"{key}.npz"
+        tmp_path = self.directory / f"{key}.tmp.npz"
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    def _read_arrays(self, key: str) -> Dict[str, np.ndarray]:
+        with np.load(self.directory / f"{key}.npz") as data:
+            return {name: data[name] for name in data.files}
+
+    def countries(self) -> List[str]:
+        return sorted(entry['name'] for entry in self.index['countries'].values())
+
+    def ingest(self, path: str, country: str = None, resolutions: Iterable[int] = ()) -> List[str]:
+        """Register every country of a boundary file, replacing earlier versions of them"""
+        source = Path(path).resolve()
+        stamp = _file_stamp(source)
+        if stamp is None:
+            raise FileNotFoundError(f"Boundary file not found at {source}")
+
+        gdf = gpd.read_file(str(source))
+        if gdf.crs is not None and gdf.crs != 'EPSG:4326':
+            gdf = gdf.to_crs(epsg=4326)
+        names, isos = country_columns(gdf, country)
+        gdf = gdf.assign(_name=names, _iso=isos)
+
+        registered = []
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for (name, iso), rows in gdf.groupby(['_name', '_iso'], sort=False):
+            # Dissolve all administrative boundaries into a single polygon
+            boundary = shapely.union_all(rows.geometry.values).simplify(SIMPLIFY_TOLERANCE)
+            key = (iso or name).lower().replace(' ', '_')
+            self._write_arrays(key, {'wkb': np.frombuffer(shapely.to_wkb(boundary), dtype=np.uint8)})
+            self.index['countries'][key] = {
+                'name': name,
+                'iso': iso,
+                'source': str(source),
+                'source_country': country,
+                'stamp': stamp,
+                'tolerance': SIMPLIFY_TOLERANCE,
+                'bounds': list(boundary.bounds),
+                'resolutions': []
+            }
+            for alias in (name, iso):
+                if alias:
+                    self.index['aliases'][alias.lower()] = key
+            self._boundaries.pop(key, None)
+            for cached in [cached for cached in self._cell_sets if cached[0] == key]:
+                del self._cell_sets[cached]
+            registered.append(name)
+        self._save_index()
+        logger.info(f"Registered {len(registered)} country boundaries from {source}")
+
+        for name in registered:
+            for resolution in resolutions:
+                self.cell_set(name, resolution)
+        return registered
+
+    def _is_current(self, key: str) -> bool:
+        entry = self.index['countries'][key]
+        stamp = _file_stamp(Path(entry['source']))
+        # A registry shipped without its sources stays valid
+        return stamp is None or (stamp == entry['stamp'] and entry['tolerance'] == SIMPLIFY_TOLERANCE)
+
+    def _key(self, country: str) -> str:
+        """Return the registry key of a country, ingesting its source if it is missing or stale"""
+        key = self.index['aliases'].get(country.lower())
+        if key is not None:
+            if self._is_current(key):
+                return key
+            # Another process may have re-ingested the source already
+            self._index = None
+            key = self.index['aliases'].get(country.lower())
+            if key is not None and self._is_current(key):
+                self._boundaries.pop(key, None)
+                for cached in [cached for cached in self._cell_sets if cached[0] == key]:
+                    del self._cell_sets[cached]
+                return key
+            entry = self.index['countries'][key]
+            self.ingest(entry['source'], entry.get('source_country'))
+            return self.index['aliases'][country.lower()]
+
+        for source in self.sources:
+            source_path = Path(source['path'])
+            if source.get('country') and source['country'].lower() != country.lower():
+                continue
+            if source_path.exists() and str(source_path.resolve()) not in {
+                entry['source'] for entry in self.index['countries'].values()
+            }:
+                self.ingest(str(source_path), source.get('country'))
+                if country.lower() in self.index['aliases']:
+                    return self.index['aliases'][country.lower()]
+        raise ValueError(f"Boundary data not available for {country}")
+
+    def boundary(self, country: str):
+        """Return the prepared, simplified boundary of a country"""
+        key = self._key(country)
+        if key not in self._boundaries:
+            boundary = shapely.from_wkb(self._read_arrays(key)['wkb'].tobytes())
+            shapely.prepare(boundary)
+            self._boundaries[key] = boundary
+        return self._boundaries[key]
+
+    def bounds(self, country: str) -> Tuple[float, float, float, float]:
+        """Return min_lng, min_lat, max_lng, max_lat of a country"""
+        return tuple(self.index['countries'][self._key(country)]['bounds'])
+
+    def cell_set(self, country: str, resolution: int) -> FrozenSet[int]:
+        """Return the integer ids of every cell at a resolution intersecting a country"""
+        key = self._key(country)
+        if (key, resolution) in self._cell_sets:
+            return self._cell_sets[(key, resolution)]
+
+        arrays = self._read_arrays(key)
+        name = f"res_{resolution}"
+        if name not in arrays:
+            cells = intersecting_cells(self.boundary(country), resolution)
+            arrays[name] = cells
+            self._write_arrays(key, arrays)
+            entry = self.index['countries'][key]
+            entry['resolutions'] = sorted(set(entry['resolutions']) | {resolution})
+            self._save_index()
+            logger.info(f"Computed {len(cells)} resolution {resolution} cells for {entry['name']}")
+
+        self._cell_sets[(key, resolution)] = frozenset(arrays[name].tolist())
+        return self._cell_sets[(key, resolution)]
+
+    def contains_points(self, country: str, lngs: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """Return a mask of the points lying inside a country"""
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        min_lng, min_lat, max_lng, max_lat = self.bounds(country)
+        mask = (lngs >= min_lng) & (lngs <= max_lng) & (lats >= min_lat) & (lats <= max_lat)
+        # Only points within the bounding box get the exact test
+        mask[mask] = shapely.contains_xy(self.boundary(country), lngs[mask], lats[mask])
+        return mask
+
+_registry = None
+
+def get_boundary_registry() -> BoundaryRegistry:
+    """Return the process-wide boundary registry"""
+    global _registry
+    if _registry is None:
+        _registry = BoundaryRegistry()
+    return _registry
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Register country boundaries from geoBoundaries or Natural Earth files')
+    parser.add_argument('path', help='geoBoundaries GeoJSON or Natural Earth admin-0 file')
+    parser.add_argument('--country', default=None,
+                        help='Country name for geoBoundaries ADM1/ADM2 files, which do not name their country')
+    parser.add_argument('--resolutions', type=int, nargs='*', default=[],
+                        help='H3 resolutions to precompute cell sets for')
+
+    args = parser.parse_args()
+    get_boundary_registry().ingest(args.path, args.country, args.resolutions)
@@ -1,62 +1,98 @@
-import geopandas as gpd
-from shapely.geometry import shape, Point, Polygon
+import h3
 import logging
-from pathlib import Path
+import numpy as np
+import shapely
+from shapely.geometry import shape, Point, Polygon
+from typing import Dict, FrozenSet
+
+from utils.boundary_registry import get_boundary_registry
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def load_country_boundary(country: str) -> Polygon:
-    """Load country boundary from geoBoundaries file"""
-    if country.lower() == 'somalia':
-        boundary_path = Path("scripts/data/geoBoundaries-SOM-ADM2-all/geoBoundaries-SOM-ADM2.geojson").resolve()
-    else:
-        raise ValueError(f"Boundary data not available for {country}")
-    
+    """Load country boundary from the boundary registry.
+
+    The registry dissolves and simplifies the source file once and stores the
+    result, so this is a fast read after the first use. The returned geometry
+    is prepared for fast repeated predicates.
+    """
     try:
-        # Check if file exists
-        if not boundary_path.exists():
-            raise FileNotFoundError(f"Boundary file not found at {boundary_path}")
-            
-        # Read the GeoJSON file
-        gdf = gpd.read_file(str(boundary_path))
-        
-        # Dissolve all administrative boundaries into a single polygon
-        country_boundary = gdf.dissolve().geometry.iloc[0]
-        logger.info(f"Successfully loaded boundary for {country}")
+        country_boundary = get_boundary_registry().boundary(country)
+        logger.debug(f"Loaded boundary for {country}")
         return country_boundary
     except Exception as e:
         logger.error(f"Error loading boundary for {country}: {e}")
         raise
 
+def country_cell_set(country: str, resolution: int) -> FrozenSet[int]:
+    """Return the integer ids of every cell at a resolution intersecting a country"""
+    return get_boundary_registry().cell_set(country, resolution)
+
+def country_bounds(country: str) -> Dict[str, float]:
+    """Return the bounding box of a country's boundary"""
+    lon_min, lat_min, lon_max, lat_max = get_boundary_registry().bounds(country)
+    return {'lat_min': lat_min, 'lat_max': lat_max, 'lon_min': lon_min, 'lon_max': lon_max}
+
+def points_in_country(lngs: np.ndarray, lats: np.ndarray, country: str) -> np.ndarray:
+    """Return a mask of the points lying inside the country boundary"""
+    return get_boundary_registry().contains_points(country, lngs, lats)
+
+def cell_in_country(h3_index: str, country: str) -> bool:
+    """Return whether an H3 cell's hexagon intersects the country boundary"""
+    return h3.str_to_int(h3_index) in country_cell_set(country, h3.get_resolution(h3_index))
+
 def filter_geojson_by_country(geojson: dict, country: str) -> dict:
-    """Filter GeoJSON features that intersect with country boundary"""
+    """Filter GeoJSON features that intersect with country boundary.
+
+    Features carrying a valid h3_index are looked up in the country's cell
+    set; any other feature is tested against the prepared boundary.
+    """
     try:
         # Load country boundary
         country_boundary = load_country_boundary(country)
-        
+
         # Filter features
-        filtered_features = []
-        for feature in geojson['features']:
-            # Convert feature geometry to shape
-            feature_shape = shape(feature['geometry'])
-            
-            # Check if feature intersects with country boundary
-            if feature_shape.intersects(country_boundary):
-                filtered_features.append(feature)
-        
+        features = geojson['features']
+        keep = np.zeros(len(features), dtype=bool)
+        shapes, shape_positions = [], []
+        for position, feature in enumerate(features):
+            h3_index = (feature.get('properties') or {}).get('h3_index')
+            if isinstance(h3_index, str) and h3.is_valid_cell(h3_index):
+                keep[position] = cell_in_country(h3_index, country)
+            else:
+                shapes.append(shape(feature['geometry']))
+                shape_positions.append(position)
+
+        # Check if the remaining features intersect with country boundary in one vectorized call
+        if shapes:
+            keep[shape_positions] = shapely.intersects(country_boundary, np.array(shapes, dtype=object))
+        filtered_features = [feature for feature, kept in zip(features, keep.tolist()) if kept]
+
         # Create new GeoJSON with filtered features
         filtered_geojson = geojson.copy()
         filtered_geojson['features'] = filtered_features
-        
+
         # Update metadata if it exists
         if 'metadata' in filtered_geojson:
             filtered_geojson['metadata']['cell_count'] = len(filtered_features)
             filtered_geojson['metadata']['country'] = country
-        
+
         logger.info(f"Filtered GeoJSON to {len(filtered_features)} features for {country}")
         return filtered_geojson
-    
+
     except Exception as e:
         logger.error(f"Error filtering GeoJSON for {country}: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def filter_h3_cells_by_country(cells, country: str) -> list:
+    """Return the H3 cells whose hexagon intersects the country boundary"""
+    try:
+        filtered_cells = [h3_index for h3_index in cells if cell_in_country(h3_index, country)]
+
+        logger.info(f"Filtered H3 cells to {len(filtered_cells)} for {country}")
+        return filtered_cells
+
+    except Exception as e:
+        logger.error(f"Error filtering H3 cells for {country}: {e}")
+        raise
@@ -1,11 +1,16 @@
 from flask import Flask, render_template, jsonify, url_for, request, Response, stream_with_context, send_from_directory
 from flask_cors import CORS
-from src.services.map_service import MapService
-from src.services.dataset_service import DatasetService
+from src.services.dataset_registry import get_dataset_service
+from src.services.dataset_index import parse_bbox, parse_polygon, to_h3_cell_collection
+from src.services.classification import SCHEMES, COLOR_RAMPS, DEFAULT_CLASSES, MAX_CLASSES, apply_legend
+from src.services.tile_service import TileService
+from src.services.json_stream import gzip_chunks
 from src.services.data_agent import DataAgent
 from dotenv import load_dotenv
+import itertools
+import math
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 import traceback
 from werkzeug.utils import secure_filename
 import json
@@ -55,8 +60,16 @@ CORS(app)
 # Validate environment variables
 validate_environment()
 
-map_service = MapService()
-dataset_service = DatasetService()
+dataset_service = get_dataset_service()
+# One MapService per process, so its SDG sample and pattern caches are shared
+map_service = dataset_service.map_service
+tile_service = TileService(dataset_service)
+
+# Load and index datasets once per worker instead of on the first request
+try:
+    dataset_service.warm_up()
+except Exception as e:
+    logger.error(f"Failed to warm dataset registry: {str(e)}")
 
 # Helper function to run async code in Flask
 def async_route(f):
@@ -149,29 +162,78 @@ def get_water_management_policy():
         else:
             timestamp = datetime.now()
             
-        # Load the SDG sample data with the timestamp
-        data = map_service.load_sdg_sample()
-        
-        # Update the features with time-based patterns
-        if data and 'features' in data:
-            for feature in data['features']:
-                h3_index = feature['properties']['h3_index']
-                pattern = map_service._generate_cell_pattern(h3_index, timestamp)
-                
-                # Debug log for color values
-                logger.debug(f"Generated color for hex {h3_index}: {pattern.get('color')}")
-                
-                # Ensure color is present and valid
-                if 'color' not in pattern or not pattern['color'].startswith('#'):
-                    pattern['color'] = '#ff0000'  # Default to red if invalid
-                    
-                feature['properties'].update(pattern)
-        
+        # Load the cached SDG sample data with time-based patterns for the timestamp
+        data = map_service.load_water_management_layer(timestamp)
         return jsonify(data)
     except Exception as e:
         logger.error(f"Error in get_water_management_policy: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Upper bound on frames per request; a year of daily frames fits
+MAX_ANIMATION_FRAMES = 366
+
+def parse_number(name, default=None):
+    """Read an optional finite number, rejecting values that do not parse"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        number = float(value)
+    except ValueError:
+        number = math.nan
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be a number")
+    return number
+
+def parse_timestamp(name, default):
+    """Read an optional ISO timestamp; the animation ignores time zones"""
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 timestamp")
+
+def parse_frame_timestamps():
+    """Read the start, end and step_days of an animation into its frame timestamps"""
+    start = parse_timestamp('start', datetime(datetime.now().year, 1, 1))
+    end = parse_timestamp('end', start + timedelta(days=365))
+    step_days = parse_number('step_days', 7.0)
+    if step_days <= 0:
+        raise ValueError("step_days must be positive")
+    if end < start:
+        raise ValueError("end must not be before start")
+    step = timedelta(days=step_days)
+    count = int((end - start) / step) + 1
+    if count > MAX_ANIMATION_FRAMES:
+        raise ValueError(f"at most {MAX_ANIMATION_FRAMES} frames per request, got {count}")
+    return [start + i * step for i in range(count)]
+
+@app.route('/api/map/policy/water_management/frames')
+def get_water_management_frames():
+    """Return an animation as one keyframe followed by frames of changed cells only"""
+    try:
+        timestamps = parse_frame_timestamps()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        def build():
+            data = map_service.load_sdg_sample()
+            return {
+                'type': 'AnimationFrames',
+                'frames': map_service.generate_pattern_frames(data, timestamps)
+            }
+
+        # Start, step and count fix every frame timestamp; end alone does not
+        step = (timestamps[1] - timestamps[0]) if len(timestamps) > 1 else timedelta(0)
+        key = ('water_management_frames', timestamps[0].isoformat(), step, len(timestamps))
+        payload = dataset_service.get_encoded_payload(key, ['sdg_panama_sample'], build)
+        return encoded_response(payload)
+    except Exception as e:
+        logger.error(f"Error in get_water_management_frames: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/process_hypothesis', methods=['POST'])
 def process_hypothesis():
     data = request.get_json()
@@ -186,24 +248,24 @@ def process_hypothesis():
 @app.route('/send-to-map', methods=['POST'])
 def send_to_map():
     try:
-        dataset_service = DatasetService()
-        datasets = dataset_service.load_all_geojson_datasets()
-        
-        # Ensure each dataset has the required structure
-        formatted_datasets = []
-        for dataset in datasets:
-            if isinstance(dataset, dict) and 'data' in dataset:
-                # Ensure data has features array
-                if not isinstance(dataset['data'], dict):
-                    dataset['data'] = {'features': []}
-                if 'features' not in dataset['data']:
-                    dataset['data']['features'] = []
-                formatted_datasets.append(dataset)
+        def formatted_datasets():
+            # Ensure each dataset has the required structure
+            for dataset in dataset_service.iter_all_geojson_datasets(lazy=True):
+                if isinstance(dataset, dict) and 'data' in dataset:
+                    # Ensure data has features array
+                    if not isinstance(dataset['data'], dict):
+                        dataset['data'] = {'features': []}
+                    if 'features' not in dataset['data']:
+                        dataset['data']['features'] = []
+                    yield dataset
+
+        def build():
+            return {
+                'datasets': formatted_datasets(),
+                'status': 'success'
+            }
         
-        return jsonify({
-            'status': 'success',
-            'datasets': formatted_datasets
-        })
+        return streamed_response(('send-to-map',), dataset_service.list_dataset_ids(), build)
     except Exception as e:
         error_msg = f"Error in send_to_map: {str(e)}"
         logger.error(error_msg)
@@ -212,15 +274,272 @@ def send_to_map():
             'error': error_msg
         }), 500
 
+def encoded_response(payload, status=200):
+    """Serve a pre-encoded payload, honouring If-None-Match and Accept-Encoding"""
+    body, content_encoding = payload.encoded(request.accept_encodings)
+    etag = payload.etag_for(content_encoding)
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, status=status, mimetype='application/json')
+        if content_encoding:
+            response.headers['Content-Encoding'] = content_encoding
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def streamed_response(key, dataset_ids, build):
+    """Serve a cached payload, or stream the JSON built by build() chunk by chunk.
+
+    build() should put its status member last: a stream that fails after it
+    started cannot change its HTTP status, so it ends with "status": "error".
+    """
+    payload = dataset_service.get_cached_payload(key, dataset_ids)
+    if payload is not None:
+        return encoded_response(payload)
+
+    chunks = dataset_service.stream_payload(key, dataset_ids, build)
+    # Produce the first chunk now, so a failure before any output is still a 500
+    first_chunk = next(chunks, b'')
+    chunks = itertools.chain([first_chunk], chunks)
+    headers = {'Vary': 'Accept-Encoding', 'X-Accel-Buffering': 'no'}
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype='application/json', headers=headers)
+
+def parse_response_format():
+    """Read the response format: GeoJSON features or bare H3 cell records"""
+    response_format = request.args.get('format', 'geojson')
+    if response_format not in ('geojson', 'h3'):
+        raise ValueError("format must be 'geojson' or 'h3'")
+    return response_format
+
+def parse_year():
+    """Read the optional year"""
+    year = request.args.get('year')
+    if year is None or year == '':
+        return None
+    try:
+        return int(year)
+    except ValueError:
+        raise ValueError("year must be an integer")
+
+def parse_zoom():
+    """Read the optional map zoom level"""
+    zoom = parse_number('zoom')
+    if zoom is None:
+        return None
+    if not 0 <= zoom <= 24:
+        raise ValueError("zoom must be between 0 and 24")
+    return zoom
+
+def parse_slice_args():
+    """Read the optional year, metric, bbox, polygon, zoom and geometry slicing parameters"""
+    geometry = request.args.get('geometry', 'polygon')
+    if geometry not in ('polygon', 'none'):
+        raise ValueError("geometry must be 'polygon' or 'none'")
+    return {
+        'year': parse_year(),
+        'metric': request.args.get('metric') or None,
+        'bbox': parse_bbox(request.args.get('bbox')),
+        'polygon': parse_polygon(request.args.get('polygon')),
+        # Map zoom picks the H3 pyramid level, keeping cells per screen roughly constant
+        'zoom': parse_zoom(),
+        # H3 cells carry their own geometry, so the h3 format never ships polygons
+        'include_geometry': geometry == 'polygon' and parse_response_format() == 'geojson'
+    }
+
+def parse_classification(required=False):
+    """Read the optional scheme, classes and ramp parameters that color features by a metric"""
+    scheme = request.args.get('scheme')
+    if not scheme:
+        if not required:
+            return None
+        scheme = 'linear'
+    if scheme not in SCHEMES:
+        raise ValueError(f"scheme must be one of {', '.join(SCHEMES)}")
+    try:
+        classes = int(request.args.get('classes') or DEFAULT_CLASSES)
+    except ValueError:
+        raise ValueError("classes must be an integer")
+    if not 2 <= classes <= MAX_CLASSES:
+        raise ValueError(f"classes must be between 2 and {MAX_CLASSES}")
+    ramp = request.args.get('ramp', 'heat')
+    if ramp not in COLOR_RAMPS:
+        raise ValueError(f"ramp must be one of {', '.join(COLOR_RAMPS)}")
+    return {'scheme': scheme, 'classes': classes, 'ramp': ramp}
+
+def has_slice_args(slice_args):
+    return not slice_args['include_geometry'] or any(
+        value is not None for key, value in slice_args.items() if key != 'include_geometry'
+    )
+
+def slice_cache_key(slice_args):
+    """Return a hashable form of the slicing parameters for payload cache keys"""
+    return tuple(
+        json.dumps(value, sort_keys=True) if isinstance(value, dict) else value
+        for value in slice_args.values()
+    )
+
+def format_dataset(data, response_format):
+    """Convert a sliced FeatureCollection to the requested response format"""
+    if response_format == 'h3' and isinstance(data, dict) and 'error' not in data:
+        return to_h3_cell_collection(data)
+    return data
+
 @app.route('/api/datasets/<dataset_id>/map', methods=['GET'])
 def get_dataset_map(dataset_id):
     try:
-        dataset_service = DatasetService()
-        map_data = dataset_service.load_dataset_for_map(dataset_id)
-        return jsonify(map_data)
+        slice_args = parse_slice_args()
+        response_format = parse_response_format()
+        classification = parse_classification()
+        if classification and not slice_args['metric']:
+            raise ValueError("scheme requires a metric")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if dataset_service.dataset_version(dataset_id) is None:
+            return jsonify(dataset_service.load_dataset_for_map(dataset_id))
+        if response_format == 'h3' and not dataset_service.is_h3_dataset(dataset_id):
+            return jsonify({"error": "format=h3 requires a dataset of H3 cells"}), 400
+
+        def build():
+            if has_slice_args(slice_args):
+                data = dataset_service.load_dataset_slice(dataset_id, **slice_args)
+                if classification and 'error' not in data:
+                    # Breaks come from the whole year, so colors stay stable while panning
+                    legend = dataset_service.load_dataset_legend(
+                        dataset_id, slice_args['metric'], slice_args['year'], slice_args['zoom'], **classification
+                    )
+                    data = apply_legend(data, slice_args['metric'], legend)
+                return format_dataset(data, response_format)
+            return dataset_service.load_dataset_for_map(dataset_id)
+
+        classification_key = tuple(classification.values()) if classification else None
+        payload = dataset_service.get_encoded_payload(
+            ('dataset', dataset_id, response_format, slice_cache_key(slice_args), classification_key),
+            [dataset_id], build
+        )
+        return encoded_response(payload)
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/datasets/<dataset_id>/stats', methods=['GET'])
+def get_dataset_stats(dataset_id):
+    try:
+        slice_args = parse_slice_args()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if dataset_service.dataset_version(dataset_id) is None:
+            return jsonify({"error": "Dataset not found"}), 404
+        slice_args.pop('include_geometry')
+
+        def build():
+            stats = dataset_service.load_dataset_stats(dataset_id, **slice_args)
+            return dict(stats, id=dataset_id)
+
+        payload = dataset_service.get_encoded_payload(
+            ('stats', dataset_id, slice_cache_key(slice_args)), [dataset_id], build
+        )
+        return encoded_response(payload)
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/datasets/<dataset_id>/legend', methods=['GET'])
+def get_dataset_legend(dataset_id):
+    try:
+        metric = request.args.get('metric')
+        if not metric:
+            raise ValueError("metric is required")
+        classification = parse_classification(required=True)
+        year = parse_year()
+        zoom = parse_zoom()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if dataset_service.dataset_version(dataset_id) is None:
+            return jsonify({"error": "Dataset not found"}), 404
+        return jsonify(dataset_service.load_dataset_legend(dataset_id, metric, year, zoom, **classification))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/legend', methods=['GET'])
+def get_metric_legend():
+    try:
+        metric = request.args.get('metric')
+        if not metric:
+            raise ValueError("metric is required")
+        classification = parse_classification(required=True)
+        year = parse_year()
+        zoom = parse_zoom()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        return jsonify(dataset_service.load_metric_legend(metric, year, zoom, **classification))
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/datasets/<dataset_id>/export', methods=['GET'])
+def export_dataset(dataset_id):
+    try:
+        slice_args = parse_slice_args()
+        response_format = parse_response_format()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        if dataset_service.dataset_version(dataset_id) is None:
+            return jsonify({"error": "Dataset not found"}), 404
+        if response_format == 'h3' and not dataset_service.is_h3_dataset(dataset_id):
+            return jsonify({"error": "format=h3 requires a dataset of H3 cells"}), 400
+
+        def build():
+            return format_dataset(dataset_service.load_dataset_slice(dataset_id, **slice_args), response_format)
+
+        payload = dataset_service.get_encoded_payload(
+            ('export', dataset_id, response_format, slice_cache_key(slice_args)), [dataset_id], build
+        )
+        response = encoded_response(payload)
+        filename = secure_filename(f"{dataset_id}-{slice_args['year']}" if slice_args['year'] else dataset_id)
+        # H3 cell records are plain JSON, not GeoJSON
+        extension = 'geojson' if response_format == 'geojson' else 'json'
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+        return response
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/tiles/<dataset_id>/<int:z>/<int:x>/<int:y>.pbf', methods=['GET'])
+def get_dataset_tile(dataset_id, z, x, y):
+    try:
+        tile = tile_service.get_tile(dataset_id, z, x, y, year=parse_year())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error rendering tile {dataset_id}/{z}/{x}/{y}: {e}")
+        return jsonify({"error": str(e)}), 500
+    if tile is None:
+        return jsonify({"error": "Dataset not found"}), 404
+    return Response(
+        tile,
+        mimetype='application/vnd.mapbox-vector-tile',
+        headers={'Cache-Control': 'public, max-age=3600'}
+    )
+
 @app.route('/analysis', methods=['POST'])
 async def handle_analysis():
     try:
@@ -261,12 +580,13 @@ def get_initial_prompt():
 @app.route('/api/dataset/sdg-15-3-1')
 def get_sdg_data():
     try:
-        # Load the GeoJSON file
-        with open('data/sdg_panama_sample.geojson', 'r') as f:
-            data = json.load(f)
-        return jsonify(data)
-    except FileNotFoundError:
-        return jsonify({'error': 'Dataset not found'}), 404
+        # The sample is generated as GeoJSON or as an H3 time series; the map service reads both
+        if dataset_service.dataset_path('sdg_panama_sample') is None:
+            return jsonify({'error': 'Dataset not found'}), 404
+        payload = dataset_service.get_encoded_payload(
+            ('sdg_sample',), ['sdg_panama_sample'], map_service.load_sdg_sample
+        )
+        return encoded_response(payload)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -279,12 +599,25 @@ def serve_data(filename):
 @app.route('/api/datasets/map', methods=['GET'])
 def get_all_datasets_map():
     try:
-        dataset_service = DatasetService()
-        datasets = dataset_service.load_all_geojson_datasets()
-        return jsonify({
-            'status': 'success',
-            'datasets': datasets
-        })
+        slice_args = parse_slice_args()
+        response_format = parse_response_format()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    try:
+        def build():
+            if has_slice_args(slice_args):
+                # Datasets that are not H3 cells keep their geometry in the h3 format
+                datasets = dataset_service.iter_dataset_slices(**slice_args, h3_cells=response_format == 'h3')
+            else:
+                datasets = dataset_service.iter_all_geojson_datasets(lazy=True)
+            return {
+                'datasets': datasets,
+                'status': 'success'
+            }
+
+        return streamed_response(
+            ('all', response_format, slice_cache_key(slice_args)), dataset_service.list_dataset_ids(), build
+        )
     except Exception as e:
         logger.error(f"Error loading datasets: {e}")
         return jsonify({
@@ -0,0 +1,180 @@
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMES = ('linear', 'quantile', 'natural_breaks')
+DEFAULT_SCHEME = 'linear'
+DEFAULT_CLASSES = 5
+MAX_CLASSES = 12
+
+# Natural breaks is quadratic in the number of values, so it runs on evenly
+# spaced quantiles of larger columns
+NATURAL_BREAKS_SAMPLE = 1000
+
+COLOR_RAMPS = {
+    # Low values red, high values green; used for raster layers
+    'impact': ['#d32f2f', '#f57c00', '#ffd700', '#7cb342', '#2e7d32'],
+    # Light yellow to bright red; the map's default metric scale
+    'heat': ['#ffffd4', '#ff0000']
+}
+DEFAULT_RAMP = 'heat'
+
+
+def _hex_to_rgb(color: str) -> np.ndarray:
+    color = color.lstrip('#')
+    return np.array([int(color[i:i + 2], 16) for i in (0, 2, 4)], dtype=np.float64)
+
+
+def ramp_colors(ramp: Sequence[str], count: int) -> List[str]:
+    """Return count hex colors spread evenly along a ramp of color stops"""
+    if count == len(ramp):
+        return list(ramp)
+    stops = np.array([_hex_to_rgb(color) for color in ramp])
+    positions = np.linspace(0, len(ramp) - 1, count) if count > 1 else np.zeros(1)
+    lower = np.minimum(positions.astype(np.int64), len(ramp) - 2) if len(ramp) > 1 else np.zeros(count, np.int64)
+    fraction = (positions - lower)[:, None]
+    upper = np.minimum(lower + 1, len(ramp) - 1)
+    rgb = np.rint(stops[lower] + (stops[upper] - stops[lower]) * fraction).astype(np.int64)
+    return ['#%02x%02x%02x' % tuple(color) for color in rgb.tolist()]
+
+
+def normalized_classes(normalized: np.ndarray, count: int) -> np.ndarray:
+    """Return the equal-width class of values already scaled to 0-1"""
+    return np.clip((np.asarray(normalized, dtype=np.float64) * count).astype(np.int64), 0, count - 1)
+
+
+def normalized_colors(normalized: np.ndarray, ramp: Sequence[str] = COLOR_RAMPS['impact']) -> List[str]:
+    """Return one ramp color per 0-1 value, splitting the range into equal classes"""
+    colors = np.asarray(ramp, dtype=object)
+    return colors[normalized_classes(normalized, len(ramp))].tolist()
+
+
+def linear_breaks(values: np.ndarray, classes: int) -> np.ndarray:
+    min_val, max_val = values.min(), values.max()
+    return min_val + (max_val - min_val) * np.arange(1, classes) / classes
+
+
+def quantile_breaks(values: np.ndarray, classes: int) -> np.ndarray:
+    return np.unique(np.quantile(values, np.arange(1, classes) / classes))
+
+
+def natural_breaks(values: np.ndarray, classes: int) -> np.ndarray:
+    """Return Jenks natural breaks, minimizing the squared deviation within classes.
+
+    Solved exactly by dynamic programming over the sorted values, one
+    vectorized pass per class.
+    """
+    data = np.sort(values)
+    if len(data) > NATURAL_BREAKS_SAMPLE:
+        data = np.quantile(data, np.linspace(0, 1, NATURAL_BREAKS_SAMPLE))
+    unique = np.unique(data)
+    if len(unique) <= classes:
+        return unique[1:]
+
+    n = len(data)
+    sums = np.concatenate([[0.0], np.cumsum(data)])
+    squares = np.concatenate([[0.0], np.cumsum(data ** 2)])
+    # cost[i, j] is the squared deviation of data[i:j] around its mean
+    i = np.arange(n + 1)[:, None]
+    j = np.arange(n + 1)[None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cost = squares[j] - squares[i] - (sums[j] - sums[i]) ** 2 / (j - i)
+    cost[j <= i] = np.inf
+
+    best = cost[0].copy()
+    starts = np.zeros((classes, n + 1), dtype=np.int64)
+    for k in range(1, classes):
+        totals = best[:, None] + cost
+        starts[k] = np.argmin(totals, axis=0)
+        best = totals[starts[k], np.arange(n + 1)]
+
+    # Walk back from the full range to the start index of every class
+    breaks, end = [], n
+    for k in range(classes - 1, 0, -1):
+        end = starts[k][end]
+        breaks.append(data[end])
+    return np.unique(breaks)
+
+
+BREAKS = {
+    'linear': linear_breaks,
+    'quantile': quantile_breaks,
+    'natural_breaks': natural_breaks
+}
+
+
+def class_breaks(values: np.ndarray, scheme: str = DEFAULT_SCHEME, classes: int = DEFAULT_CLASSES) -> np.ndarray:
+    """Return the inner class boundaries of a column; each class starts at its break"""
+    if scheme not in BREAKS:
+        raise ValueError(f"Unknown classification scheme: {scheme}")
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if not values.size or values.min() == values.max():
+        return np.empty(0, dtype=np.float64)
+    return np.asarray(BREAKS[scheme](values, classes), dtype=np.float64)
+
+
+def classify(values: np.ndarray, breaks: Sequence[float]) -> np.ndarray:
+    """Return the class of every value for the given breaks, -1 for missing values"""
+    values = np.asarray(values, dtype=np.float64)
+    classes = np.digitize(values, np.asarray(breaks, dtype=np.float64))
+    classes[np.isnan(values)] = -1
+    return classes
+
+
+def build_legend(values: np.ndarray, scheme: str = DEFAULT_SCHEME, classes: int = DEFAULT_CLASSES,
+                 ramp: str = DEFAULT_RAMP, **labels: Any) -> Dict[str, Any]:
+    """Classify a metric column and describe the result as legend metadata"""
+    if ramp not in COLOR_RAMPS:
+        raise ValueError(f"Unknown color ramp: {ramp}")
+    values = np.asarray(values, dtype=np.float64)
+    present = values[~np.isnan(values)]
+    breaks = class_breaks(present, scheme, classes)
+    colors = ramp_colors(COLOR_RAMPS[ramp], len(breaks) + 1)
+    legend = dict(labels)
+    legend.update({
+        'scheme': scheme,
+        'ramp': ramp,
+        'count': int(present.size),
+        'min': float(present.min()) if present.size else None,
+        'max': float(present.max()) if present.size else None,
+        'breaks': breaks.tolist(),
+        'colors': colors
+    })
+    return legend
+
+
+def legend_colors(values: np.ndarray, legend: Dict[str, Any], missing: Optional[str] = None) -> List[Optional[str]]:
+    """Return the legend color of every value, or missing where there is no value"""
+    colors = np.asarray(legend['colors'] + [missing], dtype=object)
+    return colors[classify(values, legend['breaks'])].tolist()
+
+
+def feature_value(properties: Dict[str, Any], metric: str) -> Optional[float]:
+    """Return a numeric metric of a feature, from its metrics dict or its flat properties"""
+    metrics = properties.get('metrics')
+    value = metrics.get(metric) if isinstance(metrics, dict) else properties.get(metric)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    return None
+
+
+def apply_legend(feature_collection: Dict[str, Any], metric: str, legend: Dict[str, Any]) -> Dict[str, Any]:
+    """Color every feature of a FeatureCollection by one metric and attach the legend"""
+    features = feature_collection.get('features', [])
+    values = np.array([
+        feature_value(feature.get('properties') or {}, metric) for feature in features
+    ], dtype=np.float64)
+    classes = classify(values, legend['breaks']).tolist()
+    colors = legend_colors(values, legend)
+
+    result = dict(feature_collection)
+    result['features'] = [
+        dict(feature, properties=dict(feature.get('properties') or {}, class_index=class_index, color=color))
+        for feature, class_index, color in zip(features, classes, colors)
+    ]
+    result['legend'] = legend
+    return result
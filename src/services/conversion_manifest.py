@@ -0,0 +1,160 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = '.conversion_manifest.json'
+MANIFEST_VERSION = 1
+
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def file_fingerprint(path: str) -> Optional[Dict[str, int]]:
+    """Return the size and modification time of a file, or None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def file_hash(path: str) -> str:
+    """Return the SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def default_manifest_path(output_path: str) -> str:
+    """Return the manifest next to an output file or inside an output directory"""
+    output_path = Path(output_path)
+    directory = output_path if output_path.suffix == '' else output_path.parent
+    return str(directory / MANIFEST_FILENAME)
+
+
+class ConversionManifest:
+    """Record of completed conversions, used to skip re-running unchanged ones.
+
+    Each entry is keyed by the converter and its input and output files, and
+    stores the conversion parameters, an input fingerprint (size and mtime,
+    plus a content hash when ``use_hash`` is set) and the fingerprints of the
+    outputs written. A conversion is current when its parameters match, no
+    input changed and every output is still as it was written. With
+    ``use_hash`` an input whose size or mtime changed but whose content did
+    not (e.g. after a fresh download) still counts as unchanged, and its
+    recorded fingerprint is updated so later runs do not hash it again.
+    """
+
+    def __init__(self, path: str, use_hash: bool = False):
+        self.path = str(path)
+        self.use_hash = use_hash
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            self.load()
+
+    @staticmethod
+    def entry_key(converter: str, inputs: Iterable[str], outputs: Iterable[str]) -> str:
+        return json.dumps([
+            converter,
+            sorted(os.path.abspath(path) for path in inputs),
+            sorted(os.path.abspath(path) for path in outputs)
+        ])
+
+    def load(self) -> None:
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable conversion manifest {self.path}: {str(e)}")
+            return
+        if data.get('version') != MANIFEST_VERSION:
+            logger.info(f"Ignoring conversion manifest {self.path} with version {data.get('version')}")
+            return
+        self.entries = data.get('entries', {})
+
+    def save(self) -> str:
+        """Write the manifest atomically"""
+        with self._lock:
+            data = {'version': MANIFEST_VERSION, 'entries': self.entries}
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        return self.path
+
+    def _input_fingerprint(self, path: str, recorded: Dict[str, Any] = None) -> Optional[Dict[str, Any]]:
+        fingerprint = file_fingerprint(path)
+        if fingerprint is None or not self.use_hash:
+            return fingerprint
+        if recorded and recorded.get('sha256') and all(recorded.get(k) == v for k, v in fingerprint.items()):
+            # Size and mtime unchanged: reuse the recorded hash instead of re-reading the file
+            fingerprint['sha256'] = recorded['sha256']
+        else:
+            fingerprint['sha256'] = file_hash(path)
+        return fingerprint
+
+    def _input_unchanged(self, path: str, recorded: Dict[str, Any]) -> bool:
+        fingerprint = file_fingerprint(path)
+        if fingerprint is None or recorded is None:
+            return False
+        if all(recorded.get(k) == v for k, v in fingerprint.items()):
+            return True
+        if not (self.use_hash and recorded.get('sha256')) or file_hash(path) != recorded['sha256']:
+            return False
+        # Same content with a new mtime: re-stamp it so the next run compares mtimes again
+        with self._lock:
+            recorded.update(fingerprint)
+        return True
+
+    def entry(self, converter: str, inputs: Iterable[str], outputs: Iterable[str]) -> Optional[Dict[str, Any]]:
+        return self.entries.get(self.entry_key(converter, inputs, outputs))
+
+    def is_current(self, converter: str, inputs: Iterable[str], outputs: Iterable[str],
+                   params: Dict[str, Any]) -> bool:
+        """Return whether converting inputs to outputs with params has been done and is intact"""
+        inputs = list(inputs)
+        entry = self.entry(converter, inputs, outputs)
+        if entry is None or entry.get('params') != json.loads(json.dumps(params)):
+            return False
+        restamped = False
+        for path in inputs:
+            recorded = entry['inputs'].get(os.path.abspath(path))
+            previous = dict(recorded or {})
+            if not self._input_unchanged(path, recorded):
+                return False
+            restamped = restamped or recorded != previous
+        if restamped:
+            self.save()
+        recorded_outputs = entry.get('outputs', {})
+        return bool(recorded_outputs) and all(
+            file_fingerprint(path) == fingerprint for path, fingerprint in recorded_outputs.items()
+        )
+
+    def record(self, converter: str, inputs: Iterable[str], outputs: Iterable[str],
+               params: Dict[str, Any], **details: Any) -> None:
+        """Store a completed conversion; call save() to persist it"""
+        inputs, outputs = list(inputs), list(outputs)
+        key = self.entry_key(converter, inputs, outputs)
+        with self._lock:
+            previous = self.entries.get(key, {}).get('inputs', {})
+            self.entries[key] = {
+                'converter': converter,
+                'params': json.loads(json.dumps(params)),
+                'inputs': {
+                    os.path.abspath(path): self._input_fingerprint(path, previous.get(os.path.abspath(path)))
+                    for path in inputs
+                },
+                'outputs': {os.path.abspath(path): file_fingerprint(path) for path in outputs},
+                'recorded': datetime.now().isoformat(timespec='seconds'),
+                **details
+            }
@@ -0,0 +1,394 @@
+import json
+import logging
+import math
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from .h3_geometry import cell_bounds, cell_polygons
+from .h3_store import H3TimeSeries
+from .h3_pyramid import source_resolution
+from .spatial_index import BBox, SpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# Rough in-memory size of one parsed GeoJSON feature, used for cache accounting
+FEATURE_MEMORY_ESTIMATE = 2048
+
+# Properties that describe a feature rather than measure something
+DESCRIPTIVE_PROPERTIES = ('h3_index', 'year', 'timestamp')
+
+
+def parse_bbox(value: Optional[str]) -> Optional[BBox]:
+    """Parse a ``min_lng,min_lat,max_lng,max_lat`` query string value"""
+    if not value:
+        return None
+    try:
+        parts = [float(part) for part in value.split(',')]
+    except ValueError:
+        parts = []
+    if len(parts) != 4 or not all(math.isfinite(part) for part in parts):
+        raise ValueError("bbox must be four numbers: min_lng,min_lat,max_lng,max_lat")
+    min_lng, min_lat, max_lng, max_lat = parts
+    if min_lng > max_lng or min_lat > max_lat:
+        raise ValueError("bbox minimum must not exceed maximum")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def parse_polygon(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Parse a GeoJSON Polygon or MultiPolygon query string value"""
+    if not value:
+        return None
+    try:
+        geometry = json.loads(value)
+    except json.JSONDecodeError:
+        raise ValueError("polygon must be a GeoJSON geometry")
+    if not isinstance(geometry, dict) or geometry.get('type') not in ('Polygon', 'MultiPolygon'):
+        raise ValueError("polygon must be a GeoJSON Polygon or MultiPolygon")
+    try:
+        polygon = shape(geometry)
+    except Exception:
+        raise ValueError("polygon coordinates are malformed")
+    if polygon.is_empty or not polygon.is_valid:
+        raise ValueError(f"polygon is invalid: {shapely.is_valid_reason(polygon)}")
+    return geometry
+
+
+def _coordinate_bounds(geometry: Dict[str, Any]) -> Tuple[float, float, float, float]:
+    """Return the bounding box of any GeoJSON geometry"""
+    coords = np.asarray(_flatten_coordinates(geometry.get('coordinates', [])), dtype=np.float64)
+    if coords.size == 0:
+        return np.nan, np.nan, np.nan, np.nan
+    return coords[:, 0].min(), coords[:, 1].min(), coords[:, 0].max(), coords[:, 1].max()
+
+
+def _flatten_coordinates(coordinates) -> List[List[float]]:
+    if not coordinates:
+        return []
+    if isinstance(coordinates[0], (int, float)):
+        return [coordinates[:2]]
+    flat = []
+    for part in coordinates:
+        flat.extend(_flatten_coordinates(part))
+    return flat
+
+
+def to_h3_cell_collection(feature_collection: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a geometry-free FeatureCollection into bare H3 cell records.
+
+    Each record is the feature's properties, which always include
+    ``h3_index`` for H3 datasets, so clients can draw the hexagons
+    themselves (e.g. with an H3 hexagon layer).
+    """
+    result = {key: value for key, value in feature_collection.items() if key not in ('type', 'features')}
+    result['type'] = 'H3CellCollection'
+    result['cells'] = [feature.get('properties') or {} for feature in feature_collection.get('features', [])]
+    return result
+
+
+def _project_metric(properties: Dict[str, Any], metric: Optional[str]) -> Dict[str, Any]:
+    """Return feature properties carrying only the requested metric"""
+    if not metric or not isinstance(properties.get('metrics'), dict):
+        return properties
+    projected = dict(properties)
+    projected['metrics'] = {metric: properties['metrics'].get(metric)}
+    return projected
+
+
+def _feature_metrics(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a feature's metrics dict; flat layers keep them next to the descriptive properties"""
+    metrics = properties.get('metrics')
+    if isinstance(metrics, dict):
+        return metrics
+    return {key: value for key, value in properties.items() if key not in DESCRIPTIVE_PROPERTIES}
+
+
+def summarize_values(values: Iterable[Any]) -> Dict[str, Any]:
+    """Summarize one metric: count, min, max, mean and sum for numbers, counts for labels"""
+    values = [value for value in values if value is not None and value == value]
+    numbers = [
+        value for value in values
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    ]
+    if numbers and len(numbers) == len(values):
+        return _numeric_summary(np.asarray(numbers, dtype=np.float64))
+    labels = Counter()
+    for value in values:
+        if isinstance(value, list):
+            labels.update(str(item) for item in value)
+        else:
+            labels[str(value)] += 1
+    return {'count': len(values), 'categories': dict(labels.most_common())}
+
+
+def _numeric_summary(array: np.ndarray) -> Dict[str, Any]:
+    if not array.size:
+        return {'count': 0, 'min': None, 'max': None, 'mean': None, 'sum': None}
+    return {
+        'count': int(array.size),
+        'min': float(array.min()),
+        'max': float(array.max()),
+        'mean': float(array.mean()),
+        'sum': float(array.sum())
+    }
+
+
+class TimeSeriesIndex:
+    """Year/metric/spatial slicing over a columnar H3 time series"""
+
+    # Every feature is an H3 cell, so clients can rebuild any geometry from h3_index
+    is_h3 = True
+
+    def __init__(self, timeseries: H3TimeSeries):
+        self.timeseries = timeseries
+        self.resolution = source_resolution(timeseries)
+        self.spatial = SpatialIndex(cell_bounds(timeseries.cells), geometries=self._cell_geometries)
+
+    def _cell_geometries(self, positions: np.ndarray) -> np.ndarray:
+        """Return the hexagons of the cells at some positions as shapely polygons"""
+        return shapely.polygons([
+            shapely.linearrings(rings[0]) for rings in cell_polygons(self.timeseries.cells[positions])
+        ])
+
+    @property
+    def years(self) -> List[int]:
+        return self.timeseries.years.tolist()
+
+    @property
+    def nbytes(self) -> int:
+        return self.spatial.nbytes + self.timeseries.nbytes
+
+    @property
+    def metrics(self) -> List[str]:
+        return self.timeseries.metric_names
+
+    def _select(self, year: int = None, bbox: BBox = None,
+                polygon: Dict[str, Any] = None) -> Tuple[List[int], np.ndarray]:
+        """Return the year rows and cell columns matching a query"""
+        if year is None:
+            rows = list(range(len(self.timeseries.years)))
+        else:
+            row = self.timeseries.year_index(year)
+            rows = [] if row is None else [row]
+        columns = self.spatial.query(bbox, polygon)
+        if columns is None:
+            columns = np.arange(len(self.timeseries.cells))
+        return rows, columns
+
+    def slice(self, year: int = None, metric: str = None, bbox: BBox = None,
+              include_geometry: bool = True, polygon: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Return a FeatureCollection for the requested year, metric and area"""
+        timeseries = self.timeseries
+        if metric and metric not in timeseries.metrics:
+            raise KeyError(f"Unknown metric: {metric}")
+        rows, columns = self._select(year, bbox, polygon)
+
+        metrics = [metric] if metric else None
+        polygons = None
+        if include_geometry and rows:
+            polygons = dict(zip(
+                (timeseries.cell_ids[column] for column in columns.tolist()),
+                cell_polygons(timeseries.cells[columns])
+            ))
+        features = []
+        for row in rows:
+            for props in timeseries.year_properties(row, columns, metrics):
+                geometry = None
+                if polygons is not None:
+                    geometry = {
+                        'type': 'Polygon',
+                        'coordinates': polygons[props['h3_index']]
+                    }
+                features.append({
+                    'type': 'Feature',
+                    'geometry': geometry,
+                    'properties': props
+                })
+
+        return {
+            'type': 'FeatureCollection',
+            'features': features,
+            'metadata': timeseries.metadata
+        }
+
+    def metric_values(self, metric: str, year: int = None, bbox: BBox = None,
+                      polygon: Dict[str, Any] = None) -> np.ndarray:
+        """Return one numeric metric over the requested year and area, NaN where missing"""
+        timeseries = self.timeseries
+        if metric not in timeseries.metrics:
+            raise KeyError(f"Unknown metric: {metric}")
+        if timeseries.metric_kinds[metric] in ('category', 'list'):
+            raise ValueError(f"Metric {metric} is not numeric")
+        rows, columns = self._select(year, bbox, polygon)
+        return timeseries.metrics[metric][rows][:, columns].astype(np.float64).reshape(-1)
+
+    def stats(self, year: int = None, metric: str = None, bbox: BBox = None,
+              polygon: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Summarize every metric (or one) over the requested year and area"""
+        timeseries = self.timeseries
+        if metric and metric not in timeseries.metrics:
+            raise KeyError(f"Unknown metric: {metric}")
+        rows, columns = self._select(year, bbox, polygon)
+
+        summaries = {}
+        for name in ([metric] if metric else timeseries.metric_names):
+            values = timeseries.metrics[name][rows][:, columns]
+            kind = timeseries.metric_kinds[name]
+            if kind in ('category', 'list'):
+                codes = values[values >= 0]
+                counts = Counter()
+                for code, count in enumerate(np.bincount(codes, minlength=len(timeseries.categories[name])).tolist()):
+                    if not count:
+                        continue
+                    category = timeseries.categories[name][code]
+                    for label in (category if kind == 'list' else [category]):
+                        counts[str(label)] += count
+                summaries[name] = {'count': int(codes.size), 'categories': dict(counts.most_common())}
+            else:
+                values = values.astype(np.float64).reshape(-1)
+                summaries[name] = _numeric_summary(values[~np.isnan(values)])
+
+        return {
+            'feature_count': len(rows) * len(columns),
+            'cell_count': len(columns),
+            'years': [int(timeseries.years[row]) for row in rows],
+            'metrics': summaries
+        }
+
+
+class GeoJSONIndex:
+    """Year/metric/spatial slicing over an in-memory FeatureCollection"""
+
+    def __init__(self, geojson: Dict[str, Any]):
+        self.geojson = geojson
+        features = geojson.get('features', [])
+
+        years = np.full(len(features), -1, dtype=np.int64)
+        feature_bounds = np.empty((len(features), 4), dtype=np.float64)
+        metric_names = set()
+        h3_features = 0
+        for i, feature in enumerate(features):
+            properties = feature.get('properties') or {}
+            if isinstance(properties.get('h3_index'), str):
+                h3_features += 1
+            if properties.get('year') is not None:
+                years[i] = int(properties['year'])
+            metric_names.update(_feature_metrics(properties).keys())
+            feature_bounds[i] = _coordinate_bounds(feature.get('geometry') or {})
+        self.spatial = SpatialIndex(feature_bounds, geometries=self._feature_geometries)
+
+        # Feature positions grouped by year, so a year slice never scans the rest
+        order = np.argsort(years, kind='stable')
+        unique_years, starts = np.unique(years[order], return_index=True)
+        self.year_positions = {
+            int(year): positions
+            for year, positions in zip(unique_years, np.split(order, starts[1:]))
+        }
+        self.metric_names = sorted(metric_names)
+        # Only layers whose every feature is an H3 cell can be served without geometry
+        self.is_h3 = bool(features) and h3_features == len(features)
+
+    def _feature_geometries(self, positions: np.ndarray) -> np.ndarray:
+        """Return the geometries of the features at some positions as shapely objects"""
+        features = self.geojson['features']
+        return np.array([shape(features[position]['geometry']) for position in positions.tolist()], dtype=object)
+
+    @property
+    def years(self) -> List[int]:
+        return [year for year in self.year_positions if year != -1]
+
+    @property
+    def nbytes(self) -> int:
+        # The index keeps its FeatureCollection alive, so count it as well
+        features = len(self.geojson.get('features', []))
+        return self.spatial.nbytes + features * (8 + FEATURE_MEMORY_ESTIMATE)
+
+    @property
+    def metrics(self) -> List[str]:
+        return self.metric_names
+
+    def _select(self, year: int = None, bbox: BBox = None, polygon: Dict[str, Any] = None) -> np.ndarray:
+        """Return the sorted positions of the features matching a query"""
+        if year is None:
+            positions = None
+        else:
+            # Features without a year (static layers) are shown for every year
+            positions = np.concatenate([
+                self.year_positions.get(int(year), np.empty(0, dtype=np.int64)),
+                self.year_positions.get(-1, np.empty(0, dtype=np.int64))
+            ])
+            positions.sort()
+
+        in_area = self.spatial.query(bbox, polygon)
+        if in_area is not None:
+            positions = in_area if positions is None else np.intersect1d(positions, in_area)
+        if positions is None:
+            positions = np.arange(len(self.spatial))
+        return positions
+
+    def slice(self, year: int = None, metric: str = None, bbox: BBox = None,
+              include_geometry: bool = True, polygon: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Return a FeatureCollection for the requested year, metric and area"""
+        if metric and metric not in self.metric_names:
+            raise KeyError(f"Unknown metric: {metric}")
+        features = self.geojson.get('features', [])
+        sliced = []
+        for position in self._select(year, bbox, polygon).tolist():
+            feature = features[position]
+            if metric:
+                feature = dict(feature, properties=_project_metric(feature.get('properties') or {}, metric))
+            if not include_geometry:
+                feature = dict(feature, geometry=None)
+            sliced.append(feature)
+
+        result = {key: value for key, value in self.geojson.items() if key != 'features'}
+        result['type'] = 'FeatureCollection'
+        result['features'] = sliced
+        return result
+
+    def metric_values(self, metric: str, year: int = None, bbox: BBox = None,
+                      polygon: Dict[str, Any] = None) -> np.ndarray:
+        """Return one numeric metric over the requested year and area, NaN where missing"""
+        features = self.geojson.get('features', [])
+        values = []
+        found = metric in self.metric_names
+        for position in self._select(year, bbox, polygon).tolist():
+            value = _feature_metrics(features[position].get('properties') or {}).get(metric)
+            if value is not None:
+                found = True
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"Metric {metric} is not numeric")
+            values.append(value)
+        if not found:
+            raise KeyError(f"Unknown metric: {metric}")
+        return np.array(values, dtype=np.float64)
+
+    def stats(self, year: int = None, metric: str = None, bbox: BBox = None,
+              polygon: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Summarize every metric (or one) over the requested year and area"""
+        if metric and metric not in self.metric_names:
+            raise KeyError(f"Unknown metric: {metric}")
+        features = self.geojson.get('features', [])
+        positions = self._select(year, bbox, polygon).tolist()
+
+        values: Dict[str, List[Any]] = {}
+        years = set()
+        for position in positions:
+            properties = features[position].get('properties') or {}
+            if properties.get('year') is not None:
+                years.add(int(properties['year']))
+            for name, value in _feature_metrics(properties).items():
+                if metric is None or name == metric:
+                    values.setdefault(name, []).append(value)
+
+        return {
+            'feature_count': len(positions),
+            'cell_count': len({
+                (features[position].get('properties') or {}).get('h3_index', position) for position in positions
+            }),
+            'years': sorted(years),
+            'metrics': {name: summarize_values(items) for name, items in values.items()}
+        }
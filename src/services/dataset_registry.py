@@ -0,0 +1,107 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def configured_max_bytes() -> int:
+    """Return the dataset cache budget from DATASET_CACHE_MAX_MB"""
+    value = os.getenv('DATASET_CACHE_MAX_MB')
+    if not value:
+        return DEFAULT_MAX_BYTES
+    try:
+        return int(float(value) * 1024 * 1024)
+    except ValueError:
+        logger.warning(f"Invalid DATASET_CACHE_MAX_MB={value!r}, using default")
+        return DEFAULT_MAX_BYTES
+
+
+class DatasetRegistry:
+    """Process-wide cache of loaded datasets, indexes and encoded payloads.
+
+    Every entry is stored with the version of the files it was built from;
+    a lookup with a different version drops the stale entry. Entries are
+    evicted least-recently-used first once their combined size exceeds
+    ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = configured_max_bytes() if max_bytes is None else max_bytes
+        self.total_bytes = 0
+        self._entries: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[Any]:
+        """Return the cached value for key if it was built from this version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Hashable, version: Hashable, value: Any, nbytes: int) -> None:
+        """Store a value, evicting least-recently-used entries over the budget"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if nbytes > self.max_bytes:
+                logger.warning(f"Not caching {key}: {nbytes} bytes exceeds the {self.max_bytes} byte budget")
+                return
+            self._entries[key] = (version, value, nbytes)
+            self.total_bytes += nbytes
+            while self.total_bytes > self.max_bytes:
+                evicted_key = next(iter(self._entries))
+                self._remove(evicted_key)
+                logger.info(f"Evicted {evicted_key} from dataset registry")
+
+    def get_or_load(self, key: Hashable, version: Hashable, load: Callable[[], Any],
+                    sizeof: Callable[[Any], int]) -> Any:
+        """Return the cached value, loading and storing it on a miss"""
+        value = self.get(key, version)
+        if value is None:
+            value = load()
+            if value is not None:
+                self.put(key, version, value, sizeof(value))
+        return value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool] = None) -> None:
+        """Drop every entry, or only those whose key matches predicate"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate is None or predicate(key)]:
+                self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'total_bytes': self.total_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+    def _remove(self, key: Hashable) -> None:
+        _, _, nbytes = self._entries.pop(key)
+        self.total_bytes -= nbytes
+
+
+_dataset_service = None
+_dataset_service_lock = threading.Lock()
+
+
+def get_dataset_service():
+    """Return the DatasetService shared by every request in this process"""
+    global _dataset_service
+    if _dataset_service is None:
+        with _dataset_service_lock:
+            if _dataset_service is None:
+                from .dataset_service import DatasetService
+                _dataset_service = DatasetService(registry=DatasetRegistry())
+    return _dataset_service
@@ -1,54 +1,137 @@
+import hashlib
 import json
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable, Hashable, Iterable, Iterator
 from pathlib import Path
 from .map_service import MapService
+from .h3_store import H3TimeSeries, H3TS_SUFFIX, dataset_id_for_path
+from .dataset_index import GeoJSONIndex, TimeSeriesIndex, BBox, to_h3_cell_collection
+from .h3_pyramid import aggregate_to_resolution, pyramid_resolutions, resolution_for_zoom
+from .response_cache import EncodedPayload
+from .json_stream import iter_json_chunks
+from .dataset_registry import DatasetRegistry
+from .classification import DEFAULT_CLASSES, DEFAULT_RAMP, DEFAULT_SCHEME, build_legend
+import numpy as np
 import os
 
 logger = logging.getLogger(__name__)
 
+# Rough in-memory size of parsed GeoJSON relative to its file size
+GEOJSON_MEMORY_FACTOR = 6
+
+# Legends hold a few breaks and colors; a flat estimate is close enough for cache accounting
+LEGEND_MEMORY_ESTIMATE = 1024
+
+# Streamed responses up to this size are kept and cached; larger ones are only streamed
+STREAM_CACHE_MAX_BYTES = 8 * 1024 * 1024
+
+def file_version(path: Path) -> Optional[str]:
+    """Return a short key that changes whenever the file is rewritten"""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    key = f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+
+def stream_error_members(error: Exception) -> Dict[str, Any]:
+    """Members closing a streamed response that failed after it started"""
+    return {'status': 'error', 'error': f"Response failed while streaming: {error}"}
+
 class DatasetService:
-    def __init__(self):
-        self.map_service = MapService()
-        self.available_datasets = self._load_available_datasets()
-        self.geojson_cache = {}
+    def __init__(self, registry: DatasetRegistry = None, map_service: MapService = None):
+        self.map_service = map_service or MapService()
+        self.registry = registry or DatasetRegistry()
         self.base_path = 'data'
+        self.knowledge_base_path = Path(self.base_path) / 'knowledge_base.json'
+
+    @property
+    def available_datasets(self) -> Dict[str, Any]:
+        """Datasets listed in the knowledge base, reloaded when the file changes"""
+        return self.registry.get_or_load(
+            ('knowledge_base',),
+            file_version(self.knowledge_base_path),
+            self._load_available_datasets,
+            lambda datasets: self.knowledge_base_path.stat().st_size * GEOJSON_MEMORY_FACTOR
+        )
 
     def _load_available_datasets(self) -> Dict[str, Any]:
         """Load available datasets from knowledge base"""
         try:
-            with open('data/knowledge_base.json', 'r') as f:
+            with open(self.knowledge_base_path, 'r') as f:
                 data = json.load(f)
                 return {dataset['id']: dataset for dataset in data['datasets_available']}
         except Exception as e:
             logger.error(f"Error loading datasets: {e}")
             return {}
 
+    def _load_geojson(self, path: Path) -> Dict[str, Any]:
+        """Load a GeoJSON file through the registry"""
+        def load():
+            with open(path, 'r') as f:
+                data = json.load(f)
+            logger.info(f"Loaded dataset: {path.name}")
+            return data
+
+        return self.registry.get_or_load(
+            ('geojson', path.name),
+            file_version(path),
+            load,
+            lambda data: path.stat().st_size * GEOJSON_MEMORY_FACTOR
+        )
+
+    def load_h3_timeseries(self, dataset_id: str) -> Optional[H3TimeSeries]:
+        """Load a columnar H3 time series dataset, or None if it does not exist"""
+        data_path = Path(self.base_path) / f"{dataset_id}{H3TS_SUFFIX}"
+        version = file_version(data_path)
+        if version is None:
+            return None
+
+        def load():
+            timeseries = H3TimeSeries.load(str(data_path))
+            logger.info(f"Loaded H3 time series: {data_path.name}")
+            return timeseries
+
+        return self.registry.get_or_load(
+            ('timeseries', dataset_id), version, load, lambda timeseries: timeseries.nbytes
+        )
+
+    def iter_all_geojson_datasets(self, lazy: bool = False) -> Iterator[Dict[str, Any]]:
+        """Yield every GeoJSON and columnar H3 dataset in the data directory.
+
+        With ``lazy=True`` columnar datasets expand their features on demand.
+        """
+        data_dir = Path(self.base_path)
+        
+        # Load each GeoJSON file
+        for geojson_file in data_dir.glob('*.geojson'):
+            try:
+                data = self._load_geojson(geojson_file)
+            except Exception as e:
+                logger.error(f"Error loading {geojson_file}: {e}")
+                continue
+            yield {
+                'id': geojson_file.stem,
+                'data': data
+            }
+
+        # Columnar datasets are expanded to GeoJSON for the map
+        for timeseries_file in data_dir.glob(f"*{H3TS_SUFFIX}"):
+            dataset_id = dataset_id_for_path(timeseries_file)
+            try:
+                data = self.load_h3_timeseries(dataset_id).to_geojson(lazy=lazy)
+            except Exception as e:
+                logger.error(f"Error loading {timeseries_file}: {e}")
+                continue
+            yield {
+                'id': dataset_id,
+                'data': data
+            }
+
     def load_all_geojson_datasets(self) -> List[Dict[str, Any]]:
-        """Load all GeoJSON files from the data directory"""
+        """Load all GeoJSON and columnar H3 files from the data directory"""
         try:
-            data_dir = Path('data')
-            datasets = []
-            
-            # Load each GeoJSON file
-            for geojson_file in data_dir.glob('*.geojson'):
-                try:
-                    if geojson_file.name not in self.geojson_cache:
-                        with open(geojson_file, 'r') as f:
-                            data = json.load(f)
-                            self.geojson_cache[geojson_file.name] = data
-                    
-                    datasets.append({
-                        'id': geojson_file.stem,
-                        'data': self.geojson_cache[geojson_file.name]
-                    })
-                    logger.info(f"Loaded dataset: {geojson_file.name}")
-                except Exception as e:
-                    logger.error(f"Error loading {geojson_file}: {e}")
-                    continue
-            
-            return datasets
-            
+            return list(self.iter_all_geojson_datasets())
         except Exception as e:
             logger.error(f"Error loading GeoJSON datasets: {e}")
             return []
@@ -63,13 +146,13 @@ class DatasetService:
         """Load dataset and prepare it for map visualization"""
         try:
             # Try to load from GeoJSON files first
-            data_path = Path('data') / f"{dataset_id}.geojson"
+            data_path = Path(self.base_path) / f"{dataset_id}.geojson"
             if data_path.exists():
-                if dataset_id not in self.geojson_cache:
-                    with open(data_path, 'r') as f:
-                        data = json.load(f)
-                        self.geojson_cache[dataset_id] = data
-                return self.geojson_cache[dataset_id]
+                return self._load_geojson(data_path)
+
+            timeseries = self.load_h3_timeseries(dataset_id)
+            if timeseries is not None:
+                return timeseries.to_geojson()
             
             # Fallback to legacy loading method
             if dataset_id == "sdg-15-3-1":
@@ -86,6 +169,256 @@ class DatasetService:
             logger.error(f"Error loading dataset {dataset_id}: {e}")
             return {"error": f"Error loading dataset: {str(e)}"}
 
+    def dataset_path(self, dataset_id: str) -> Optional[Path]:
+        """Return the file backing a dataset, or None if it does not exist"""
+        candidates = [
+            Path(self.base_path) / f"{dataset_id}.geojson",
+            Path(self.base_path) / f"{dataset_id}{H3TS_SUFFIX}"
+        ]
+        if dataset_id == "sdg-15-3-1":
+            candidates += [
+                Path(self.base_path) / "sdg_panama_sample.geojson",
+                Path(self.base_path) / f"sdg_panama_sample{H3TS_SUFFIX}"
+            ]
+        for path in candidates:
+            if path.exists():
+                return path
+        return None
+
+    def dataset_version(self, dataset_id: str) -> Optional[str]:
+        """Return a short version key that changes whenever the dataset file changes"""
+        path = self.dataset_path(dataset_id)
+        if path is None:
+            return None
+        return file_version(path)
+
+    def get_dataset_index(self, dataset_id: str, zoom: float = None):
+        """Return the year/bbox index for a dataset, building it on first use.
+
+        With a map zoom, H3 time series are served from the coarser pyramid
+        level that suits it instead of their source resolution.
+        """
+        version = self.dataset_version(dataset_id)
+        if version is None:
+            return None
+
+        def build():
+            timeseries = self.load_h3_timeseries(dataset_id)
+            if timeseries is not None:
+                index = TimeSeriesIndex(timeseries)
+            else:
+                data = self.load_dataset_for_map(dataset_id)
+                if 'error' in data:
+                    return None
+                index = GeoJSONIndex(data)
+            logger.info(f"Built index for dataset {dataset_id}")
+            return index
+
+        index = self.registry.get_or_load(
+            ('index', dataset_id), version, build, lambda index: index.nbytes
+        )
+        if zoom is None or not isinstance(index, TimeSeriesIndex) or index.resolution is None:
+            return index
+        resolution = resolution_for_zoom(zoom)
+        if resolution >= index.resolution:
+            return index
+        return self._get_level_index(dataset_id, version, index, resolution)
+
+    def _get_level_index(self, dataset_id: str, version: str, index: TimeSeriesIndex,
+                         resolution: int) -> TimeSeriesIndex:
+        """Return the index over a dataset aggregated to a coarser H3 resolution"""
+        def build():
+            level = TimeSeriesIndex(aggregate_to_resolution(index.timeseries, resolution))
+            logger.info(f"Built resolution {resolution} level for dataset {dataset_id}")
+            return level
+
+        return self.registry.get_or_load(
+            ('index', dataset_id, resolution), version, build, lambda level: level.nbytes
+        )
+
+    def load_dataset_slice(self, dataset_id: str, year: int = None, metric: str = None,
+                           bbox: BBox = None, include_geometry: bool = True,
+                           zoom: float = None, polygon: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Return only the features of a dataset for one year, metric and area"""
+        index = self.get_dataset_index(dataset_id, zoom)
+        if index is None:
+            return {"error": "Dataset not found"}
+        return index.slice(year=year, metric=metric, bbox=bbox,
+                           include_geometry=include_geometry, polygon=polygon)
+
+    def is_h3_dataset(self, dataset_id: str) -> Optional[bool]:
+        """Return whether every feature of a dataset is an H3 cell, or None if it does not exist"""
+        index = self.get_dataset_index(dataset_id)
+        if index is None:
+            return None
+        return index.is_h3
+
+    def load_dataset_stats(self, dataset_id: str, year: int = None, metric: str = None,
+                           bbox: BBox = None, zoom: float = None,
+                           polygon: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Summarize a dataset's metrics for one year and area"""
+        index = self.get_dataset_index(dataset_id, zoom)
+        if index is None:
+            return {"error": "Dataset not found"}
+        return index.stats(year=year, metric=metric, bbox=bbox, polygon=polygon)
+
+    def load_dataset_legend(self, dataset_id: str, metric: str, year: int = None, zoom: float = None,
+                            scheme: str = DEFAULT_SCHEME, classes: int = DEFAULT_CLASSES,
+                            ramp: str = DEFAULT_RAMP) -> Dict[str, Any]:
+        """Return the class breaks, colors and range of one metric, cached per dataset version"""
+        index = self.get_dataset_index(dataset_id, zoom)
+        if index is None:
+            return {"error": "Dataset not found"}
+
+        def build():
+            values = index.metric_values(metric, year)
+            return build_legend(values, scheme, classes, ramp, dataset_id=dataset_id, metric=metric, year=year)
+
+        return self.registry.get_or_load(
+            ('legend', dataset_id, getattr(index, 'resolution', None), metric, year, scheme, classes, ramp),
+            self.dataset_version(dataset_id), build, lambda legend: LEGEND_MEMORY_ESTIMATE
+        )
+
+    def load_metric_legend(self, metric: str, year: int = None, zoom: float = None,
+                           scheme: str = DEFAULT_SCHEME, classes: int = DEFAULT_CLASSES,
+                           ramp: str = DEFAULT_RAMP) -> Dict[str, Any]:
+        """Return one legend for a metric over every dataset that carries it"""
+        dataset_ids = self.list_dataset_ids()
+
+        def build():
+            values, used = [], []
+            for dataset_id in dataset_ids:
+                index = self.get_dataset_index(dataset_id, zoom)
+                if index is None:
+                    continue
+                try:
+                    values.append(index.metric_values(metric, year))
+                except (KeyError, ValueError):
+                    continue
+                used.append(dataset_id)
+            if not used:
+                raise KeyError(f"Unknown metric: {metric}")
+            return build_legend(np.concatenate(values), scheme, classes, ramp,
+                                dataset_ids=used, metric=metric, year=year)
+
+        return self.registry.get_or_load(
+            ('legend', None, resolution_for_zoom(zoom) if zoom is not None else None,
+             metric, year, scheme, classes, ramp),
+            self._versions(dataset_ids), build, lambda legend: LEGEND_MEMORY_ESTIMATE
+        )
+
+    def list_dataset_ids(self) -> List[str]:
+        """Return the ids of every GeoJSON and columnar dataset in the data directory"""
+        data_dir = Path(self.base_path)
+        paths = list(data_dir.glob('*.geojson')) + list(data_dir.glob(f"*{H3TS_SUFFIX}"))
+        return [dataset_id_for_path(path) for path in paths]
+
+    def iter_dataset_slices(self, year: int = None, metric: str = None, bbox: BBox = None,
+                            include_geometry: bool = True, zoom: float = None,
+                            polygon: Dict[str, Any] = None, h3_cells: bool = False) -> Iterator[Dict[str, Any]]:
+        """Slice every dataset in the data directory with the same parameters.
+
+        With ``h3_cells`` H3 datasets are returned as bare cell records, while
+        any other dataset keeps its geometry, which clients cannot rebuild.
+        """
+        for dataset_id in self.list_dataset_ids():
+            try:
+                index = self.get_dataset_index(dataset_id, zoom)
+                if index is None:
+                    continue
+                if metric and metric not in index.metrics:
+                    continue
+                as_cells = h3_cells and index.is_h3
+                data = index.slice(year=year, metric=metric, bbox=bbox,
+                                   include_geometry=include_geometry or (h3_cells and not as_cells),
+                                   polygon=polygon)
+                if as_cells:
+                    data = to_h3_cell_collection(data)
+            except Exception as e:
+                logger.error(f"Error slicing dataset {dataset_id}: {e}")
+                continue
+            yield {
+                'id': dataset_id,
+                'data': data
+            }
+
+    def load_all_dataset_slices(self, year: int = None, metric: str = None, bbox: BBox = None,
+                                include_geometry: bool = True, zoom: float = None,
+                                polygon: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Slice every dataset in the data directory with the same parameters"""
+        return list(self.iter_dataset_slices(year, metric, bbox, include_geometry, zoom, polygon))
+
+    def _versions(self, dataset_ids: Iterable[str]) -> tuple:
+        return tuple((dataset_id, self.dataset_version(dataset_id)) for dataset_id in dataset_ids)
+
+    def _payload_key(self, key: Hashable, dataset_ids: Iterable[str]) -> tuple:
+        return ('payload', key), self._versions(dataset_ids)
+
+    def get_cached_payload(self, key: Hashable, dataset_ids: Iterable[str]) -> Optional[EncodedPayload]:
+        """Return the encoded response for key if it is cached and still current"""
+        cache_key, versions = self._payload_key(key, dataset_ids)
+        return self.registry.get(cache_key, versions)
+
+    def get_encoded_payload(self, key: Hashable, dataset_ids: Iterable[str],
+                            build: Callable[[], Any]) -> EncodedPayload:
+        """Return the encoded response for key, building it only when a dataset changed"""
+        cache_key, versions = self._payload_key(key, dataset_ids)
+        payload = self.registry.get(cache_key, versions)
+        if payload is None:
+            data = build()
+            payload = EncodedPayload.from_object(data)
+            # Error responses are re-evaluated on the next request
+            if not (isinstance(data, dict) and 'error' in data):
+                self.registry.put(cache_key, versions, payload, payload.nbytes)
+            logger.info(f"Encoded payload for {key}: {len(payload.body)} bytes")
+        return payload
+
+    def stream_payload(self, key: Hashable, dataset_ids: Iterable[str],
+                       build: Callable[[], Any]) -> Iterator[bytes]:
+        """Stream the JSON for key chunk by chunk.
+
+        The streamed bytes are kept and cached as an EncodedPayload only while
+        they stay under STREAM_CACHE_MAX_BYTES, so large responses never hold
+        more than one chunk plus the dataset being encoded. A failure part way
+        ends the JSON with ``"status": "error"`` and an ``error`` message, and
+        the response is not cached.
+        """
+        cache_key, versions = self._payload_key(key, dataset_ids)
+        max_cached_bytes = min(STREAM_CACHE_MAX_BYTES, self.registry.max_bytes // 4)
+        value = build()
+        body, size = [], 0
+        try:
+            for chunk in iter_json_chunks(value, on_error=stream_error_members):
+                if body is not None:
+                    body.append(chunk)
+                    size += len(chunk)
+                    if size > max_cached_bytes:
+                        body = None
+                yield chunk
+        except Exception as e:
+            logger.error(f"Streaming payload for {key} failed: {e}")
+            return
+        if body is not None:
+            payload = EncodedPayload(b''.join(body))
+            self.registry.put(cache_key, versions, payload, payload.nbytes)
+            logger.info(f"Cached streamed payload for {key}: {size} bytes")
+        else:
+            logger.info(f"Streamed payload for {key} without caching")
+
+    def warm_up(self) -> None:
+        """Load and index every dataset so the first requests hit a warm cache"""
+        for dataset_id in self.list_dataset_ids():
+            try:
+                index = self.get_dataset_index(dataset_id)
+                if isinstance(index, TimeSeriesIndex):
+                    # Precompute the pyramid so zoomed-out views never aggregate on request
+                    version = self.dataset_version(dataset_id)
+                    for resolution in pyramid_resolutions(index.timeseries):
+                        self._get_level_index(dataset_id, version, index, resolution)
+            except Exception as e:
+                logger.error(f"Error warming dataset {dataset_id}: {e}")
+        logger.info(f"Dataset registry warmed: {self.registry.stats()}")
+
     def get_deserts_data(self):
         """Load the desert/land degradation GeoJSON data."""
         try:
@@ -0,0 +1,241 @@
+import atexit
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple, Union
+
+import h3
+import numpy as np
+from h3.api import basic_int as h3_int
+
+logger = logging.getLogger(__name__)
+
+# Hexagons have 6 vertices and pentagons 5; cells crossing an icosahedron
+# edge gain distortion vertices, up to 10 in total
+MAX_VERTICES = 10
+
+DEFAULT_MAX_CELLS = 1 << 18
+
+# Decimal places of emitted coordinates. Vertices are cached as float32, whose
+# spacing at longitudes of 100-180 degrees is 7.6e-6 to 1.5e-5 degrees (~1 m),
+# so the sixth decimal is finer than what is stored there; rounding only keeps
+# float32-to-float64 conversion noise out of the emitted JSON
+COORDINATE_DECIMALS = 6
+
+Cells = Union[Iterable[str], Iterable[int], np.ndarray]
+
+
+def configured_cache_path() -> Optional[str]:
+    """Return the geometry cache file from H3_GEOMETRY_CACHE, if persistence is enabled"""
+    return os.getenv('H3_GEOMETRY_CACHE') or None
+
+
+def to_cell_ints(cells: Cells) -> np.ndarray:
+    """Return H3 cells given as strings or integers as a uint64 array"""
+    if isinstance(cells, np.ndarray) and cells.dtype.kind in 'ui':
+        return cells.astype(np.uint64, copy=False)
+    cells = list(cells)
+    if cells and isinstance(cells[0], str):
+        return np.fromiter((h3.str_to_int(cell) for cell in cells), dtype=np.uint64, count=len(cells))
+    return np.asarray(cells, dtype=np.uint64)
+
+
+class CellGeometryCache:
+    """Bounded LRU cache of H3 cell boundaries keyed by integer cell id.
+
+    Boundaries are stored as (lng, lat) float32 vertices in fixed slots of
+    ``MAX_VERTICES`` with a vertex count per cell, about 80 bytes per cell.
+    Slots of evicted cells are reused, so memory stays at ``max_cells`` slots.
+    With a path the cache is loaded from and saved to an .npz file, so later
+    runs start warm.
+    """
+
+    def __init__(self, max_cells: int = DEFAULT_MAX_CELLS, path: str = None):
+        self.max_cells = max_cells
+        self.path = path
+        self.vertices = np.empty((0, MAX_VERTICES, 2), dtype=np.float32)
+        self.counts = np.empty(0, dtype=np.uint8)
+        self._slots: 'OrderedDict[int, int]' = OrderedDict()
+        self._free: List[int] = []
+        self._dirty = False
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    @property
+    def nbytes(self) -> int:
+        return self.vertices.nbytes + self.counts.nbytes
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self.counts)
+        new_capacity = min(self.max_cells, max(needed, capacity * 2, 1024))
+        if new_capacity <= capacity:
+            return
+        vertices = np.empty((new_capacity, MAX_VERTICES, 2), dtype=np.float32)
+        vertices[:capacity] = self.vertices
+        counts = np.zeros(new_capacity, dtype=np.uint8)
+        counts[:capacity] = self.counts
+        self.vertices, self.counts = vertices, counts
+        self._free.extend(range(new_capacity - 1, capacity - 1, -1))
+
+    def _allocate(self) -> int:
+        if not self._free:
+            self._grow(len(self.counts) + 1)
+        if not self._free:
+            # Full: reuse the slot of the least recently used cell
+            _, slot = self._slots.popitem(last=False)
+            return slot
+        return self._free.pop()
+
+    def _lookup(self, cells: np.ndarray) -> np.ndarray:
+        """Return the slots of at most max_cells distinct cells, computing missing boundaries"""
+        slots = np.empty(len(cells), dtype=np.int64)
+        missing = []
+        # Touch every hit first so the evictions below never hit a cell of this batch
+        for position, cell in enumerate(cells.tolist()):
+            slot = self._slots.get(cell)
+            if slot is None:
+                missing.append(position)
+            else:
+                self._slots.move_to_end(cell)
+                slots[position] = slot
+        self.hits += len(cells) - len(missing)
+        self.misses += len(missing)
+        if not missing:
+            return slots
+
+        to_boundary = h3_int.cell_to_boundary
+        boundaries = [to_boundary(int(cells[position])) for position in missing]
+        missing_slots = np.empty(len(missing), dtype=np.int64)
+        for i, position in enumerate(missing):
+            missing_slots[i] = slots[position] = self._allocate()
+            self._slots[int(cells[position])] = int(missing_slots[i])
+
+        counts = np.fromiter((len(boundary) for boundary in boundaries), dtype=np.uint8, count=len(boundaries))
+        for count in np.unique(counts).tolist():
+            group = np.nonzero(counts == count)[0]
+            # h3 returns (lat, lng) pairs; GeoJSON wants (lng, lat)
+            group_vertices = np.asarray([boundaries[i] for i in group.tolist()], dtype=np.float32)
+            self.vertices[missing_slots[group], :count] = group_vertices[:, :, ::-1]
+            self.counts[missing_slots[group]] = count
+        self._dirty = True
+        return slots
+
+    def boundaries(self, cells: Cells) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (n, MAX_VERTICES, 2) float32 lng/lat vertices and vertex counts for cells"""
+        cells = to_cell_ints(cells)
+        unique_cells, inverse = np.unique(cells, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        vertices = np.empty((len(unique_cells), MAX_VERTICES, 2), dtype=np.float32)
+        counts = np.empty(len(unique_cells), dtype=np.uint8)
+        with self._lock:
+            for start in range(0, len(unique_cells), self.max_cells):
+                chunk = slice(start, start + self.max_cells)
+                slots = self._lookup(unique_cells[chunk])
+                vertices[chunk] = self.vertices[slots]
+                counts[chunk] = self.counts[slots]
+        return vertices[inverse], counts[inverse]
+
+    def polygons(self, cells: Cells) -> List[List[List[List[float]]]]:
+        """Return closed GeoJSON polygon coordinates for every cell"""
+        vertices, counts = self.boundaries(cells)
+        polygons = [None] * len(counts)
+        # Cells sharing a vertex count are closed and converted in one array operation
+        for count in np.unique(counts).tolist():
+            positions = np.nonzero(counts == count)[0]
+            rings = vertices[positions, :count].astype(np.float64)
+            rings = np.round(np.concatenate([rings, rings[:, :1]], axis=1), COORDINATE_DECIMALS)
+            for position, ring in zip(positions.tolist(), rings.tolist()):
+                polygons[position] = [ring]
+        return polygons
+
+    def bounds(self, cells: Cells) -> np.ndarray:
+        """Return (n, 4) min_lng, min_lat, max_lng, max_lat of every cell"""
+        vertices, counts = self.boundaries(cells)
+        # Pad unused vertex slots with the first vertex so they never widen the bounds
+        unused = np.arange(MAX_VERTICES)[None, :] >= counts[:, None]
+        vertices = np.where(unused[:, :, None], vertices[:, :1], vertices).astype(np.float64)
+        return np.column_stack([vertices.min(axis=1), vertices.max(axis=1)])
+
+    def save(self, path: str = None) -> Optional[str]:
+        """Write the cached boundaries, least recently used first, to an .npz file"""
+        path = path or self.path
+        if not path:
+            return None
+        with self._lock:
+            cells = np.fromiter(self._slots.keys(), dtype=np.uint64, count=len(self._slots))
+            slots = np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots))
+            vertices, counts = self.vertices[slots], self.counts[slots]
+            self._dirty = False
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, cells=cells, vertices=vertices, counts=counts)
+        os.replace(tmp_path, path)
+        logger.info(f"Saved {len(cells)} H3 cell boundaries to {path}")
+        return path
+
+    def load(self, path: str) -> int:
+        """Add the most recently used boundaries of an .npz file to the cache"""
+        try:
+            with np.load(path) as data:
+                cells, vertices, counts = data['cells'], data['vertices'], data['counts']
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable H3 geometry cache {path}: {str(e)}")
+            return 0
+        keep = slice(max(0, len(cells) - self.max_cells), len(cells))
+        cells, vertices, counts = cells[keep], vertices[keep], counts[keep]
+        with self._lock:
+            for cell, cell_vertices, count in zip(cells.tolist(), vertices, counts.tolist()):
+                if cell in self._slots:
+                    continue
+                slot = self._allocate()
+                self.vertices[slot] = cell_vertices
+                self.counts[slot] = count
+                self._slots[cell] = slot
+        logger.info(f"Loaded {len(cells)} H3 cell boundaries from {path}")
+        return len(cells)
+
+    def save_if_changed(self) -> None:
+        if self._dirty and self.path:
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning(f"Could not save H3 geometry cache: {str(e)}")
+
+
+_geometry_cache = None
+_geometry_cache_lock = threading.Lock()
+
+
+def get_geometry_cache() -> CellGeometryCache:
+    """Return the process-wide geometry cache, persisted when H3_GEOMETRY_CACHE is set"""
+    global _geometry_cache
+    with _geometry_cache_lock:
+        if _geometry_cache is None:
+            _geometry_cache = CellGeometryCache(path=configured_cache_path())
+            if _geometry_cache.path:
+                atexit.register(_geometry_cache.save_if_changed)
+        return _geometry_cache
+
+
+def cell_polygons(cells: Cells) -> List[List[List[List[float]]]]:
+    """Return closed GeoJSON polygon coordinates for many H3 cells"""
+    return get_geometry_cache().polygons(cells)
+
+
+def cell_polygon(h3_index: str) -> List[List[List[float]]]:
+    """Return closed GeoJSON polygon coordinates for an H3 cell"""
+    return get_geometry_cache().polygons([h3_index])[0]
+
+
+def cell_bounds(cells: Cells) -> np.ndarray:
+    """Return (n, 4) bounding boxes for many H3 cells"""
+    return get_geometry_cache().bounds(cells)
@@ -0,0 +1,152 @@
+import logging
+import math
+from typing import List, Optional
+
+import h3
+import numpy as np
+
+from .h3_store import H3TimeSeries
+
+logger = logging.getLogger(__name__)
+
+# Per-metric aggregation used when rolling cells up to a parent resolution.
+# Datasets can override these with an ``aggregations`` mapping in their metadata.
+DEFAULT_AGGREGATIONS = {
+    'deaths_total': 'sum',
+    'land_degradation': 'mean'
+}
+
+# Fallback aggregation for metrics without an explicit entry, by storage kind
+KIND_AGGREGATIONS = {
+    'int': 'sum',
+    'float': 'mean',
+    'category': 'mode',
+    'list': 'mode'
+}
+
+AGGREGATIONS = ('sum', 'mean', 'mode')
+
+# One H3 resolution step shrinks a cell's edge by ~sqrt(7), i.e. ~1.4 zoom levels
+ZOOMS_PER_RESOLUTION = math.log2(math.sqrt(7))
+
+
+def resolution_for_zoom(zoom: float) -> int:
+    """Return the H3 resolution that keeps the number of cells per screen roughly constant"""
+    return max(0, min(15, int(zoom / ZOOMS_PER_RESOLUTION)))
+
+
+def source_resolution(timeseries: H3TimeSeries) -> Optional[int]:
+    """Return the finest H3 resolution stored in a time series"""
+    if not len(timeseries.cells):
+        return None
+    return max(h3.get_resolution(cell) for cell in timeseries.cell_ids)
+
+
+def metric_aggregation(timeseries: H3TimeSeries, metric: str) -> str:
+    """Return the aggregation used for one metric of a time series"""
+    overrides = timeseries.metadata.get('aggregations') or {}
+    aggregation = overrides.get(metric) or DEFAULT_AGGREGATIONS.get(metric)
+    kind = timeseries.metric_kinds[metric]
+    if aggregation is None or (kind in ('category', 'list') and aggregation != 'mode'):
+        # Codes of dictionary-encoded metrics can only be counted, never added
+        aggregation = KIND_AGGREGATIONS[kind]
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation for {metric}: {aggregation}")
+    return aggregation
+
+
+def _sum(values: np.ndarray, inverse: np.ndarray, parent_count: int) -> np.ndarray:
+    if values.dtype.kind != 'f':
+        # Counts are summed in int64: a parent's total can overflow the children's int32
+        totals = np.zeros((values.shape[0], parent_count), dtype=np.int64)
+        np.add.at(totals, (slice(None), inverse), values.astype(np.int64))
+        return totals
+    totals = np.zeros((values.shape[0], parent_count), dtype=np.float64)
+    present = ~np.isnan(values)
+    np.add.at(totals, (slice(None), inverse), np.nan_to_num(values))
+    # Parents whose children are all missing stay missing
+    counts = np.zeros_like(totals)
+    np.add.at(counts, (slice(None), inverse), present)
+    totals[counts == 0] = np.nan
+    return totals
+
+
+def _mean(values: np.ndarray, inverse: np.ndarray, parent_count: int) -> np.ndarray:
+    values = values.astype(np.float64)
+    present = ~np.isnan(values)
+    totals = np.zeros((values.shape[0], parent_count), dtype=np.float64)
+    counts = np.zeros_like(totals)
+    np.add.at(totals, (slice(None), inverse), np.where(present, values, 0.0))
+    np.add.at(counts, (slice(None), inverse), present)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+
+def _mode(codes: np.ndarray, inverse: np.ndarray, parent_count: int) -> np.ndarray:
+    """Most frequent non-missing code per (year, parent); ties go to the lower code"""
+    rows = codes.shape[0]
+    result = np.full((rows, parent_count), -1, dtype=np.int32)
+    row_index, column_index = np.nonzero(codes >= 0)
+    if not len(row_index):
+        return result
+
+    category_count = int(codes.max()) + 1
+    groups = row_index * parent_count + inverse[column_index]
+    keys = groups.astype(np.int64) * category_count + codes[row_index, column_index]
+    unique_keys, counts = np.unique(keys, return_counts=True)
+    unique_groups = unique_keys // category_count
+
+    # Sort by group, then by descending count; the first entry of each group wins
+    order = np.lexsort((-counts, unique_groups))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = unique_groups[order][1:] != unique_groups[order][:-1]
+    winners = order[first]
+    result.reshape(-1)[unique_groups[winners]] = unique_keys[winners] % category_count
+    return result
+
+
+_AGGREGATORS = {
+    'sum': _sum,
+    'mean': _mean,
+    'mode': _mode
+}
+
+
+def aggregate_to_resolution(timeseries: H3TimeSeries, resolution: int) -> H3TimeSeries:
+    """Roll a time series up to its parent cells at a coarser resolution"""
+    parents = [
+        h3.str_to_int(h3.cell_to_parent(cell, min(resolution, h3.get_resolution(cell))))
+        for cell in timeseries.cell_ids
+    ]
+    parent_cells, inverse = np.unique(np.asarray(parents, dtype=np.uint64), return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    metrics, metric_kinds, aggregations = {}, {}, {}
+    for metric, values in timeseries.metrics.items():
+        aggregation = metric_aggregation(timeseries, metric)
+        aggregated = _AGGREGATORS[aggregation](values, inverse, len(parent_cells))
+        kind = timeseries.metric_kinds[metric]
+        if aggregation == 'mean' and kind == 'int':
+            kind = 'float'
+        metrics[metric] = aggregated
+        metric_kinds[metric] = kind
+        aggregations[metric] = aggregation
+
+    metadata = dict(
+        timeseries.metadata,
+        cell_count=len(parent_cells),
+        h3_resolution=resolution,
+        source_h3_resolution=source_resolution(timeseries),
+        aggregations=aggregations
+    )
+    return H3TimeSeries(parent_cells, timeseries.years, metrics, metric_kinds,
+                        timeseries.categories, metadata, timeseries.static_properties)
+
+
+def pyramid_resolutions(timeseries: H3TimeSeries, min_resolution: int = 0) -> List[int]:
+    """Return the coarser resolutions a pyramid over this time series holds"""
+    finest = source_resolution(timeseries)
+    if finest is None:
+        return []
+    return list(range(min_resolution, finest))
+
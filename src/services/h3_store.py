@@ -0,0 +1,258 @@
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import h3
+import numpy as np
+
+from .h3_geometry import cell_polygons
+
+logger = logging.getLogger(__name__)
+
+H3TS_SUFFIX = '.h3ts.npz'
+
+
+def timeseries_path(path: str) -> str:
+    """Return the columnar counterpart of a GeoJSON output path"""
+    path = str(path)
+    if path.endswith(H3TS_SUFFIX):
+        return path
+    if path.endswith('.geojson'):
+        path = path[:-len('.geojson')]
+    return path + H3TS_SUFFIX
+
+
+def dataset_id_for_path(path: Path) -> str:
+    """Return the dataset id for a GeoJSON or columnar dataset file"""
+    name = Path(path).name
+    if name.endswith(H3TS_SUFFIX):
+        return name[:-len(H3TS_SUFFIX)]
+    return Path(path).stem
+
+
+class H3TimeSeries:
+    """Columnar H3 dataset: one cell column, a year axis and dense metric arrays.
+
+    Every metric is stored as an array of shape ``(len(years), len(cells))``.
+    Numeric metrics are kept as int or float arrays, string and list metrics
+    are dictionary encoded into int32 codes (``-1`` meaning missing). Cell
+    geometry is never stored; it is derived from the H3 index on demand.
+    """
+
+    def __init__(self, cells: np.ndarray, years: np.ndarray, metrics: Dict[str, np.ndarray],
+                 metric_kinds: Dict[str, str], categories: Dict[str, List[Any]],
+                 metadata: Dict[str, Any] = None, static_properties: Dict[str, Any] = None):
+        self.cells = np.asarray(cells, dtype=np.uint64)
+        self.years = np.asarray(years, dtype=np.int32)
+        self.metrics = metrics
+        self.metric_kinds = metric_kinds
+        self.categories = categories
+        self.metadata = metadata or {}
+        self.static_properties = static_properties or {}
+        self._cell_ids = None
+        self._year_lookup = {int(year): i for i, year in enumerate(self.years)}
+
+    @classmethod
+    def from_records(cls, records: Dict[Tuple[str, int], Dict[str, Any]], years: Iterable[int],
+                     metadata: Dict[str, Any] = None,
+                     static_properties: Dict[str, Any] = None) -> 'H3TimeSeries':
+        """Build a time series from ``{(h3_index, year): metrics}`` records.
+
+        Missing (cell, year) entries become 0 for integer metrics, NaN for
+        float metrics and None for string and list metrics.
+        """
+        years = np.array(sorted(set(int(y) for y in years)), dtype=np.int32)
+        year_lookup = {int(year): i for i, year in enumerate(years)}
+        cells = np.array(sorted(set(h3.str_to_int(cell) for cell, _ in records.keys())), dtype=np.uint64)
+        cell_lookup = {int(cell): i for i, cell in enumerate(cells)}
+
+        # Collect raw values per metric so the storage kind can be inferred
+        raw_values: Dict[str, List[Tuple[int, int, Any]]] = {}
+        for (cell, year), values in records.items():
+            if int(year) not in year_lookup:
+                continue
+            col = cell_lookup[h3.str_to_int(cell)]
+            row = year_lookup[int(year)]
+            for metric, value in values.items():
+                raw_values.setdefault(metric, []).append((row, col, value))
+
+        shape = (len(years), len(cells))
+        metrics, metric_kinds, categories = {}, {}, {}
+        for metric, entries in raw_values.items():
+            present = [value for _, _, value in entries if value is not None]
+            if present and all(isinstance(v, (list, tuple, set)) for v in present):
+                kind = 'list'
+            elif present and all(isinstance(v, str) for v in present):
+                kind = 'category'
+            elif all(isinstance(v, (int, np.integer)) and not isinstance(v, bool) for v in present) \
+                    and len(present) == len(entries):
+                kind = 'int'
+            else:
+                kind = 'float'
+
+            if kind in ('list', 'category'):
+                array = np.full(shape, -1, dtype=np.int32)
+                lookup = {}
+                for row, col, value in entries:
+                    if value is None:
+                        continue
+                    key = tuple(sorted(str(v) for v in value)) if kind == 'list' else value
+                    if key not in lookup:
+                        lookup[key] = len(lookup)
+                    array[row, col] = lookup[key]
+                categories[metric] = [list(key) if kind == 'list' else key for key in lookup]
+            elif kind == 'int':
+                array = np.zeros(shape, dtype=np.int64)
+                for row, col, value in entries:
+                    array[row, col] = value
+                if array.size and np.abs(array).max() < np.iinfo(np.int32).max:
+                    array = array.astype(np.int32)
+            else:
+                array = np.full(shape, np.nan, dtype=np.float64)
+                for row, col, value in entries:
+                    array[row, col] = np.nan if value is None else float(value)
+
+            metrics[metric] = array
+            metric_kinds[metric] = kind
+
+        return cls(cells, years, metrics, metric_kinds, categories, metadata, static_properties)
+
+    @classmethod
+    def load(cls, path: str) -> 'H3TimeSeries':
+        """Load a columnar dataset written by :meth:`save`"""
+        with np.load(path, allow_pickle=False) as archive:
+            header = json.loads(str(archive['header']))
+            metrics = {
+                metric: archive[f"metric:{metric}"]
+                for metric in header['metric_kinds']
+            }
+            return cls(
+                archive['cells'],
+                archive['years'],
+                metrics,
+                header['metric_kinds'],
+                header.get('categories', {}),
+                header.get('metadata', {}),
+                header.get('static_properties', {})
+            )
+
+    def save(self, path: str) -> str:
+        """Write the dataset as a compressed ``.h3ts.npz`` archive"""
+        path = timeseries_path(path)
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        header = {
+            'metric_kinds': self.metric_kinds,
+            'categories': self.categories,
+            'metadata': self.metadata,
+            'static_properties': self.static_properties
+        }
+        arrays = {f"metric:{metric}": values for metric, values in self.metrics.items()}
+        # np.savez appends .npz itself unless the name already carries it
+        with open(path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                cells=self.cells,
+                years=self.years,
+                header=np.array(json.dumps(header)),
+                **arrays
+            )
+        logger.info(f"Saved H3 time series with {len(self.cells)} cells x {len(self.years)} years to {path}")
+        return path
+
+    @property
+    def cell_ids(self) -> List[str]:
+        """H3 indexes as strings, in column order"""
+        if self._cell_ids is None:
+            self._cell_ids = [h3.int_to_str(int(cell)) for cell in self.cells]
+        return self._cell_ids
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the cell, year and metric arrays"""
+        return self.cells.nbytes + self.years.nbytes + sum(values.nbytes for values in self.metrics.values())
+
+    @property
+    def metric_names(self) -> List[str]:
+        return list(self.metrics.keys())
+
+    def year_index(self, year: int) -> Optional[int]:
+        """Return the row for a year, or None if the year is not stored"""
+        return self._year_lookup.get(int(year))
+
+    def select_cells(self, cell_ids: Iterable[str]) -> 'H3TimeSeries':
+        """Return a new time series restricted to the given cells"""
+        wanted = np.array(sorted(h3.str_to_int(cell) for cell in cell_ids), dtype=np.uint64)
+        mask = np.isin(self.cells, wanted)
+        metrics = {metric: values[:, mask] for metric, values in self.metrics.items()}
+        metadata = dict(self.metadata, cell_count=int(mask.sum()))
+        return H3TimeSeries(self.cells[mask], self.years, metrics, self.metric_kinds,
+                            self.categories, metadata, self.static_properties)
+
+    def decode_metric(self, metric: str, row: int, columns: np.ndarray = None) -> List[Any]:
+        """Return plain Python values for one metric at one year row"""
+        values = self.metrics[metric][row]
+        if columns is not None:
+            values = values[columns]
+        kind = self.metric_kinds[metric]
+        if kind in ('list', 'category'):
+            categories = self.categories[metric]
+            return [categories[code] if code >= 0 else None for code in values.tolist()]
+        if kind == 'float':
+            return [None if value != value else value for value in values.tolist()]
+        return values.tolist()
+
+    def year_properties(self, row: int, columns: np.ndarray = None,
+                        metrics: List[str] = None) -> List[Dict[str, Any]]:
+        """Return GeoJSON-style properties for every selected cell at one year row"""
+        metrics = metrics or self.metric_names
+        cell_ids = self.cell_ids
+        if columns is None:
+            columns = np.arange(len(self.cells))
+        year = int(self.years[row])
+        timestamp = datetime(year, 1, 1).isoformat()
+        decoded = {metric: self.decode_metric(metric, row, columns) for metric in metrics}
+
+        properties = []
+        for position, column in enumerate(columns.tolist()):
+            props = {
+                'h3_index': cell_ids[column],
+                'year': year,
+                'timestamp': timestamp,
+                'metrics': {metric: decoded[metric][position] for metric in metrics}
+            }
+            props.update(self.static_properties)
+            properties.append(props)
+        return properties
+
+    def iter_features(self, years: Iterable[int] = None) -> Iterator[Dict[str, Any]]:
+        """Yield per-(cell, year) GeoJSON features one year row at a time"""
+        rows = range(len(self.years)) if years is None else [
+            row for row in (self.year_index(year) for year in years) if row is not None
+        ]
+        polygons = None
+        for row in rows:
+            if polygons is None:
+                polygons = dict(zip(self.cell_ids, cell_polygons(self.cells)))
+            for props in self.year_properties(row):
+                yield {
+                    'type': 'Feature',
+                    'geometry': {
+                        'type': 'Polygon',
+                        'coordinates': polygons[props['h3_index']]
+                    },
+                    'properties': props
+                }
+
+    def to_geojson(self, years: Iterable[int] = None, lazy: bool = False) -> Dict[str, Any]:
+        """Expand to the per-(cell, year) FeatureCollection served to the map.
+
+        With ``lazy=True`` the features are a generator, for streaming encoders.
+        """
+        features = self.iter_features(years)
+        return {
+            'type': 'FeatureCollection',
+            'features': features if lazy else list(features),
+            'metadata': self.metadata
+        }
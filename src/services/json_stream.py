@@ -0,0 +1,113 @@
+import json
+import zlib
+from typing import Any, Callable, Dict, Iterable, Iterator
+
+CHUNK_SIZE = 64 * 1024
+
+# Containers nested deeper than this are encoded in one json.dumps call.
+# For {"datasets": [{"data": {"features": [feature, ...]}}]} the envelope is
+# depth 0 and the features list depth 4, so this streams the envelope, each
+# dataset, each FeatureCollection and its features list, and encodes every
+# feature (depth 5) as a whole.
+MAX_STREAM_DEPTH = 5
+
+_encoder = json.JSONEncoder(separators=(',', ':'))
+
+
+def _is_lazy(value: Any) -> bool:
+    return isinstance(value, Iterator)
+
+
+def _iter_value(value: Any, depth: int) -> Iterator[str]:
+    """Yield the parts of one value; if it fails before writing anything, write null"""
+    started = False
+    try:
+        for part in _iter_parts(value, depth):
+            started = True
+            yield part
+    except Exception:
+        if not started:
+            yield 'null'
+        raise
+
+
+def _iter_parts(value: Any, depth: int,
+                on_error: Callable[[Exception], Dict[str, Any]] = None) -> Iterator[str]:
+    """Yield the JSON text of value in parts.
+
+    A container whose content fails is closed before the error propagates,
+    so the text written so far stays well-formed. The members on_error
+    returns are appended to a failing top-level object.
+    """
+    if _is_lazy(value) or (isinstance(value, (list, tuple)) and depth < MAX_STREAM_DEPTH):
+        yield '['
+        try:
+            for i, item in enumerate(value):
+                if i:
+                    yield ','
+                yield from _iter_value(item, depth + 1)
+        except Exception:
+            yield ']'
+            raise
+        yield ']'
+    elif isinstance(value, dict) and depth < MAX_STREAM_DEPTH:
+        yield '{'
+        members = 0
+        try:
+            for key, item in value.items():
+                if members:
+                    yield ','
+                members += 1
+                yield _encoder.encode(str(key))
+                yield ':'
+                yield from _iter_value(item, depth + 1)
+        except Exception as e:
+            if on_error is not None:
+                for key, item in on_error(e).items():
+                    yield f",{_encoder.encode(str(key))}:" if members else f"{_encoder.encode(str(key))}:"
+                    members += 1
+                    yield _encoder.encode(item)
+            yield '}'
+            raise
+        yield '}'
+    else:
+        yield _encoder.encode(value)
+
+
+def iter_json_chunks(value: Any, chunk_size: int = CHUNK_SIZE,
+                     on_error: Callable[[Exception], Dict[str, Any]] = None) -> Iterator[bytes]:
+    """Encode value as JSON incrementally, yielding UTF-8 chunks.
+
+    Lists, dicts and any iterators (generators included) near the top of the
+    structure are written item by item, so a response can start before its
+    datasets have all been loaded and never exists as one string.
+
+    If encoding fails part way, the open containers are closed, the members
+    returned by on_error(exception) are added to the top-level object, the
+    rest of the text is yielded and the exception is re-raised. Clients thus
+    receive valid JSON that reports the failure instead of a truncated body.
+    """
+    buffer, size = [], 0
+    try:
+        for part in _iter_parts(value, 0, on_error):
+            buffer.append(part)
+            size += len(part)
+            if size >= chunk_size:
+                yield ''.join(buffer).encode('utf-8')
+                buffer, size = [], 0
+    except Exception:
+        if buffer:
+            yield ''.join(buffer).encode('utf-8')
+        raise
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a chunk stream into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,22 +1,61 @@
 import pydeck as pdk
 import pandas as pd
 import geopandas as gpd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Sequence
+from functools import lru_cache
 import os
 import json
 from .policy_service import PolicyService
+from .h3_store import H3TimeSeries, timeseries_path
+from .raster_h3 import raster_to_cells, cell_features
+from .h3_geometry import cell_polygons
+from .classification import COLOR_RAMPS, build_legend, classify, normalized_colors
 import h3
 import random
 import numpy as np
 from datetime import datetime, timedelta
 import logging
-import rasterio
-from rasterio.warp import transform_bounds
 from typing import Tuple, List
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+SDG_SAMPLE_PATH = 'data/sdg_panama_sample.geojson'
+
+SDG_DEFAULT_METRICS = {
+    'land_degradation': 0.0,
+    'soil_organic_carbon': 0.0,
+    'vegetation_cover': 0.0,
+    'biodiversity_index': 0.0
+}
+
+# Land degradation at or above each threshold is one impact level worse,
+# from Minimal Impact below 0.2 up to Critical Impact at 0.8
+SDG_DEGRADATION_THRESHOLDS = [0.2, 0.4, 0.6, 0.8]
+
+# Longitude the animated impact wave is centred on
+PATTERN_BASE_LONGITUDE = 34.5085
+
+
+@lru_cache(maxsize=8)
+def cell_pattern_basis(cell_ids: Tuple[str, ...]) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the centre longitude and seeded random factor of every cell.
+
+    The random factor is the first draw of a generator seeded with the
+    cell's last four hex digits, scaled to 0-0.1. Cells that are not valid
+    H3 indexes get NaN for both.
+    """
+    longitudes = np.full(len(cell_ids), np.nan)
+    random_factors = np.full(len(cell_ids), np.nan)
+    for i, h3_index in enumerate(cell_ids):
+        try:
+            longitudes[i] = h3.cell_to_latlng(h3_index)[1]
+            random_factors[i] = random.Random(int(h3_index[-4:], 16)).random() * 0.1
+        except Exception as e:
+            logger.error(f"Error in cell pattern basis for hex {h3_index}: {str(e)}")
+    return longitudes, random_factors
+
+
 class MapService:
     def __init__(self):
         self.policy_service = PolicyService()
@@ -37,6 +76,7 @@ class MapService:
             'Minimal Impact': '#2e7d32'     # Dark green
         }
         self.impact_levels = list(self.impact_colors.keys())
+        self._sdg_layer = None
         logger.info("MapService initialized with %d impact levels", len(self.impact_levels))
 
     def get_base_map_config(self):
@@ -105,95 +145,135 @@ class MapService:
             self.default_view_state["zoom"] = zoom
         return self.default_view_state
 
-    def _generate_cell_pattern(self, h3_index: str, timestamp: datetime) -> dict:
-        """Generate dynamic impact patterns for each H3 cell based on time and location"""
-        try:
-            # Get cell coordinates for spatial wave effect
-            cell_center = h3.cell_to_latlng(h3_index)
-            
-            # Use longitude for wave progression (west to east)
-            base_longitude = 34.5085  # Center longitude
-            longitude_diff = cell_center[1] - base_longitude
-            
-            # Calculate spatial phase (longitude-based)
-            spatial_phase = longitude_diff * 0.5  # Adjust multiplier to control wave width
-            
-            # Calculate temporal phase (0-2π over the year)
-            if timestamp.tzinfo is not None:
-                timestamp = timestamp.replace(tzinfo=None)
-            year_start = datetime(timestamp.year, 1, 1)
-            days_in_year = (timestamp - year_start).days
-            time_phase = (2 * np.pi * days_in_year) / 365
-            
-            # Combine spatial and temporal phases for wave effect
-            combined_phase = time_phase + spatial_phase
-            
-            # Generate wave pattern (0-1)
-            wave = (np.sin(combined_phase) + 1) / 2
-            
-            # Add some randomness (10% random variation)
-            cell_seed = int(h3_index[-4:], 16)
-            random.seed(cell_seed)
-            random_factor = random.random() * 0.1
-            
-            # Make the combined factor more stable but still animated
-            combined_factor = (wave * 0.3) + (random_factor * 0.1) + 0.6  # Base value of 0.6
-            
-            # Map to impact level with smoother transition
-            simplified_impacts = [
-                'Critical Impact',
-                'High Impact',
-                'Medium Impact',
-                'Low Impact',
-                'Minimal Impact'
-            ]
-            
-            index = min(int(combined_factor * len(simplified_impacts)), len(simplified_impacts) - 1)
-            impact_level = simplified_impacts[index]
-            
-            # Calculate metrics with more stable base values
-            base_hectares = 2000
-            max_additional_hectares = 2000
-            hectares = int(base_hectares + combined_factor * max_additional_hectares)
-            
-            base_communities = 100
-            max_additional_communities = 100
-            communities = int(base_communities + combined_factor * max_additional_communities)
-            
-            base_efficiency = 80
-            max_additional_efficiency = 15
-            efficiency = int(base_efficiency + combined_factor * max_additional_efficiency)
-            
-            # Ensure impact_level is valid
-            if impact_level not in self.impact_colors:
-                impact_level = self.impact_levels[0]  # Use first level as default
-                
-            # Always return a valid hex color
-            color = self.impact_colors[impact_level]
-            if not color.startswith('#'):
-                color = '#' + color
-                
-            return {
-                'impact_level': impact_level,
-                'color': color,  # Ensure this is a valid hex color
+    def cell_pattern_arrays(self, cell_ids: Sequence[str], timestamp: datetime,
+                            cache: bool = True) -> Dict[str, np.ndarray]:
+        """Compute the time-based impact pattern of many H3 cells as arrays.
+
+        Returns impact level indexes, hectares, communities, efficiency and a
+        validity mask per cell. Cell centres and random factors are cached per
+        cell list, so animating the same dataset only evaluates the wave.
+        """
+        basis = cell_pattern_basis if cache else cell_pattern_basis.__wrapped__
+        longitudes, random_factors = basis(tuple(cell_ids))
+
+        # Calculate temporal phase (0-2π over the year)
+        if timestamp.tzinfo is not None:
+            timestamp = timestamp.replace(tzinfo=None)
+        year_start = datetime(timestamp.year, 1, 1)
+        days_in_year = (timestamp - year_start).days
+        time_phase = (2 * np.pi * days_in_year) / 365
+
+        # Longitude drives the wave progression (west to east)
+        spatial_phase = (longitudes - PATTERN_BASE_LONGITUDE) * 0.5
+
+        # Generate wave pattern (0-1)
+        wave = (np.sin(time_phase + spatial_phase) + 1) / 2
+
+        # Make the combined factor more stable but still animated
+        combined_factor = (wave * 0.3) + (random_factors * 0.1) + 0.6  # Base value of 0.6
+        valid = ~np.isnan(combined_factor)
+        combined_factor = np.where(valid, combined_factor, 0.0)
+
+        levels = len(self.impact_levels)
+        return {
+            'impact_index': np.minimum((combined_factor * levels).astype(np.int64), levels - 1),
+            'hectares_restored': (2000 + combined_factor * 2000).astype(np.int64),
+            'communities_affected': (100 + combined_factor * 100).astype(np.int64),
+            'cost_efficiency': (80 + combined_factor * 15).astype(np.int64),
+            'valid': valid
+        }
+
+    def generate_cell_patterns(self, cell_ids: Sequence[str], timestamp: datetime,
+                               cache: bool = True) -> List[dict]:
+        """Generate dynamic impact patterns for many H3 cells at one timestamp"""
+        arrays = self.cell_pattern_arrays(cell_ids, timestamp, cache)
+        return self._patterns_from_arrays(arrays, range(len(arrays['valid'])))
+
+    def _patterns_from_arrays(self, arrays: Dict[str, np.ndarray], positions) -> List[dict]:
+        """Build the pattern dicts of the cells at positions from cell_pattern_arrays output"""
+        positions = np.asarray(positions, dtype=np.int64)
+        colors = [self.impact_colors[level] for level in self.impact_levels]
+
+        patterns = []
+        for impact_index, hectares, communities, efficiency, valid in zip(
+            arrays['impact_index'][positions].tolist(), arrays['hectares_restored'][positions].tolist(),
+            arrays['communities_affected'][positions].tolist(), arrays['cost_efficiency'][positions].tolist(),
+            arrays['valid'][positions].tolist()
+        ):
+            if not valid:
+                patterns.append(self._default_cell_pattern())
+                continue
+            patterns.append({
+                'impact_level': self.impact_levels[impact_index],
+                'color': colors[impact_index],
                 'metrics': {
                     'hectares_restored': hectares,
                     'communities_affected': communities,
                     'cost_efficiency': f"{efficiency}%"
                 }
+            })
+        return patterns
+
+    def apply_cell_patterns(self, data: dict, timestamp: datetime) -> dict:
+        """Set the impact pattern at timestamp on every feature of a FeatureCollection"""
+        cell_ids = [feature['properties']['h3_index'] for feature in data['features']]
+        patterns = self.generate_cell_patterns(cell_ids, timestamp)
+        logger.debug(f"Generated patterns for {len(patterns)} hexes at {timestamp}")
+
+        for feature, pattern in zip(data['features'], patterns):
+            # Ensure color is present and valid
+            if 'color' not in pattern or not pattern['color'].startswith('#'):
+                pattern['color'] = '#ff0000'  # Default to red if invalid
+            feature['properties'].update(pattern)
+        return data
+
+    def generate_pattern_frames(self, data: dict, timestamps: Sequence[datetime]) -> List[dict]:
+        """Return animation frames of the impact patterns over timestamps.
+
+        The first frame is a keyframe carrying the whole FeatureCollection; each
+        later frame only lists the patterns of cells that changed since the
+        previous frame, keyed by H3 index.
+        """
+        if not timestamps:
+            return []
+        cell_ids = list(dict.fromkeys(feature['properties']['h3_index'] for feature in data['features']))
+        frames = [{
+            'timestamp': timestamps[0].isoformat(),
+            'keyframe': True,
+            'data': self.apply_cell_patterns(data, timestamps[0])
+        }]
+
+        fields = ('impact_index', 'hectares_restored', 'communities_affected', 'cost_efficiency')
+        previous = None
+        for timestamp in timestamps:
+            arrays = self.cell_pattern_arrays(cell_ids, timestamp)
+            state = np.column_stack([arrays[field] for field in fields])
+            if previous is not None:
+                changed = np.nonzero((state != previous).any(axis=1))[0]
+                patterns = self._patterns_from_arrays(arrays, changed)
+                frames.append({
+                    'timestamp': timestamp.isoformat(),
+                    'keyframe': False,
+                    'changes': {cell_ids[position]: pattern for position, pattern in zip(changed.tolist(), patterns)}
+                })
+            previous = state
+        return frames
+
+    def _default_cell_pattern(self) -> dict:
+        """Pattern used for cells whose index cannot be resolved"""
+        return {
+            'impact_level': self.impact_levels[0],
+            'color': '#ff0000',  # Fallback to red
+            'metrics': {
+                'hectares_restored': 1000,
+                'communities_affected': 50,
+                'cost_efficiency': "70%"
             }
-        except Exception as e:
-            logger.error(f"Error in _generate_cell_pattern for hex {h3_index}: {str(e)}")
-            # Return a valid default color
-            return {
-                'impact_level': self.impact_levels[0],
-                'color': '#ff0000',  # Fallback to red
-                'metrics': {
-                    'hectares_restored': 1000,
-                    'communities_affected': 50,
-                    'cost_efficiency': "70%"
-                }
-            }
+        }
+
+    def _generate_cell_pattern(self, h3_index: str, timestamp: datetime) -> dict:
+        """Generate dynamic impact patterns for each H3 cell based on time and location"""
+        return self.generate_cell_patterns([h3_index], timestamp, cache=False)[0]
 
     def generate_hexagon_data(self, center_lat: float, center_lng: float, timestamp: datetime) -> dict:
         """Generate GeoJSON with dynamic H3 cell data"""
@@ -207,20 +287,15 @@ class MapService:
             hexagons = h3.grid_disk(center_hex, 2)  # Changed from grid_ring
             logger.debug(f"Generated {len(hexagons)} hexagons")
             
+            # Get cell patterns for this timestamp
+            patterns = self.generate_cell_patterns(hexagons, timestamp)
+
+            # Get closed hex boundaries from the shared geometry cache
+            polygons = cell_polygons(hexagons)
+
             features = []
-            for hex_id in hexagons:
+            for hex_id, cell_data, coordinates in zip(hexagons, patterns, polygons):
                 try:
-                    # Get cell pattern for this timestamp
-                    cell_data = self._generate_cell_pattern(hex_id, timestamp)
-                    
-                    # Get hex boundary using updated function
-                    boundary = h3.cell_to_boundary(hex_id)
-                    
-                    # Create properly formatted coordinates array
-                    coordinates = [[[vertex[1], vertex[0]] for vertex in boundary]]
-                    # Close the polygon by repeating the first point
-                    coordinates[0].append(coordinates[0][0])
-                    
                     feature = {
                         'type': 'Feature',
                         'geometry': {
@@ -263,264 +338,179 @@ class MapService:
     def tiff_to_h3_cells(self, tiff_path: str, resolution: int = 5) -> dict:
         """Convert a TIFF file to H3 cells with values"""
         try:
-            with rasterio.open(tiff_path) as dataset:
-                logger.info(f"TIFF CRS: {dataset.crs}")
-                bounds = dataset.bounds  # Store bounds here
-                logger.info(f"TIFF Bounds: {bounds}")
-                logger.info(f"TIFF Transform: {dataset.transform}")
-
-                # Read the data and get the transformation parameters
-                data = dataset.read(1)  # Read first band
-                height, width = data.shape
-                
-                # Create arrays for row/col coordinates
-                rows, cols = np.meshgrid(np.arange(height), np.arange(width), indexing='ij')
-                
-                # Transform pixel coordinates to lat/lon
-                xs, ys = rasterio.transform.xy(dataset.transform, rows.flatten(), cols.flatten())
-                xs = np.array(xs).reshape((height, width))
-                ys = np.array(ys).reshape((height, width))
-                
-                # If the CRS is not WGS84, transform coordinates
-                if str(dataset.crs).upper() != 'EPSG:4326':
-                    from rasterio.warp import transform
-                    from pyproj import CRS
-                    
-                    logger.info(f"Converting from {dataset.crs} to EPSG:4326")
-                    
-                    # Create transformer
-                    src_crs = dataset.crs
-                    dst_crs = CRS.from_epsg(4326)
-                    
-                    # Transform bounds to WGS84
-                    bounds_lngs, bounds_lats = transform(src_crs, dst_crs, 
-                        [bounds.left, bounds.right], 
-                        [bounds.bottom, bounds.top])
-                    bounds = rasterio.coords.BoundingBox(
-                        left=min(bounds_lngs),
-                        bottom=min(bounds_lats),
-                        right=max(bounds_lngs),
-                        top=max(bounds_lats)
-                    )
-                    
-                    # Flatten coordinate arrays for transformation
-                    xs_flat = xs.flatten()
-                    ys_flat = ys.flatten()
-                    
-                    # Transform coordinates
-                    lngs, lats = transform(src_crs, dst_crs, xs_flat, ys_flat)
-                    
-                    # Reshape back to grid
-                    lngs = np.array(lngs).reshape((height, width))
-                    lats = np.array(lats).reshape((height, width))
-                    
-                    logger.info(f"Transformed bounds: {bounds}")
-                else:
-                    lngs, lats = xs, ys
-                
-                # Track processed H3 indices to avoid duplicates
-                processed_h3_cells = {}
-                
-                features = []
-                for i in range(height):
-                    for j in range(width):
-                        if data[i, j] != dataset.nodata and not np.isnan(data[i, j]):
-                            # Get coordinates for this pixel
-                            lng, lat = float(lngs[i, j]), float(lats[i, j])
-                            
-                            # Skip if coordinates are invalid
-                            if not (-180 <= lng <= 180 and -90 <= lat <= 90):
-                                logger.warning(f"Invalid coordinates: lat={lat}, lng={lng}")
-                                continue
-                            
-                            # Get H3 cell for this point
-                            try:
-                                h3_index = h3.latlng_to_cell(lat, lng, resolution)
-                            except Exception as e:
-                                logger.warning(f"Failed to create H3 cell for lat={lat}, lng={lng}: {e}")
-                                continue
-                            
-                            # Skip if we've already processed this cell
-                            if h3_index in processed_h3_cells:
-                                processed_h3_cells[h3_index]['count'] += 1
-                                processed_h3_cells[h3_index]['sum'] += data[i, j]
-                                continue
-                            
-                            # Store the initial value for this cell
-                            processed_h3_cells[h3_index] = {
-                                'sum': data[i, j],
-                                'count': 1
-                            }
-                            
-                            # Get cell boundary
-                            boundary = h3.cell_to_boundary(h3_index)
-                            coordinates = [[[vertex[1], vertex[0]] for vertex in boundary]]
-                            coordinates[0].append(coordinates[0][0])  # Close the polygon
-                            
-                            feature = {
-                                'type': 'Feature',
-                                'geometry': {
-                                    'type': 'Polygon',
-                                    'coordinates': coordinates
-                                },
-                                'properties': {
-                                    'h3_index': h3_index,
-                                    'value': float(data[i, j]),
-                                    'raw_value': float(data[i, j])
-                                }
-                            }
-                            features.append(feature)
-                
-                if not features:
-                    logger.warning("No valid features generated from TIFF file")
-                    return {
-                        'type': 'FeatureCollection',
-                        'features': [],
-                        'metadata': {
-                            'error': 'No valid features could be generated from the TIFF file'
-                        }
-                    }
-                
-                # Calculate final values and colors for each cell
-                min_val = min(cell['sum'] / cell['count'] for cell in processed_h3_cells.values())
-                max_val = max(cell['sum'] / cell['count'] for cell in processed_h3_cells.values())
-                value_range = max_val - min_val if max_val != min_val else 1.0
-                
-                for feature in features:
-                    h3_index = feature['properties']['h3_index']
-                    cell_data = processed_h3_cells[h3_index]
-                    avg_value = cell_data['sum'] / cell_data['count']
-                    
-                    # Normalize value and get color
-                    normalized_value = (avg_value - min_val) / value_range
-                    color = self._value_to_color(normalized_value)
-                    
-                    # Update feature properties
-                    feature['properties'].update({
-                        'value': avg_value,
-                        'normalized_value': normalized_value,
-                        'color': color
-                    })
-                
-                geojson = {
+            aggregates, info = raster_to_cells(tiff_path, resolution)
+            logger.info(f"TIFF CRS: {info['crs']}")
+            logger.info(f"TIFF Bounds: {info['bounds']}")
+
+            if not len(aggregates):
+                logger.warning("No valid features generated from TIFF file")
+                return {
                     'type': 'FeatureCollection',
-                    'features': features,
+                    'features': [],
                     'metadata': {
-                        'min_value': float(min_val),
-                        'max_value': float(max_val),
-                        'cell_count': len(features),
-                        'crs': str(dataset.crs),
-                        'bounds': {
-                            'left': float(bounds.left),
-                            'right': float(bounds.right),
-                            'top': float(bounds.top),
-                            'bottom': float(bounds.bottom)
-                        }
+                        'error': 'No valid features could be generated from the TIFF file'
                     }
                 }
-                
-                logger.info(f"Processed TIFF to {len(features)} H3 cells")
-                logger.info(f"Metadata: {geojson['metadata']}")
-                return geojson
-                
+
+            # Normalize cell averages and color them
+            normalized, min_val, max_val = aggregates.normalized_means()
+            properties = [
+                {
+                    'value': avg_value,
+                    'raw_value': float(raw_value),
+                    'normalized_value': normalized_value,
+                    'color': color
+                }
+                for avg_value, raw_value, normalized_value, color in zip(
+                    aggregates.means.tolist(), aggregates.first.tolist(), normalized.tolist(),
+                    normalized_colors(normalized, COLOR_RAMPS['impact'])
+                )
+            ]
+            features = cell_features(aggregates.cell_ids, properties)
+
+            geojson = {
+                'type': 'FeatureCollection',
+                'features': features,
+                'metadata': {
+                    'min_value': min_val,
+                    'max_value': max_val,
+                    'cell_count': len(features),
+                    'legend': build_legend(aggregates.means, 'linear', len(COLOR_RAMPS['impact']), 'impact',
+                                           metric='value'),
+                    'crs': info['crs'],
+                    'bounds': info['bounds']
+                }
+            }
+
+            logger.info(f"Processed TIFF to {len(features)} H3 cells")
+            logger.info(f"Metadata: {geojson['metadata']}")
+            return geojson
+
         except Exception as e:
             logger.error(f"Error processing TIFF file: {str(e)}", exc_info=True)
             raise e
 
-    def _value_to_color(self, normalized_value: float) -> str:
-        """Convert a normalized value (0-1) to a color hex string"""
-        # You can customize this color scheme
-        colors = [
-            '#d32f2f',  # red for low values
-            '#f57c00',  # orange
-            '#ffd700',  # yellow
-            '#7cb342',  # light green
-            '#2e7d32'   # dark green for high values
-        ]
-        
-        index = min(int(normalized_value * len(colors)), len(colors) - 1)
-        return colors[index]
+    def _sdg_sample_source(self) -> Tuple[str, tuple]:
+        """Return the SDG sample file to read and a version that changes when it is rewritten"""
+        for path in (SDG_SAMPLE_PATH, timeseries_path(SDG_SAMPLE_PATH)):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return path, (path, stat.st_size, stat.st_mtime_ns)
+        return None, None
 
-    def load_sdg_sample(self) -> dict:
-        """Load and process the SDG 15.3.1 sample dataset"""
-        try:
-            # Check if file exists
-            file_path = 'data/sdg_panama_sample.geojson'
-            if not os.path.exists(file_path):
-                logger.error(f"SDG sample file not found at {file_path}")
-                return {'type': 'FeatureCollection', 'features': []}
+    def _load_sdg_layer(self) -> dict:
+        """Return the processed SDG sample, re-reading it only when the file changed.
 
-            with open(file_path, 'r') as f:
+        Metrics are parsed and defaulted once, and the impact level and color
+        derived from land degradation are computed for all features at once.
+        """
+        path, version = self._sdg_sample_source()
+        layer = self._sdg_layer
+        if layer is not None and layer['version'] == version:
+            return layer
+
+        if path is None:
+            logger.error(f"SDG sample file not found at {SDG_SAMPLE_PATH}")
+            return None
+        if path.endswith('.geojson'):
+            with open(path, 'r') as f:
                 data = json.load(f)
-            
-            if not data or 'features' not in data:
-                logger.error("Invalid data format in SDG sample file")
-                return {'type': 'FeatureCollection', 'features': []}
+        else:
+            data = H3TimeSeries.load(path).to_geojson()
 
-            # Update view state to center on Panama
-            self.default_view_state.update({
-                "latitude": 8.4,
-                "longitude": -80.1,
-                "zoom": 7,
-                "pitch": 0,
-                "bearing": 0
-            })
-            
-            # Process features to ensure proper structure
-            for feature in data['features']:
-                if 'properties' not in feature:
-                    feature['properties'] = {}
-                
-                # Handle metrics if they're stored as a string
-                if isinstance(feature['properties'].get('metrics'), str):
-                    try:
-                        feature['properties']['metrics'] = json.loads(feature['properties']['metrics'])
-                    except json.JSONDecodeError:
-                        logger.error(f"Failed to parse metrics JSON for feature")
-                        feature['properties']['metrics'] = {}
-                
-                # Ensure metrics exist
-                if 'metrics' not in feature['properties']:
+        if not data or 'features' not in data:
+            logger.error("Invalid data format in SDG sample file")
+            return None
+
+        # Process features to ensure proper structure
+        features = data.pop('features')
+        for feature in features:
+            if 'properties' not in feature:
+                feature['properties'] = {}
+
+            # Handle metrics if they're stored as a string
+            if isinstance(feature['properties'].get('metrics'), str):
+                try:
+                    feature['properties']['metrics'] = json.loads(feature['properties']['metrics'])
+                except json.JSONDecodeError:
+                    logger.error(f"Failed to parse metrics JSON for feature")
                     feature['properties']['metrics'] = {}
-                
-                metrics = feature['properties']['metrics']
-                
-                # Add default metrics if missing
-                default_metrics = {
-                    'land_degradation': 0.0,
-                    'soil_organic_carbon': 0.0,
-                    'vegetation_cover': 0.0,
-                    'biodiversity_index': 0.0
-                }
-                
-                for metric, default_value in default_metrics.items():
-                    if metric not in metrics:
-                        metrics[metric] = default_value
-                
-                # Add color based on land degradation (default metric)
-                degradation = metrics['land_degradation']
-                
-                # Assign impact level and color based on degradation value
-                if degradation >= 0.8:
-                    impact = 'Critical Impact'
-                elif degradation >= 0.6:
-                    impact = 'High Impact'
-                elif degradation >= 0.4:
-                    impact = 'Medium Impact'
-                elif degradation >= 0.2:
-                    impact = 'Low Impact'
-                else:
-                    impact = 'Minimal Impact'
-                
-                feature['properties']['impact_level'] = impact
-                feature['properties']['color'] = self.impact_colors[impact]
-            
-            logger.info(f"Successfully loaded SDG sample with {len(data['features'])} features")
-            return data
-            
+
+            # Ensure metrics exist, adding default metrics if missing
+            metrics = feature['properties'].setdefault('metrics', {})
+            for metric, default_value in SDG_DEFAULT_METRICS.items():
+                metrics.setdefault(metric, default_value)
+
+        # Assign impact level and color based on land degradation (default metric)
+        degradation = np.array([feature['properties']['metrics']['land_degradation'] for feature in features],
+                               dtype=np.float64)
+        degradation_class = classify(degradation, SDG_DEGRADATION_THRESHOLDS)
+        # Missing degradation counts as the lowest class, Minimal Impact
+        impact_index = len(SDG_DEGRADATION_THRESHOLDS) - np.maximum(degradation_class, 0)
+        for feature, index in zip(features, impact_index.tolist()):
+            impact = self.impact_levels[index]
+            feature['properties']['impact_level'] = impact
+            feature['properties']['color'] = self.impact_colors[impact]
+
+        layer = {
+            'version': version,
+            'collection': data,
+            'features': features,
+            'cell_ids': tuple(feature['properties'].get('h3_index') for feature in features),
+            'impact_index': impact_index
+        }
+        self._sdg_layer = layer
+        logger.info(f"Successfully loaded SDG sample with {len(features)} features")
+        return layer
+
+    def _update_sdg_view_state(self) -> None:
+        # Update view state to center on Panama
+        self.default_view_state.update({
+            "latitude": 8.4,
+            "longitude": -80.1,
+            "zoom": 7,
+            "pitch": 0,
+            "bearing": 0
+        })
+
+    def load_sdg_sample(self) -> dict:
+        """Load and process the SDG 15.3.1 sample dataset.
+
+        Features share geometry and metrics with the cached layer; only their
+        properties dicts are fresh, so callers may update those in place.
+        """
+        try:
+            layer = self._load_sdg_layer()
+            if layer is None:
+                return {'type': 'FeatureCollection', 'features': []}
+            self._update_sdg_view_state()
+            return dict(layer['collection'], features=[
+                dict(feature, properties=dict(feature['properties'])) for feature in layer['features']
+            ])
         except Exception as e:
             logger.error(f"Error loading SDG sample data: {str(e)}", exc_info=True)
             return {
                 'type': 'FeatureCollection',
                 'features': []
             }
+
+    def load_water_management_layer(self, timestamp: datetime) -> dict:
+        """Return the SDG sample with every cell's impact pattern at timestamp"""
+        try:
+            layer = self._load_sdg_layer()
+            if layer is None:
+                return {'type': 'FeatureCollection', 'features': []}
+            self._update_sdg_view_state()
+            patterns = self.generate_cell_patterns(layer['cell_ids'], timestamp)
+            return dict(layer['collection'], features=[
+                dict(feature, properties={**feature['properties'], **pattern})
+                for feature, pattern in zip(layer['features'], patterns)
+            ])
+        except Exception as e:
+            logger.error(f"Error loading water management layer: {str(e)}", exc_info=True)
+            return {
+                'type': 'FeatureCollection',
+                'features': []
+            }
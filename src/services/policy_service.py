@@ -3,6 +3,7 @@ import json
 import random
 import math
 from typing import Dict, List
+from .h3_geometry import cell_polygon
 
 class PolicyService:
     def __init__(self):
@@ -50,9 +51,7 @@ class PolicyService:
                     processed_hexagons.add(hex_id)
                     
                     # Convert H3 index to polygon coordinates
-                    boundary = h3.cell_to_boundary(hex_id)
-                    polygon_coords = [[coord[1], coord[0]] for coord in boundary]
-                    polygon_coords.append(polygon_coords[0])
+                    polygon_coords = cell_polygon(hex_id)[0]
                     
                     # Calculate distance from center for this specific cluster
                     distance = h3.grid_distance(center_hex, hex_id)
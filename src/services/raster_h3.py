@@ -0,0 +1,354 @@
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import h3
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+from h3.api import basic_int as h3_int
+
+from .h3_geometry import cell_polygons
+
+logger = logging.getLogger(__name__)
+
+WGS84 = 'EPSG:4326'
+
+
+# Upper bound on pixels read and converted at once; peak memory scales with this
+DEFAULT_WINDOW_PIXELS = 1 << 20
+
+# Pixels sampled per H3 cell before reads are decimated; cells much larger
+# than a pixel keep at least this many samples. 0 (the default) reads full
+# resolution: decimation is opt-in because decimated cell means drift from
+# the exact ones. With 1024 block-averaged samples per cell a 0-1 raster read
+# at factor 12 measured a mean error of 0.0007 and a maximum of 0.017
+# (0.008 and 0.081 when point-sampled with nearest).
+DEFAULT_MIN_PIXELS_PER_CELL = 0
+
+KM_PER_DEGREE = 111.32
+
+
+class CellAggregates:
+    """Per-cell pixel statistics of one raster band, in order of first appearance.
+
+    ``first`` is the value of the first pixel (in row-major order) that fell
+    into each cell, matching what the per-pixel converters used to report;
+    ``positions`` holds that pixel's row-major index in the raster.
+    """
+
+    def __init__(self, cells: np.ndarray, sums: np.ndarray, counts: np.ndarray,
+                 minimums: np.ndarray, maximums: np.ndarray, first: np.ndarray,
+                 positions: np.ndarray):
+        self.cells = cells
+        self.sums = sums
+        self.counts = counts
+        self.minimums = minimums
+        self.maximums = maximums
+        self.first = first
+        self.positions = positions
+
+    @classmethod
+    def empty(cls, dtype=np.float64) -> 'CellAggregates':
+        values = np.empty(0, dtype=dtype)
+        return cls(np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.float64),
+                   np.empty(0, dtype=np.int64), values, values, values, np.empty(0, dtype=np.int64))
+
+    @classmethod
+    def combine(cls, parts: List['CellAggregates']) -> 'CellAggregates':
+        """Merge aggregates of disjoint pixel sets into one entry per cell"""
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        return _group(
+            np.concatenate([part.cells for part in parts]),
+            np.concatenate([part.sums for part in parts]),
+            np.concatenate([part.counts for part in parts]),
+            np.concatenate([part.minimums for part in parts]),
+            np.concatenate([part.maximums for part in parts]),
+            np.concatenate([part.first for part in parts]),
+            np.concatenate([part.positions for part in parts])
+        )
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (
+            self.cells, self.sums, self.counts, self.minimums, self.maximums, self.first, self.positions
+        ))
+
+    @property
+    def means(self) -> np.ndarray:
+        return self.sums / self.counts
+
+    @property
+    def cell_ids(self) -> List[str]:
+        return [h3.int_to_str(int(cell)) for cell in self.cells]
+
+    def normalized_means(self) -> Tuple[np.ndarray, float, float]:
+        """Return the cell means scaled to 0-1 together with their min and max"""
+        means = self.means
+        if not len(means):
+            return means, 0.0, 0.0
+        min_val, max_val = float(means.min()), float(means.max())
+        value_range = max_val - min_val if max_val != min_val else 1.0
+        return (means - min_val) / value_range, min_val, max_val
+
+
+def _group(cells: np.ndarray, sums: np.ndarray, counts: np.ndarray, minimums: np.ndarray,
+           maximums: np.ndarray, first: np.ndarray, positions: np.ndarray) -> CellAggregates:
+    """Reduce per-entry statistics to one entry per cell with array reductions"""
+    unique_cells, inverse = np.unique(cells, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    # Sorting by cell, then position, puts each cell's earliest pixel first
+    order = np.lexsort((positions, inverse))
+    group_counts = np.bincount(inverse, minlength=len(unique_cells))
+    starts = np.concatenate([[0], np.cumsum(group_counts)[:-1]])
+
+    first_entries = order[starts]
+    sums = np.add.reduceat(sums[order], starts)
+    counts = np.add.reduceat(counts[order], starts)
+    minimums = np.minimum.reduceat(minimums[order], starts)
+    maximums = np.maximum.reduceat(maximums[order], starts)
+    first = first[first_entries]
+    positions = positions[first_entries]
+
+    # Report cells in the order their first pixel appears, as a row-major scan would
+    appearance = np.argsort(positions, kind='stable')
+    return CellAggregates(unique_cells[appearance], sums[appearance], counts[appearance],
+                          minimums[appearance], maximums[appearance], first[appearance],
+                          positions[appearance])
+
+
+def pixel_centers(transform, rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the x/y coordinates of pixel centres from the affine coefficients"""
+    a, b, c, d, e, f = transform.a, transform.b, transform.c, transform.d, transform.e, transform.f
+    cols = cols + 0.5
+    rows = rows + 0.5
+    return a * cols + b * rows + c, d * cols + e * rows + f
+
+
+def raster_bounds(transform, width: int, height: int) -> Tuple[float, float, float, float]:
+    """Return (left, bottom, right, top) of a raster from its corner coordinates"""
+    xs, ys = pixel_centers(transform, np.array([0, 0, height, height]) - 0.5,
+                           np.array([0, width, 0, width]) - 0.5)
+    return float(xs.min()), float(ys.min()), float(xs.max()), float(ys.max())
+
+
+def to_wgs84(crs, xs: np.ndarray, ys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Reproject coordinates to longitude/latitude unless they already are"""
+    if crs is None or str(crs).upper() == WGS84:
+        return xs, ys
+    from rasterio.warp import transform
+    lngs, lats = transform(crs, WGS84, xs, ys)
+    return np.asarray(lngs), np.asarray(lats)
+
+
+def valid_pixels(data: np.ndarray, nodata: Optional[float]) -> np.ndarray:
+    """Return a mask of pixels holding real values"""
+    mask = np.ones(data.shape, dtype=bool)
+    if np.issubdtype(data.dtype, np.floating):
+        mask &= ~np.isnan(data)
+    if nodata is not None and not (isinstance(nodata, float) and np.isnan(nodata)):
+        mask &= data != nodata
+    return mask
+
+
+def points_to_cells(lats: np.ndarray, lngs: np.ndarray, resolution: int) -> np.ndarray:
+    """Return the H3 cell of every point as uint64.
+
+    h3 has no bulk conversion, so this is one C call per point without the
+    string round trip of the default API.
+    """
+    to_cell = h3_int.latlng_to_cell
+    return np.fromiter(
+        (to_cell(lat, lng, resolution) for lat, lng in zip(lats.tolist(), lngs.tolist())),
+        dtype=np.uint64,
+        count=len(lats)
+    )
+
+
+def aggregate_by_cell(cells: np.ndarray, values: np.ndarray, positions: np.ndarray = None) -> CellAggregates:
+    """Group pixel values by cell with array reductions"""
+    if not len(cells):
+        return CellAggregates.empty(values.dtype)
+    if positions is None:
+        positions = np.arange(len(cells), dtype=np.int64)
+    # Minimum, maximum and first keep the band's dtype; sums are accumulated in float64
+    return _group(cells, values.astype(np.float64), np.ones(len(cells), dtype=np.int64),
+                  values, values, values, positions)
+
+
+def aggregate_band(data: np.ndarray, transform, crs, nodata: Optional[float], resolution: int,
+                   row_off: int = 0, col_off: int = 0, raster_width: int = None) -> CellAggregates:
+    """Aggregate the valid pixels of one band array (or a window of it) into H3 cells"""
+    rows, cols = np.nonzero(valid_pixels(data, nodata))
+    values = data[rows, cols]
+    rows = rows + row_off
+    cols = cols + col_off
+    positions = rows.astype(np.int64) * (raster_width or data.shape[1]) + cols
+    xs, ys = pixel_centers(transform, rows, cols)
+    del rows, cols
+    lngs, lats = to_wgs84(crs, xs, ys)
+    del xs, ys
+
+    in_range = (lngs >= -180) & (lngs <= 180) & (lats >= -90) & (lats <= 90)
+    if not in_range.all():
+        logger.warning(f"Skipping {int((~in_range).sum())} pixels with invalid coordinates")
+        lngs, lats = lngs[in_range], lats[in_range]
+        values, positions = values[in_range], positions[in_range]
+
+    return aggregate_by_cell(points_to_cells(lats, lngs, resolution), values, positions)
+
+
+def iter_windows(dataset, band: int = 1, max_pixels: int = DEFAULT_WINDOW_PIXELS, step: int = 1) -> Iterator[Window]:
+    """Yield windows aligned to the band's internal blocks, each at most max_pixels large.
+
+    With a step every window starts at a multiple of it, so decimated reads of
+    the windows line up on one grid.
+    """
+    block_height, block_width = dataset.block_shapes[band - 1]
+    if step > 1:
+        block_height = block_height // step * step or step
+        block_width = block_width // step * step or step
+    # Whole block rows when they fit, otherwise split rows into runs of whole blocks
+    window_width = min(dataset.width, max(block_width, (max_pixels // block_height) // block_width * block_width))
+    window_height = min(dataset.height, max(block_height, (max_pixels // window_width) // block_height * block_height))
+    for row_off in range(0, dataset.height, window_height):
+        height = min(window_height, dataset.height - row_off)
+        for col_off in range(0, dataset.width, window_width):
+            yield Window(col_off, row_off, min(window_width, dataset.width - col_off), height)
+
+
+def pixel_area_km2(dataset) -> float:
+    """Return the approximate ground area of one pixel at the raster's centre"""
+    transform = dataset.transform
+    area = abs(transform.a * transform.e - transform.b * transform.d)
+    crs = dataset.crs
+    if crs is not None and not crs.is_geographic:
+        # Projected CRS units are taken as metres
+        return area * (crs.linear_units_factor[1] if crs.linear_units_factor else 1.0) ** 2 / 1e6
+    _, bottom, _, top = raster_bounds(transform, dataset.width, dataset.height)
+    return area * KM_PER_DEGREE ** 2 * float(np.cos(np.radians((bottom + top) / 2)))
+
+
+def decimation_factor(dataset, resolution: int, band: int = 1,
+                      min_pixels_per_cell: int = DEFAULT_MIN_PIXELS_PER_CELL) -> int:
+    """Return the read step that still leaves about min_pixels_per_cell samples per H3 cell.
+
+    The factor follows the ratio of cell area to pixel area. When the file has
+    internal overviews the largest one not coarser than that factor is used,
+    so decimated reads come straight from the overview.
+    """
+    if not min_pixels_per_cell:
+        return 1
+    pixel_area = pixel_area_km2(dataset)
+    if pixel_area <= 0:
+        return 1
+    pixels_per_cell = h3.average_hexagon_area(resolution, 'km^2') / pixel_area
+    factor = int(np.sqrt(pixels_per_cell / min_pixels_per_cell))
+    factor = max(1, min(factor, dataset.width, dataset.height))
+    overviews = [level for level in dataset.overviews(band) if level <= factor]
+    if overviews:
+        return max(overviews)
+    return factor
+
+
+def read_decimated(dataset, band: int, window: Window, factor: int,
+                   resampling: Resampling = Resampling.average) -> np.ndarray:
+    """Read a window with every factor x factor block of pixels reduced to one.
+
+    Blocks are averaged by default, so cell means built from the result stay
+    close to full-resolution ones; point sampling with nearest is cheaper
+    only for overview-less files and skews means toward single pixels.
+    """
+    if factor == 1:
+        return dataset.read(band, window=window)
+    out_shape = (-(-int(window.height) // factor), -(-int(window.width) // factor))
+    return dataset.read(band, window=window, out_shape=out_shape, resampling=resampling)
+
+
+class _DecimatedTransform:
+    """Affine coefficients of a raster grid coarsened by a whole factor"""
+
+    def __init__(self, transform, factor: int):
+        self.a, self.b, self.c = transform.a * factor, transform.b * factor, transform.c
+        self.d, self.e, self.f = transform.d * factor, transform.e * factor, transform.f
+
+
+def raster_to_cells(path: str, resolution: int, band: int = 1,
+                    max_window_pixels: int = DEFAULT_WINDOW_PIXELS,
+                    min_pixels_per_cell: int = DEFAULT_MIN_PIXELS_PER_CELL,
+                    resampling: Resampling = Resampling.average) -> Tuple[CellAggregates, Dict[str, Any]]:
+    """Aggregate one band of a raster file into H3 cells.
+
+    The band is read one block-aligned window at a time and each window is
+    folded into running per-cell aggregates, so peak memory depends on
+    max_window_pixels and the number of cells, not on the raster size.
+
+    When cells are much larger than pixels the band is read decimated (from
+    an internal overview if there is a matching one), keeping about
+    min_pixels_per_cell samples per cell, each the average of its block of
+    pixels (see resampling); counts, extremes and first values then describe
+    those block averages. 0, the default, always reads every pixel.
+    Returns the aggregates and the raster's CRS, longitude/latitude bounds and
+    the decimation factor used.
+    """
+    with rasterio.open(path) as dataset:
+        factor = decimation_factor(dataset, resolution, band, min_pixels_per_cell)
+        transform = dataset.transform if factor == 1 else _DecimatedTransform(dataset.transform, factor)
+        width = -(-dataset.width // factor)
+        if factor > 1:
+            logger.info(f"Reading {path} decimated by {factor} for H3 resolution {resolution}")
+
+        aggregates = CellAggregates.empty()
+        pending, pending_size = [], 0
+        # Decimated windows cover factor^2 times more source pixels for the same memory
+        for window in iter_windows(dataset, band, max_window_pixels * factor * factor, factor):
+            data = read_decimated(dataset, band, window, factor, resampling)
+            part = aggregate_band(data, transform, dataset.crs, dataset.nodata, resolution,
+                                  int(window.row_off) // factor, int(window.col_off) // factor, width)
+            pending.append(part)
+            pending_size += len(part)
+            # Merge once the pending parts outgrow the running result, keeping merges amortized
+            if pending_size >= max(len(aggregates), 1 << 16):
+                aggregates = CellAggregates.combine([aggregates] + pending)
+                pending, pending_size = [], 0
+        aggregates = CellAggregates.combine([aggregates] + pending)
+
+        left, bottom, right, top = raster_bounds(dataset.transform, dataset.width, dataset.height)
+        if dataset.crs is not None and str(dataset.crs).upper() != WGS84:
+            lngs, lats = to_wgs84(dataset.crs, np.array([left, right]), np.array([bottom, top]))
+            left, right = float(lngs.min()), float(lngs.max())
+            bottom, top = float(lats.min()), float(lats.max())
+        info = {
+            'crs': str(dataset.crs),
+            'decimation': factor,
+            'bounds': {
+                'left': float(left),
+                'right': float(right),
+                'top': float(top),
+                'bottom': float(bottom)
+            }
+        }
+    logger.info(f"Aggregated {path} into {len(aggregates)} H3 cells at resolution {resolution}")
+    return aggregates, info
+
+
+def cell_features(cell_ids: List[str], properties: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Return H3 polygon features for parallel lists of cells and properties"""
+    return [
+        {
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Polygon',
+                'coordinates': polygon
+            },
+            'properties': {'h3_index': h3_index, **props}
+        }
+        for h3_index, props, polygon in zip(cell_ids, properties, cell_polygons(cell_ids))
+    ]
@@ -0,0 +1,43 @@
+import gzip
+import hashlib
+import json
+import logging
+from typing import Any
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; responses fall back to gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class EncodedPayload:
+    """A JSON response encoded once, with precompressed variants and their ETags"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.gzip_body = gzip.compress(body, compresslevel=6)
+        self.brotli_body = brotli.compress(body, quality=6) if brotli is not None else None
+
+    @classmethod
+    def from_object(cls, data: Any) -> 'EncodedPayload':
+        return cls(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    @property
+    def nbytes(self) -> int:
+        """Total bytes held by every encoding of this payload"""
+        return len(self.body) + len(self.gzip_body) + len(self.brotli_body or b'')
+
+    def etag_for(self, content_encoding: str = None) -> str:
+        """Return the ETag of one encoding; each compressed body is a distinct representation"""
+        return self.etag if content_encoding is None else f"{self.etag}-{content_encoding}"
+
+    def encoded(self, accept_encodings) -> tuple:
+        """Return (body, content_encoding) for the client's Accept-Encoding"""
+        if self.brotli_body is not None and 'br' in accept_encodings:
+            return self.brotli_body, 'br'
+        if 'gzip' in accept_encodings:
+            return self.gzip_body, 'gzip'
+        return self.body, None
@@ -0,0 +1,135 @@
+import math
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import h3
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+# (min_lng, min_lat, max_lng, max_lat)
+BBox = Tuple[float, float, float, float]
+
+# Average number of entries per bucket the bucket resolution is chosen for
+TARGET_BUCKET_SIZE = 32
+MAX_BUCKET_RESOLUTION = 10
+
+KM_PER_DEGREE = 111.32
+
+
+def bbox_mask(bounds: np.ndarray, bbox: BBox) -> np.ndarray:
+    """Return a mask of the rows in an (n, 4) bounds array overlapping bbox"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return (
+        (bounds[:, 0] <= max_lng) & (bounds[:, 2] >= min_lng) &
+        (bounds[:, 1] <= max_lat) & (bounds[:, 3] >= min_lat)
+    )
+
+
+def bucket_resolution(bounds: np.ndarray, target_bucket_size: int = TARGET_BUCKET_SIZE) -> int:
+    """Pick the coarse H3 resolution whose cells hold ~target_bucket_size entries each"""
+    if not len(bounds):
+        return 0
+    min_lng, min_lat = np.nanmin(bounds[:, 0]), np.nanmin(bounds[:, 1])
+    max_lng, max_lat = np.nanmax(bounds[:, 2]), np.nanmax(bounds[:, 3])
+    mid_lat = math.radians((min_lat + max_lat) / 2)
+    extent_km2 = max(
+        (max_lng - min_lng) * KM_PER_DEGREE * math.cos(mid_lat) * (max_lat - min_lat) * KM_PER_DEGREE,
+        1.0
+    )
+    bucket_km2 = extent_km2 * target_bucket_size / len(bounds)
+    resolution = 0
+    while (resolution < MAX_BUCKET_RESOLUTION and
+           h3.average_hexagon_area(resolution + 1, unit='km^2') >= bucket_km2):
+        resolution += 1
+    return resolution
+
+
+class SpatialIndex:
+    """Bounding boxes grouped by the coarse H3 parent of their centre.
+
+    Each bucket keeps the union of its entries' bounds, so a viewport query
+    tests the few bucket boxes first and only the entries of overlapping
+    buckets afterwards, instead of every entry. Polygon queries prefilter
+    on those boxes and then test the real geometries, returned for a set of
+    positions by ``geometries``; without it they match on bounds alone.
+    """
+
+    def __init__(self, bounds: np.ndarray, resolution: int = None,
+                 geometries: Callable[[np.ndarray], np.ndarray] = None):
+        self.bounds = np.asarray(bounds, dtype=np.float64)
+        self.geometries = geometries
+        valid = np.nonzero(~np.isnan(self.bounds).any(axis=1))[0]
+        self.resolution = bucket_resolution(self.bounds[valid]) if resolution is None else resolution
+
+        # Entries without geometry never match a spatial query, so they are not bucketed
+        centers = (self.bounds[valid, :2] + self.bounds[valid, 2:]) / 2
+        buckets = np.asarray([
+            h3.str_to_int(h3.latlng_to_cell(lat, lng, self.resolution))
+            for lng, lat in centers.tolist()
+        ], dtype=np.uint64)
+        self.bucket_cells, inverse = np.unique(buckets, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        order = np.argsort(inverse, kind='stable')
+        self.positions = valid[order]
+        counts = np.bincount(inverse, minlength=len(self.bucket_cells))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        if len(self.positions):
+            grouped = self.bounds[self.positions]
+            starts = self.offsets[:-1]
+            self.bucket_bounds = np.column_stack([
+                np.minimum.reduceat(grouped[:, 0], starts),
+                np.minimum.reduceat(grouped[:, 1], starts),
+                np.maximum.reduceat(grouped[:, 2], starts),
+                np.maximum.reduceat(grouped[:, 3], starts)
+            ])
+        else:
+            self.bucket_bounds = np.empty((0, 4), dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.bounds)
+
+    @property
+    def nbytes(self) -> int:
+        return (self.bounds.nbytes + self.positions.nbytes + self.offsets.nbytes +
+                self.bucket_cells.nbytes + self.bucket_bounds.nbytes)
+
+    def query_bbox(self, bbox: BBox) -> np.ndarray:
+        """Return the sorted positions of every entry overlapping bbox"""
+        buckets = np.nonzero(bbox_mask(self.bucket_bounds, bbox))[0]
+        if len(buckets) > len(self.bucket_cells) // 4:
+            # Wide viewports touch most buckets; one vectorized pass is cheaper then
+            return np.nonzero(bbox_mask(self.bounds, bbox))[0]
+        if not len(buckets):
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate([
+            self.positions[self.offsets[bucket]:self.offsets[bucket + 1]] for bucket in buckets
+        ])
+        positions = candidates[bbox_mask(self.bounds[candidates], bbox)]
+        positions.sort()
+        return positions
+
+    def query_polygon(self, geometry: Dict[str, Any]) -> np.ndarray:
+        """Return the sorted positions of every entry intersecting a GeoJSON polygon"""
+        polygon = shape(geometry)
+        candidates = self.query_bbox(polygon.bounds)
+        if not len(candidates):
+            return candidates
+        shapely.prepare(polygon)
+        boxes = shapely.box(*self.bounds[candidates].T)
+        candidates = candidates[shapely.intersects(polygon, boxes)]
+        if self.geometries is None or not len(candidates):
+            return candidates
+        # Boxes overlap the polygon wherever a cell's corner does; only its real shape decides
+        return candidates[shapely.intersects(polygon, self.geometries(candidates))]
+
+    def query(self, bbox: Optional[BBox] = None, polygon: Optional[Dict[str, Any]] = None) -> Optional[np.ndarray]:
+        """Return the positions matching bbox and polygon, or None when neither is given"""
+        positions = None
+        if polygon is not None:
+            positions = self.query_polygon(polygon)
+        if bbox is not None:
+            in_bbox = self.query_bbox(bbox)
+            positions = in_bbox if positions is None else np.intersect1d(positions, in_bbox)
+        return positions
@@ -0,0 +1,283 @@
+import logging
+import math
+import os
+import shutil
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MVT_EXTENT = 4096
+MAX_ZOOM = 22
+
+# Protobuf wire types
+WIRE_VARINT = 0
+WIRE_64BIT = 1
+WIRE_LENGTH = 2
+
+# MVT geometry commands
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+GEOM_POINT = 1
+GEOM_POLYGON = 3
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Return (min_lng, min_lat, max_lng, max_lat) of a web mercator tile"""
+    n = 2 ** z
+
+    def lat(row):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return _varint((field << 3) | wire_type)
+
+
+def _length_delimited(field: int, payload: bytes) -> bytes:
+    return _key(field, WIRE_LENGTH) + _varint(len(payload)) + payload
+
+
+def _packed(field: int, values: List[int]) -> bytes:
+    return _length_delimited(field, b''.join(_varint(v) for v in values))
+
+
+def _encode_value(value: Any) -> bytes:
+    """Encode a property value as an MVT Value message"""
+    if isinstance(value, bool):
+        return _key(7, WIRE_VARINT) + _varint(int(value))
+    if isinstance(value, int):
+        if value < 0:
+            return _key(6, WIRE_VARINT) + _varint(_zigzag(value))
+        return _key(5, WIRE_VARINT) + _varint(value)
+    if isinstance(value, float):
+        return _key(3, WIRE_64BIT) + struct.pack('<d', value)
+    return _length_delimited(1, str(value).encode('utf-8'))
+
+
+def _flatten_properties(properties: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten nested metrics into scalar tile attributes"""
+    flat = {}
+    for key, value in properties.items():
+        if key == 'metrics' and isinstance(value, dict):
+            flat.update(_flatten_properties(value))
+        elif value is None or isinstance(value, dict):
+            continue
+        elif isinstance(value, (list, tuple)):
+            flat[key] = ','.join(str(v) for v in value)
+        elif isinstance(value, float) and value != value:
+            continue
+        else:
+            flat[key] = value
+    return flat
+
+
+class TileEncoder:
+    """Encode GeoJSON point and polygon features into a single-layer Mapbox Vector Tile"""
+
+    def __init__(self, z: int, x: int, y: int, extent: int = MVT_EXTENT):
+        self.z, self.x, self.y = z, x, y
+        self.extent = extent
+        self.scale = 2 ** z
+
+    def _project(self, lng: float, lat: float) -> Tuple[int, int]:
+        """Project lng/lat to integer tile coordinates"""
+        lat = max(min(lat, 85.05112878), -85.05112878)
+        world_x = (lng + 180.0) / 360.0 * self.scale
+        sin_lat = math.sin(math.radians(lat))
+        world_y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * self.scale
+        return (
+            int(round((world_x - self.x) * self.extent)),
+            int(round((world_y - self.y) * self.extent))
+        )
+
+    def _ring_commands(self, ring: List[List[float]], cursor: List[int], exterior: bool) -> List[int]:
+        points = []
+        for lng, lat in (vertex[:2] for vertex in ring):
+            point = self._project(lng, lat)
+            if not points or point != points[-1]:
+                points.append(point)
+        if len(points) > 1 and points[0] == points[-1]:
+            points.pop()
+        if len(points) < 3:
+            return []
+
+        # Exterior rings are clockwise in tile space (positive shoelace area)
+        area = sum(
+            points[i][0] * points[(i + 1) % len(points)][1] - points[(i + 1) % len(points)][0] * points[i][1]
+            for i in range(len(points))
+        )
+        if (area > 0) != exterior:
+            points.reverse()
+
+        commands = [(CMD_MOVE_TO & 0x7) | (1 << 3)]
+        for i, (px, py) in enumerate(points):
+            if i == 1:
+                commands.append((CMD_LINE_TO & 0x7) | ((len(points) - 1) << 3))
+            commands.append(_zigzag(px - cursor[0]))
+            commands.append(_zigzag(py - cursor[1]))
+            cursor[0], cursor[1] = px, py
+        commands.append((CMD_CLOSE_PATH & 0x7) | (1 << 3))
+        return commands
+
+    def _point_commands(self, points: List[List[float]]) -> List[int]:
+        commands = [(CMD_MOVE_TO & 0x7) | (len(points) << 3)]
+        cursor = [0, 0]
+        for lng, lat in (point[:2] for point in points):
+            px, py = self._project(lng, lat)
+            commands.append(_zigzag(px - cursor[0]))
+            commands.append(_zigzag(py - cursor[1]))
+            cursor[0], cursor[1] = px, py
+        return commands
+
+    def _geometry_commands(self, geometry: Dict[str, Any]) -> Tuple[int, List[int]]:
+        """Return the MVT geometry type and command stream for a GeoJSON geometry"""
+        if geometry.get('type') == 'Point':
+            return GEOM_POINT, self._point_commands([geometry['coordinates']])
+        if geometry.get('type') == 'MultiPoint' and geometry['coordinates']:
+            return GEOM_POINT, self._point_commands(geometry['coordinates'])
+        if geometry.get('type') == 'Polygon':
+            polygons = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiPolygon':
+            polygons = geometry['coordinates']
+        else:
+            return GEOM_POLYGON, []
+
+        cursor = [0, 0]
+        commands = []
+        for polygon in polygons:
+            for ring_number, ring in enumerate(polygon):
+                commands.extend(self._ring_commands(ring, cursor, exterior=ring_number == 0))
+        return GEOM_POLYGON, commands
+
+    def encode(self, layer_name: str, features: List[Dict[str, Any]]) -> bytes:
+        """Return the encoded tile bytes for one layer of features"""
+        keys: Dict[str, int] = {}
+        values: Dict[Tuple[type, Any], int] = {}
+        encoded_features = []
+
+        for feature_id, feature in enumerate(features, start=1):
+            geom_type, commands = self._geometry_commands(feature.get('geometry') or {})
+            if not commands:
+                continue
+
+            tags = []
+            for key, value in _flatten_properties(feature.get('properties') or {}).items():
+                if key not in keys:
+                    keys[key] = len(keys)
+                value_key = (type(value), value)
+                if value_key not in values:
+                    values[value_key] = len(values)
+                tags.extend((keys[key], values[value_key]))
+
+            encoded_features.append(_length_delimited(2, b''.join([
+                _key(1, WIRE_VARINT) + _varint(feature_id),
+                _packed(2, tags),
+                _key(3, WIRE_VARINT) + _varint(geom_type),
+                _packed(4, commands)
+            ])))
+
+        layer = b''.join([
+            _key(15, WIRE_VARINT) + _varint(2),
+            _length_delimited(1, layer_name.encode('utf-8')),
+            *encoded_features,
+            *(_length_delimited(3, key.encode('utf-8')) for key in keys),
+            *(_length_delimited(4, _encode_value(value)) for _, value in values),
+            _key(5, WIRE_VARINT) + _varint(self.extent)
+        ])
+        return _length_delimited(3, layer)
+
+
+class TileService:
+    """Serve H3 dataset layers as disk-cached Mapbox Vector Tiles.
+
+    Tiles hold a single year: stacking every year's polygons in one tile
+    would draw them on top of each other, so requests without a year get the
+    dataset's latest one. Cached tiles live under a directory per dataset
+    version, and the directories of older versions are removed the first
+    time a newer version is served.
+    """
+
+    def __init__(self, dataset_service, cache_dir: str = 'data/.tile_cache'):
+        self.dataset_service = dataset_service
+        self.cache_dir = Path(cache_dir)
+        self._current_versions: Dict[str, str] = {}
+
+    def _cache_path(self, dataset_id: str, version: str, z: int, x: int, y: int,
+                    year: Optional[int]) -> Path:
+        name = f"{y}.pbf" if year is None else f"{y}-{year}.pbf"
+        return self.cache_dir / dataset_id / version / str(z) / str(x) / name
+
+    def _prune_versions(self, dataset_id: str, version: str) -> None:
+        """Remove cached tiles of every other version of a dataset"""
+        if self._current_versions.get(dataset_id) == version:
+            return
+        dataset_dir = self.cache_dir / dataset_id
+        if dataset_dir.is_dir():
+            for version_dir in dataset_dir.iterdir():
+                if version_dir.name != version:
+                    shutil.rmtree(version_dir, ignore_errors=True)
+                    logger.info(f"Removed stale tile cache {version_dir}")
+        self._current_versions[dataset_id] = version
+
+    def default_year(self, dataset_id: str) -> Optional[int]:
+        """Return the latest year of a dataset, or None for layers without years"""
+        index = self.dataset_service.get_dataset_index(dataset_id)
+        years = index.years if index is not None else []
+        return max(years) if years else None
+
+    def get_tile(self, dataset_id: str, z: int, x: int, y: int, year: int = None) -> Optional[bytes]:
+        """Return the encoded tile, or None if the dataset does not exist"""
+        if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            raise ValueError(f"Invalid tile coordinates: {z}/{x}/{y}")
+
+        version = self.dataset_service.dataset_version(dataset_id)
+        if version is None:
+            return None
+        self._prune_versions(dataset_id, version)
+        if year is None:
+            year = self.default_year(dataset_id)
+
+        cache_path = self._cache_path(dataset_id, version, z, x, y, year)
+        if cache_path.exists():
+            return cache_path.read_bytes()
+
+        data = self.dataset_service.load_dataset_slice(
+            dataset_id, year=year, bbox=tile_bounds(z, x, y), zoom=z
+        )
+        if 'error' in data:
+            return None
+
+        tile = TileEncoder(z, x, y).encode(dataset_id, data.get('features', []))
+
+        # Write to a temporary file first so readers never see a partial tile
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(tile)
+            os.replace(tmp_path, cache_path)
+            logger.debug(f"Cached tile {dataset_id}/{z}/{x}/{y} ({len(tile)} bytes)")
+        except OSError as e:
+            # Another process may have pruned this version meanwhile; the tile is still good
+            logger.warning(f"Could not cache tile {dataset_id}/{z}/{x}/{y}: {e}")
+        return tile
@@ -3,6 +3,32 @@ let map;
 let popup;
 window.dataRequested = false;
 
+// Year shown on the timeline; dataset requests only ask the server for this year
+window.selectedYear = 2015;
+
+// Query parameters limiting a dataset request to the selected year and, when
+// useViewport is set, to the visible part of the map. The whole zoom level
+// lets the server pick the H3 resolution that suits the view.
+function mapSliceParams(useViewport = true) {
+    const params = new URLSearchParams({ year: window.selectedYear });
+    if (map) {
+        params.set('zoom', Math.floor(map.getZoom()));
+    }
+    if (useViewport && map) {
+        const bounds = map.getBounds();
+        const west = Math.max(bounds.getWest(), -180);
+        const east = Math.min(bounds.getEast(), 180);
+        const south = Math.max(bounds.getSouth(), -90);
+        const north = Math.min(bounds.getNorth(), 90);
+        // A view across the antimeridian has no single bbox, so load everything
+        if (west < east && south < north) {
+            params.set('bbox', [west, south, east, north].map(value => value.toFixed(4)).join(','));
+        }
+    }
+    return params;
+}
+window.mapSliceParams = mapSliceParams;
+
 // Initialize the map when the page loads
 document.addEventListener('DOMContentLoaded', () => {
     // Get mapbox token from meta tag
@@ -59,6 +85,9 @@ document.addEventListener('DOMContentLoaded', () => {
             
             // Load initial data
             loadInitialData();
+
+            // Server data only covers the viewport, so fetch the newly visible area
+            map.on('moveend', () => window.refreshMapData());
             
             // Dispatch initialization event
             window.dispatchEvent(new Event('mapInitialized'));
@@ -268,7 +297,7 @@ function getMetricMaxValue(metric) {
     return maxValues[metric] || 1.0;
 }
 
-function updateLegend(metricId, minValue, maxValue) {
+function updateLegend(metricId, minValue, maxValue, legend = null) {
     const legendTitle = document.getElementById('legend-title');
     const legendGradient = document.getElementById('legend-gradient-bar');
     const legendMin = document.getElementById('legend-min');
@@ -285,14 +314,19 @@ function updateLegend(metricId, minValue, maxValue) {
         .map(word => word.charAt(0).toUpperCase() + word.slice(1))
         .join(' ');
 
-    // Update title
-    legendTitle.textContent = formattedName;
+    // Update title, saying when one scale spans several datasets
+    const datasetCount = legend?.dataset_ids?.length || 0;
+    legendTitle.textContent = datasetCount > 1
+        ? `${formattedName} (scale across ${datasetCount} datasets)`
+        : formattedName;
 
     // Get color scale
     const [startColor, endColor] = getMetricColorScale(metricId);
     
-    // Update gradient
-    legendGradient.style.background = `linear-gradient(to right, ${startColor}, ${endColor})`;
+    // Update gradient, stepping through the legend's classes when there is one
+    legendGradient.style.background = legend?.colors?.length
+        ? `linear-gradient(to right, ${legend.colors.join(', ')})`
+        : `linear-gradient(to right, ${startColor}, ${endColor})`;
 
     // Format values
     const formatValue = (val) => {
@@ -326,6 +360,7 @@ window.handleMapUpdate = async function(geojsonData) {
 
         // Store the full dataset
         window.currentData = geojsonData;
+        serverDataLoaded = false;
 
         // Update the source data
         const source = map.getSource('h3-hexagons');
@@ -505,6 +540,39 @@ async function loadMultipleDatasets(datasets) {
     }
 }
 
+// Whether the displayed data came from the dataset API, and so can be re-requested
+// for another year or area, and the metric it is colored by
+let serverDataLoaded = false;
+let currentMetricId = null;
+let mapDataRequest = 0;
+
+// Re-request the server datasets for the selected year and the visible area,
+// ignoring responses overtaken by a newer request
+window.refreshMapData = async function() {
+    if (!serverDataLoaded) {
+        return false;
+    }
+    const request = ++mapDataRequest;
+    try {
+        const response = await fetch(`/api/datasets/map?${mapSliceParams()}`);
+        if (!response.ok) {
+            throw new Error(`Failed to load datasets: ${response.status}`);
+        }
+        const data = await response.json();
+        if (request !== mapDataRequest || data.status !== 'success' || !data.datasets) {
+            return false;
+        }
+        await loadMultipleDatasets(data.datasets);
+        if (currentMetricId) {
+            await updateMapMetric(currentMetricId);
+        }
+        return true;
+    } catch (error) {
+        console.error('Error refreshing map data:', error);
+        return false;
+    }
+};
+
 // Update the loadMapData function
 window.loadMapData = async function(shouldZoom = true) {
     try {
@@ -521,7 +589,9 @@ window.loadMapData = async function(shouldZoom = true) {
             });
         }
 
-        const response = await fetch('/api/datasets/map');
+        // Zooming to the data needs all of it; otherwise only the visible area is fetched
+        mapDataRequest++;
+        const response = await fetch(`/api/datasets/map?${mapSliceParams(!shouldZoom)}`);
         if (!response.ok) {
             throw new Error(`Failed to load datasets: ${response.status}`);
         }
@@ -530,6 +600,10 @@ window.loadMapData = async function(shouldZoom = true) {
         
         if (data.status === 'success' && data.datasets) {
             await loadMultipleDatasets(data.datasets);
+            serverDataLoaded = true;
+            if (currentMetricId) {
+                await updateMapMetric(currentMetricId);
+            }
             console.log('Map data loaded successfully');
             return true;
         } else {
@@ -542,29 +616,56 @@ window.loadMapData = async function(shouldZoom = true) {
     }
 };
 
+// Legends (class breaks and colors) are computed by the server per metric, year
+// and zoom. The map shows every dataset carrying a metric at once, so the legend
+// is the cross-dataset one from /api/legend: one scale shared by all of them.
+const metricLegends = new Map();
+
+function fetchMetricLegend(metricId, year) {
+    const zoom = map ? Math.floor(map.getZoom()) : 0;
+    const key = `${metricId}:${year}:${zoom}`;
+    if (!metricLegends.has(key)) {
+        const params = new URLSearchParams({ metric: metricId, year: year, zoom: zoom, scheme: 'natural_breaks' });
+        metricLegends.set(key, fetch(`/api/legend?${params}`)
+            .then(response => response.ok ? response.json() : null)
+            .then(legend => (legend?.count ? legend : null))
+            .catch(() => null));
+    }
+    return metricLegends.get(key);
+}
+
+function getLegendColor(legend, value) {
+    let index = 0;
+    while (index < legend.breaks.length && value >= legend.breaks[index]) {
+        index++;
+    }
+    return legend.colors[index];
+}
+
 // Update the updateMapMetric function
-function updateMapMetric(metricId) {
+async function updateMapMetric(metricId) {
     if (!window.currentData?.features) {
         console.error('No data available to update metrics');
         return;
     }
 
     // Get current year from timeline
-    const currentYear = parseInt(document.querySelector('.timeline-year')?.textContent) || 2015;
+    const currentYear = window.selectedYear;
+    currentMetricId = metricId;
 
-    // Set fixed maximum values for death-related metrics
-    const fixedMaxValues = {
-        'deaths_total': 300,
-        'deaths_civilians': 300,
-        'deaths_military': 300
-    };
+    // Use the server legend for server datasets; other data falls back to its own range
+    const legend = serverDataLoaded ? await fetchMetricLegend(metricId, currentYear) : null;
+
+    // A newer call for another metric or year may have finished first; keep its result
+    if (metricId !== currentMetricId || currentYear !== window.selectedYear) {
+        return;
+    }
 
     // Calculate min/max values
-    let minValue = 0;  // Start from 0 for deaths
-    let maxValue = fixedMaxValues[metricId] || -Infinity;
+    let minValue = legend?.min ?? 0;
+    let maxValue = legend?.max ?? -Infinity;
 
-    // If not a death-related metric, calculate max value dynamically
-    if (!fixedMaxValues[metricId]) {
+    if (!legend) {
         window.currentData.features.forEach(feature => {
             const featureYear = parseInt(feature.properties.year);
             if (featureYear === currentYear) {
@@ -602,12 +703,16 @@ function updateMapMetric(metricId) {
         
         if (metrics && metrics[metricId] !== undefined) {
             const value = parseFloat(metrics[metricId]);
-            const normalizedValue = (maxValue === minValue) 
-                ? 0.5 
-                : Math.min(1, (value - minValue) / (maxValue - minValue));  // Clamp to 1
-            
-            const [startColor, endColor] = getMetricColorScale(metricId);
-            const color = interpolateColor(startColor, endColor, normalizedValue);
+            let color;
+            if (legend) {
+                color = getLegendColor(legend, value);
+            } else {
+                const normalizedValue = (maxValue === minValue) 
+                    ? 0.5 
+                    : Math.min(1, (value - minValue) / (maxValue - minValue));  // Clamp to 1
+                const [startColor, endColor] = getMetricColorScale(metricId);
+                color = interpolateColor(startColor, endColor, normalizedValue);
+            }
 
             return {
                 ...feature,
@@ -647,7 +752,7 @@ function updateMapMetric(metricId) {
     }
 
     // Update legend with actual min/max values
-    updateLegend(metricId, minValue, maxValue);
+    updateLegend(metricId, minValue, maxValue, legend);
 }// Add helper function for color interpolation
 function interpolateColor(startColor, endColor, value) {
     // Ensure value is between 0 and 1
@@ -735,8 +840,10 @@ function rgbToHex(r, g, b) {
 // Add function to load initial data
 async function loadInitialData() {
     try {
-        // Get all available datasets from the API
-        const response = await fetch('/api/datasets/map');
+        // Only the metadata is kept, so skip geometry and every other year
+        const params = mapSliceParams(false);
+        params.set('geometry', 'none');
+        const response = await fetch(`/api/datasets/map?${params}`);
         if (!response.ok) {
             throw new Error(`Failed to load datasets: ${response.status}`);
         }
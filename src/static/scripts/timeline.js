@@ -40,13 +40,20 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 
     function filterAndDisplayYear(year) {
+        // Convert year to number for strict comparison
+        const targetYear = parseInt(year);
+        window.selectedYear = targetYear;
+
         if (!currentData?.features) {
-            console.error('No data available to filter');
+            // Datasets loaded from the server are re-requested for the year instead
+            if (!window.refreshMapData) {
+                console.error('No data available to filter');
+            } else {
+                window.refreshMapData();
+            }
             return;
         }
 
-        // Convert year to number for strict comparison
-        const targetYear = parseInt(year);
         console.log(`Filtering for year: ${targetYear}`);
 
         // Filter features for the selected year